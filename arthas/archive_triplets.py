@@ -0,0 +1,48 @@
+import logging
+import shutil
+from pathlib import Path
+
+import click
+import cv2
+
+import arthas.config
+from arthas.utils.triplets_archive import encode_triplet, EXTENSION
+
+logger = logging.getLogger("Triplets archiving")
+
+
+@click.command()
+@click.argument('triplets_dir', type=Path, default=Path("donates_triplets"))
+@click.option('--remove', is_flag=True, help='Remove original PNG triplets after conversion')
+def main(triplets_dir: Path, remove: bool) -> None:
+    # Converts old donates_triplets/<donate_id>/<donate_id>_{0,1,2}.png directories to <donate_id>.trp archives
+    logging.basicConfig(level=logging.INFO, format=arthas.config.logger_format)
+
+    converted = 0
+    original_size = 0
+    archived_size = 0
+    for triplet_dir in sorted(path for path in triplets_dir.iterdir() if path.is_dir()):
+        donate_id = triplet_dir.name
+        images_paths = [triplet_dir / "{}_{}.png".format(donate_id, i) for i in range(3)]
+        if not all(path.exists() for path in images_paths):
+            logger.warning("Incomplete triplet: {}".format(triplet_dir))
+            continue
+
+        frames = [cv2.imread(str(path)) for path in images_paths]
+        encoded = encode_triplet(frames, {"donate_id": donate_id})
+        archive_path = triplets_dir / (donate_id + EXTENSION)
+        with open(archive_path, "wb") as f:
+            f.write(encoded)
+
+        converted += 1
+        original_size += sum(path.stat().st_size for path in images_paths)
+        archived_size += len(encoded)
+        if remove:
+            shutil.rmtree(triplet_dir)
+
+    logger.info("{} triplets converted: {:.1f} MB -> {:.1f} MB".format(
+        converted, original_size / 2**20, archived_size / 2**20))
+
+
+if __name__ == '__main__':
+    main()
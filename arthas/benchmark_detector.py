@@ -0,0 +1,186 @@
+import json
+import time
+import logging
+import platform
+import subprocess
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import click
+import cv2
+import numpy as np
+
+import arthas.config
+from arthas.utils.donates_detector import extract_donate_robust, extract_donates_batch
+from arthas.utils.triplets_archive import TripletsArchive
+from arthas.utils.donates_detector_utils import (  # type: ignore
+    estimate_is_appeared, estimate_is_gone, detect_letters, letter_graph_by_x, letter_graph_by_y, header_hue,
+    header_sat, header_val, donate_roi_to_y, donate_letters_radius
+)
+
+logger = logging.getLogger("Detector benchmark")
+
+
+Triplet = tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def load_triplet(dirpath: Path) -> Triplet:
+    images = sorted(dirpath.iterdir())
+    assert len(images) == 3, "Expected triplet of frames in {}".format(dirpath)
+    img0, img1, img2 = [cv2.imread(str(image_path)) for image_path in images]
+    return img0, img1, img2
+
+
+def triplet_variants(triplet: Triplet, seed: int = 239) -> dict[str, Triplet]:
+    rng = np.random.default_rng(seed)
+    prev, cur, next = triplet
+
+    def noisy(img: np.ndarray) -> np.ndarray:
+        noisy_img: np.ndarray = np.clip(img.astype(np.int16) + rng.integers(-8, 9, img.shape), 0, 255).astype(np.uint8)
+        return noisy_img
+
+    return {
+        "sample": triplet,
+        # worst case for the motion masks - everything changes
+        "noisy": (noisy(prev), noisy(cur), noisy(next)),
+        # typical case - static picture without a donate
+        "static": (cur, cur.copy(), cur.copy()),
+    }
+
+
+def resize_triplet(triplet: Triplet, size: str) -> Triplet:
+    if size == "1080p":
+        return triplet
+    elif size == "720p":
+        img0, img1, img2 = [cv2.resize(img, (1280, 720), interpolation=cv2.INTER_AREA) for img in triplet]
+        return img0, img1, img2
+    elif size == "roi":
+        img0, img1, img2 = [np.ascontiguousarray(img[:donate_roi_to_y]) for img in triplet]
+        return img0, img1, img2
+    else:
+        raise ValueError("Unknown size: {}".format(size))
+
+
+def measure(func: Callable[[], Any], repeats: int) -> dict[str, float]:
+    func()  # warm up
+    timings = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start_time)
+    return {
+        "min_ms": 1000 * float(np.min(timings)),
+        "median_ms": 1000 * float(np.median(timings)),
+        "mean_ms": 1000 * float(np.mean(timings)),
+        "max_ms": 1000 * float(np.max(timings)),
+    }
+
+
+def benchmark_triplet(triplet: Triplet, repeats: int) -> dict[str, dict[str, float]]:
+    prev, cur, next = triplet
+    height, width = cur.shape[:2]
+
+    is_appeared = estimate_is_appeared(prev, cur)
+    is_gone = estimate_is_gone(cur, next)
+    img = cur.copy()
+    img[~is_appeared] = 0
+    img[is_gone] = 0
+    img = img[:donate_roi_to_y]
+
+    blobs = detect_letters(img, header_hue, header_sat, header_val, donate_letters_radius)
+
+    batch = [prev, cur, next] * 4
+
+    return {
+        "estimate_is_appeared": measure(lambda: estimate_is_appeared(prev, cur), repeats),
+        "estimate_is_gone": measure(lambda: estimate_is_gone(cur, next), repeats),
+        "detect_letters": measure(
+            lambda: detect_letters(img, header_hue, header_sat, header_val, donate_letters_radius), repeats),
+        "letter_graph_by_y": measure(lambda: letter_graph_by_y(blobs, width, height), repeats),
+        "letter_graph_by_x": measure(lambda: letter_graph_by_x(blobs, width, height), repeats),
+        "extract_donate_robust": measure(lambda: extract_donate_robust(prev, cur, next), repeats),
+        # per center frame, to be comparable with extract_donate_robust
+        "extract_donates_batch": {
+            key: value / (len(batch) - 2)
+            for key, value in measure(lambda: extract_donates_batch(batch), repeats).items()
+        },
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option('-d', '--data-dir', default=Path("data/sample001"), type=Path, help='Directory with a triplet of frames')
+@click.option('-o', '--output-path', default=None, type=Path, help='Where to save JSON results')
+@click.option('-n', '--repeats', default=20)
+@click.option('-s', '--sizes', default="1080p,720p,roi")
+@click.option('-b', '--baseline-path', default=None, type=Path, help='Previous JSON results to compare with')
+@click.option('-a', '--archive-dir', default=None, type=Path, help='Also benchmark on archived detection triplets')
+@click.option('--archive-limit', default=100, help='How many archived triplets to use')
+def main(data_dir: Path, output_path: Optional[Path], repeats: int, sizes: str, baseline_path: Optional[Path],
+         archive_dir: Optional[Path], archive_limit: int) -> None:
+    logging.basicConfig(level=logging.INFO, format=arthas.config.logger_format)
+    logging.getLogger("Donates detector").setLevel(logging.WARNING)
+
+    commit = git_commit()
+    results: dict[str, Any] = {
+        "commit": commit,
+        "timestamp": int(time.time()),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "repeats": repeats,
+        "results": {},
+    }
+
+    baseline: dict[str, Any] = {}
+    if baseline_path is not None:
+        with open(baseline_path) as f:
+            baseline = json.load(f)["results"]
+
+    base_triplet = load_triplet(data_dir)
+    for variant, triplet in triplet_variants(base_triplet).items():
+        for size in sizes.split(","):
+            key = "{}/{}".format(variant, size)
+            logger.info("Benchmarking {}...".format(key))
+            stages = benchmark_triplet(resize_triplet(triplet, size), repeats)
+            results["results"][key] = stages
+            for stage, timings in stages.items():
+                line = "{:16} {:24} median={:8.2f} ms  min={:8.2f} ms".format(
+                    key, stage, timings["median_ms"], timings["min_ms"])
+                if stage in baseline.get(key, {}):
+                    line += "  x{:.2f} vs baseline".format(baseline[key][stage]["median_ms"] / timings["median_ms"])
+                print(line)
+
+    if archive_dir is not None:
+        archive = TripletsArchive(archive_dir)
+        triplets_number = min(archive_limit, len(archive))
+        logger.info("Benchmarking {} archived triplets...".format(triplets_number))
+        elapsed = 0.0
+        for i in range(triplets_number):
+            archived = archive[i]
+            frames = archived.frames()
+            start_time = time.perf_counter()
+            extract_donate_robust(*frames)
+            elapsed += time.perf_counter() - start_time
+            archived.close()
+        ms_per_triplet = 1000 * elapsed / max(1, triplets_number)
+        results["archive"] = {"triplets_number": triplets_number, "extract_donate_robust_ms": ms_per_triplet}
+        print("{:16} {:24} mean={:8.2f} ms".format("archive/roi", "extract_donate_robust", ms_per_triplet))
+
+    if output_path is None:
+        output_path = Path("benchmarks") / "{}_{}.json".format(results["timestamp"], (commit or "unknown")[:10])
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info("Results saved to {}".format(output_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Any
+
+import click
+
+import arthas.config
+from arthas.utils.twitch_irc_monitor import IRCTwitchMonitor, ChatMessage
+
+logger = logging.getLogger("IRC benchmark")
+
+
+CHANNEL = "arthas"
+NICKNAME = "justinfan239"
+WORDS = [
+    "Kappa", "PogChamp", "папич", "гений", "LUL", "донат",
+    "raid", "!!!", "😂", "ауф", "EZ", "Clap",
+]
+
+
+def synthetic_lines(lines_number: int, seed: int = 239) -> list[bytes]:
+    # Chat during a raid: mostly tagged PRIVMSGs of many users, some notices and a PING now and then
+    rng = random.Random(seed)
+    users = ["viewer{}".format(i) for i in range(1000)]
+    lines = []
+    for i in range(lines_number):
+        if i % 5000 == 4999:
+            lines.append(b"PING :tmi.twitch.tv")
+            continue
+        user = rng.choice(users)
+        if i % 100 == 99:
+            lines.append("@msg-id=raid;msg-param-viewerCount=1000 :tmi.twitch.tv USERNOTICE #{}".format(CHANNEL)
+                         .encode("utf-8"))
+            continue
+        tags = "badges=subscriber/12;color=#FF4500;display-name={};emotes=;id={};tmi-sent-ts={};user-id={}".format(
+            user.capitalize(), i, 1650000000000 + i, users.index(user))
+        message = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+        lines.append("@{} :{}!{}@{}.tmi.twitch.tv PRIVMSG #{} :{}".format(tags, user, user, user, CHANNEL, message)
+                     .encode("utf-8"))
+    return lines
+
+
+class FakeIRCServer:
+    # Answers the login like Twitch and then sends the payload as fast as the client reads it
+    def __init__(self, payload: list[bytes], repeats: int, chunk_lines: int = 1000):
+        self.chunks = [b"".join(line + b"\r\n" for line in payload[i:i + chunk_lines])
+                       for i in range(0, len(payload), chunk_lines)]
+        self.repeats = repeats
+        self.pongs = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while not (await reader.readline()).startswith(b"JOIN"):
+            pass
+        welcome = (":tmi.twitch.tv 001 {0} :Welcome, GLHF!\r\n"
+                   ":{0}.tmi.twitch.tv 366 {0} #{1} :End of /NAMES list\r\n").format(NICKNAME, CHANNEL)
+        writer.write(welcome.encode("utf-8"))
+        pongs_task = asyncio.create_task(self.count_pongs(reader))
+
+        for _ in range(self.repeats):
+            for chunk in self.chunks:
+                writer.write(chunk)
+                await writer.drain()
+        # the client reads everything sent and closes the connection, then PONGs are counted
+        writer.write_eof()
+        await asyncio.gather(pongs_task, return_exceptions=True)
+        writer.close()
+
+    async def count_pongs(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b"PONG"):
+                self.pongs += 1
+
+
+async def benchmark(payload: list[bytes], repeats: int, parse_tags: bool) -> dict[str, Any]:
+    server = FakeIRCServer(payload, repeats)
+    tcp_server = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = tcp_server.sockets[0].getsockname()[1]
+
+    monitor = IRCTwitchMonitor(NICKNAME, "oauth:benchmark", CHANNEL, "127.0.0.1", port, use_event_loop=True,
+                               request_tags=True)
+    received_tags = 0
+
+    def on_chat_message(chat_message: ChatMessage) -> None:
+        nonlocal received_tags
+        if parse_tags:
+            received_tags += len(chat_message.tags)
+
+    monitor.add_chat_message_callback(on_chat_message)
+
+    start_time = time.perf_counter()
+    start_cpu_time = time.process_time()
+    try:
+        await monitor.serve_connection()
+    except (EOFError, ConnectionError):
+        # the server closes the connection after the payload
+        pass
+    elapsed = time.perf_counter() - start_time
+    cpu_time = time.process_time() - start_cpu_time
+
+    tcp_server.close()
+    await tcp_server.wait_closed()
+    # the server handler may still be counting the last PONGs
+    await asyncio.sleep(0.1)
+
+    stats = monitor.stats
+    return {
+        "lines": stats.lines,
+        "messages": stats.messages,
+        "unexpected": stats.unexpected,
+        "pings": stats.pings,
+        "pongs": server.pongs,
+        "tags": received_tags,
+        "megabytes": round(stats.bytes / 1e6, 1),
+        "elapsed": round(elapsed, 3),
+        # client and server share the process, so this is an upper bound for the client
+        "cpu_time": round(cpu_time, 3),
+        "lines_per_second": round(stats.lines / elapsed),
+        "megabytes_per_second": round(stats.bytes / 1e6 / elapsed, 1),
+    }
+
+
+@click.command()
+@click.option('-n', '--lines-number', default=2_000_000, help='How many lines the fake server sends')
+@click.option('--unique-lines', default=100_000, help='How many distinct synthetic lines are repeated')
+@click.option('--parse-tags/--no-parse-tags', default=False, help='Also parse IRCv3 tags of every message')
+def main(lines_number: int, unique_lines: int, parse_tags: bool) -> None:
+    logging.basicConfig(level=logging.INFO, format=arthas.config.logger_format)
+    logging.getLogger("IRC monitor").setLevel(logging.ERROR)
+
+    unique_lines = min(unique_lines, lines_number)
+    payload = synthetic_lines(unique_lines)
+    repeats = max(1, lines_number // unique_lines)
+    logger.info("Sending {} lines from the fake server...".format(unique_lines * repeats))
+
+    results = asyncio.run(benchmark(payload, repeats, parse_tags))
+    for key, value in results.items():
+        print("{:24} {}".format(key, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,8 +2,31 @@ google_api_key = '*'
 
 telegram_chat_channel = "arthas_twitch"
 telegram_token = "*"
+# the bot only posts to the channel, polling for incoming updates is not needed
+telegram_polling = False
 
 # youtube_channel_id = 'UCbt5BCs0aUDgNwRaUnKtXwA'    # main
 youtube_channel_id = 'UCUyodDg_PnLj885rCgbVN0A'  # casino
+# one bot can watch several channels at once, e.g. both the main and the casino ones
+youtube_channel_ids = [youtube_channel_id]
+# polling of the stream state is spread to spend at most this number of YouTube API units per day
+youtube_daily_quota_units = 10000
+
+# codec of saved screenshots, donates and debug triplets: png, jpg or webp
+artefacts_codec = "png"
+artefacts_level = 3  # compression 0-9 for png, quality 0-100 for jpg and 1-100 for webp
+artefacts_queue_size = 32
+# codec of screenshots and donates posted to telegram (they are also saved to disk as is)
+photo_codec = "jpg"
+photo_level = 95
+
+# clips are kept in one SQLite database, the old state/clips JSON tree is imported on the first start
+state_store_path = "state/state.sqlite3"
+clips_cache_size = 256  # clips are loaded on demand, at most this number of them is kept in memory
+# streamer state changes are appended to one journal with group commit instead of a rewritten file each,
+# the changes of the last second may be lost on a crash
+storage_journal = False
+# detection threads shared by all watched streams
+detection_workers = 2
 
 logger_format = "%(asctime)-15s [%(levelname)5s]: %(message)s"
@@ -0,0 +1,72 @@
+import time
+import logging
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import click
+import cv2
+import numpy as np
+
+import arthas.config
+from arthas.utils.donates_detector import XYRange, detect_donate_robust, detect_donates_stacked
+from arthas.utils.synthetic_donates import SyntheticTriplet, EvaluationResult, generate_triplets, save_triplets, \
+    load_triplets
+
+logger = logging.getLogger("Detector evaluation")
+
+
+Detector = Callable[[tuple[np.ndarray, np.ndarray, np.ndarray]], Optional[XYRange]]
+
+detector_modes: dict[str, Detector] = {
+    "robust": lambda frames: detect_donate_robust(*frames),
+    "batch": lambda frames: detect_donates_stacked(np.stack(frames))[0],
+}
+
+
+def evaluate(detector: Detector, triplets: Iterable[SyntheticTriplet]) -> EvaluationResult:
+    result = EvaluationResult()
+    for triplet in triplets:
+        start_time = time.perf_counter()
+        detected = detector(triplet.frames)
+        result.elapsed += time.perf_counter() - start_time
+        result.add(triplet, detected)
+    return result
+
+
+@click.command()
+@click.option('-b', '--backgrounds-dir', default=None, type=Path, help='Directory with background frames')
+@click.option('-n', '--count', default=1000, help='Number of triplets to generate')
+@click.option('--seed', default=239)
+@click.option('-m', '--modes', default=",".join(detector_modes.keys()))
+@click.option('-s', '--save-dir', default=None, type=Path, help='Save generated labelled triplets here')
+@click.option('-l', '--load-dir', default=None, type=Path, help='Evaluate on previously saved triplets')
+def main(backgrounds_dir: Optional[Path], count: int, seed: int, modes: str,
+         save_dir: Optional[Path], load_dir: Optional[Path]) -> None:
+    logging.basicConfig(level=logging.INFO, format=arthas.config.logger_format)
+    logging.getLogger("Donates detector").setLevel(logging.WARNING)
+
+    if load_dir is not None:
+        triplets = list(load_triplets(load_dir))
+    else:
+        if backgrounds_dir is not None:
+            backgrounds = [cv2.imread(str(path)) for path in sorted(backgrounds_dir.iterdir())]
+            backgrounds = [img for img in backgrounds if img is not None]
+        else:
+            backgrounds = [cv2.imread("data/sample001/frame0.jpg")]
+        logger.info("Generating {} triplets on {} backgrounds...".format(count, len(backgrounds)))
+        triplets = list(generate_triplets(backgrounds, count, seed))
+
+        if save_dir is not None:
+            logger.info("Saving triplets to {}...".format(save_dir))
+            save_triplets(iter(triplets), save_dir)
+
+    logger.info("{} triplets, {} positive".format(len(triplets), sum(triplet.is_positive for triplet in triplets)))
+    for mode in modes.split(","):
+        result = evaluate(detector_modes[mode], triplets)
+        print("{:8} precision={:.3f} recall={:.3f} fps={:.1f} (tp={} fp={} fn={} tn={})".format(
+            mode, result.precision, result.recall, result.fps,
+            result.true_positives, result.false_positives, result.false_negatives, result.true_negatives))
+
+
+if __name__ == '__main__':
+    main()
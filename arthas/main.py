@@ -24,15 +24,40 @@ def main(config_path: Path) -> None:
     logging.getLogger("telegram").setLevel(logging.WARNING)
 
     google_api_key = config.get('google_api_key', arthas.config.google_api_key)
-    youtube_channel_id = config.get('youtube_channel_id', arthas.config.youtube_channel_id)
+    youtube_channel_id = config.get('youtube_channel_id', None)
+    youtube_channel_ids = config.get('youtube_channel_ids', arthas.config.youtube_channel_ids)
+    if youtube_channel_id is not None:
+        youtube_channel_ids = [youtube_channel_id]
+    youtube_daily_quota_units = config.get('youtube_daily_quota_units', arthas.config.youtube_daily_quota_units)
     telegram_token = config.get('telegram_token', arthas.config.telegram_token)
     telegram_chat_channel = config.get('telegram_chat_channel', arthas.config.telegram_chat_channel)
+    telegram_polling = config.get('telegram_polling', arthas.config.telegram_polling)
+    artefacts_codec = config.get('artefacts_codec', arthas.config.artefacts_codec)
+    artefacts_level = config.get('artefacts_level', arthas.config.artefacts_level)
+    artefacts_queue_size = config.get('artefacts_queue_size', arthas.config.artefacts_queue_size)
+    photo_codec = config.get('photo_codec', arthas.config.photo_codec)
+    photo_level = config.get('photo_level', arthas.config.photo_level)
+    state_store_path = config.get('state_store_path', arthas.config.state_store_path)
+    clips_cache_size = config.get('clips_cache_size', arthas.config.clips_cache_size)
+    storage_journal = config.get('storage_journal', arthas.config.storage_journal)
+    detection_workers = config.get('detection_workers', arthas.config.detection_workers)
 
     arthas_bot = ArthasBot(
         google_api_key=google_api_key,
-        channel_name=youtube_channel_id,
+        channel_names=youtube_channel_ids,
+        youtube_daily_quota_units=youtube_daily_quota_units,
         telegram_token=telegram_token,
         telegram_channel=telegram_chat_channel,
+        artefacts_codec=artefacts_codec,
+        artefacts_level=artefacts_level,
+        artefacts_queue_size=artefacts_queue_size,
+        photo_codec=photo_codec,
+        photo_level=photo_level,
+        telegram_polling=telegram_polling,
+        state_store_path=state_store_path,
+        clips_cache_size=clips_cache_size,
+        storage_journal=storage_journal,
+        detection_workers=detection_workers,
     )
     arthas_bot.run()
 
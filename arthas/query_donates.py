@@ -0,0 +1,35 @@
+import datetime
+from typing import Optional
+
+import click
+
+import arthas.config
+from arthas.utils.donates_archive import DonatesArchive
+from arthas.utils.sqlite_storage import SqliteStore
+
+
+@click.command()
+@click.option('-v', '--video-id', default=None, help='Only donates of this stream')
+@click.option('--from-ms', default=None, type=int, help='Only donates detected at or after this unix time (ms)')
+@click.option('--to-ms', default=None, type=int, help='Only donates detected before this unix time (ms)')
+@click.option('--state-store-path', default=arthas.config.state_store_path)
+@click.option('--list-videos', is_flag=True, help='List ids of streams with archived donates')
+def main(video_id: Optional[str], from_ms: Optional[int], to_ms: Optional[int], state_store_path: str,
+         list_videos: bool) -> None:
+    archive = DonatesArchive(SqliteStore(state_store_path))
+
+    if list_videos:
+        for archived_video_id in archive.videos_ids():
+            print(archived_video_id)
+        return
+
+    donates = archive.find(video_id, from_ms, to_ms)
+    for donate in donates:
+        detected_at = datetime.datetime.fromtimestamp(donate.timestamp_ms / 1000).isoformat(timespec="seconds")
+        print("{}  {}  video={} frame={} bbox={}  {}".format(
+            detected_at, donate.donate_id, donate.video_id, donate.frame_index, donate.bbox, donate.path))
+    print("{} donates ({} unique images)".format(len(donates), len({donate.content_hash for donate in donates})))
+
+
+if __name__ == '__main__':
+    main()
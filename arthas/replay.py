@@ -0,0 +1,144 @@
+import io
+import time
+import logging
+import pathlib
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+import click
+import cv2
+import numpy as np
+
+import arthas.config
+from arthas.utils.donates_tracker import DonatesTracker
+from arthas.utils.triplets_archive import encode_triplet, EXTENSION as TRIPLET_EXTENSION
+from arthas.utils.stream_video import FRAME_WIDTH, FRAME_HEIGHT, FRAME_SIZE, ffmpeg_frames_command
+
+logger = logging.getLogger("Replay")
+
+
+@dataclass
+class ReplayedDonate:
+    time: float
+    donate_id: str
+    skipped: bool
+
+
+@dataclass
+class ReplaySegmentResult:
+    frames_number: int
+    elapsed: float
+    donates: list[ReplayedDonate] = field(default_factory=list)
+
+
+def probe_duration(video_path: Path) -> float:
+    output = subprocess.check_output([
+        "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1",
+        str(video_path)
+    ])
+    return float(output.decode("utf-8").strip())
+
+
+def read_frames(video_path: Path, fps: float, from_time: float, duration: Optional[float]) -> Iterator[np.ndarray]:
+    input_args = ["-ss", str(from_time)]
+    if duration is not None:
+        input_args += ["-t", str(duration)]
+    # the detector expects the same 1080p frames as the live stream gives
+    output_args = ["-vf", "scale={}:{}".format(FRAME_WIDTH, FRAME_HEIGHT)]
+    command = ffmpeg_frames_command(str(video_path), fps, extra_input_args=input_args, extra_output_args=output_args)
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    # with the default buffering stdout is a BufferedReader, which can read into the frame buffer
+    assert isinstance(process.stdout, io.BufferedReader)
+    try:
+        while True:
+            raw_image = bytearray(FRAME_SIZE)
+            view = memoryview(raw_image)
+            read_size = 0
+            while read_size < FRAME_SIZE:
+                n = process.stdout.readinto(view[read_size:])
+                if not n:
+                    return
+                read_size += n
+            yield np.frombuffer(raw_image, dtype=np.uint8).reshape((FRAME_HEIGHT, FRAME_WIDTH, 3))
+    finally:
+        process.kill()
+        process.wait()
+
+
+def replay_segment(
+    video_path: Path, fps: float, from_time: float, to_time: Optional[float], output_dir: Optional[Path]
+) -> ReplaySegmentResult:
+    # start a few frames earlier so that the first frames of the segment are centers of triplets too
+    seek_time = max(0.0, from_time - 3 / fps)
+    # and end a frame later so that the last frame of the segment is a center of a triplet too
+    duration = None if to_time is None else to_time + 1 / fps - seek_time
+
+    tracker = DonatesTracker()
+    result = ReplaySegmentResult(frames_number=0, elapsed=0.0)
+    start_time = time.time()
+
+    for img in read_frames(video_path, fps, seek_time, duration):
+        result.frames_number += 1
+        frame_time = seek_time + (result.frames_number - 1) / fps
+        detection = tracker.on_image(img, timestamp_ms=int(round(frame_time * 1000)))
+        if detection is None:
+            continue
+
+        # the donate is detected on the center frame of the triplet, i.e. on the previous one
+        donate_time = frame_time - 1 / fps
+        # donates at the bounds are reported by one segment only
+        if donate_time < from_time or (to_time is not None and donate_time >= to_time):
+            continue
+
+        result.donates.append(ReplayedDonate(donate_time, detection.donate_id, detection.skipped))
+        if output_dir is not None:
+            with open(output_dir / (detection.donate_id + TRIPLET_EXTENSION), "wb") as f:
+                f.write(encode_triplet(detection.triplet, {"donate_id": detection.donate_id, "time": donate_time}))
+            if not detection.skipped:
+                cv2.imwrite(str(output_dir / "{}.png".format(detection.donate_id)), detection.donate_img)
+
+    result.elapsed = time.time() - start_time
+    return result
+
+
+@click.command()
+@click.argument('video_path', type=Path)
+@click.option('--fps', default=1.0, help='Frames per second to feed to the detector (the live bot uses 1)')
+@click.option('-j', '--processes', default=1, help='Number of processes, each replays its own segment of the file')
+@click.option('-o', '--output-dir', default=None, type=Path, help='Where to save donates and their triplets')
+def main(video_path: Path, fps: float, processes: int, output_dir: Optional[Path]) -> None:
+    logging.basicConfig(level=logging.WARNING, format=arthas.config.logger_format)
+
+    if output_dir is not None:
+        pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    start_time = time.time()
+    if processes == 1:
+        results = [replay_segment(video_path, fps, 0.0, None, output_dir)]
+    else:
+        duration = probe_duration(video_path)
+        bounds = [duration * i / processes for i in range(processes + 1)]
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(replay_segment, video_path, fps, from_time, to_time, output_dir)
+                       for from_time, to_time in zip(bounds[:-1], bounds[1:])]
+            results = [future.result() for future in futures]
+    elapsed = time.time() - start_time
+
+    donates = [donate for result in results for donate in result.donates]
+    for donate in donates:
+        print("{:02d}:{:02d}:{:05.2f} {}{}".format(int(donate.time) // 3600, int(donate.time) // 60 % 60,
+                                                  donate.time % 60, donate.donate_id,
+                                                  " (skipped because of donate timeout)" if donate.skipped else ""))
+
+    frames_number = sum(result.frames_number for result in results)
+    print("{} donates ({} skipped) in {} frames, {:.1f} s, {:.1f} frames/s".format(
+        len(donates), sum(donate.skipped for donate in donates), frames_number, elapsed,
+        frames_number / max(elapsed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,9 +6,10 @@ from arthas import config
 import cv2
 import logging
 
-from arthas.utils.donates_detector import extract_donate_robust
+from arthas.utils.donates_detector import extract_donate_robust, extract_donates_batch
 from arthas.utils.donates_detector_utils import detect_donate
 import arthas.utils.donates_detector_utils
+from arthas.utils.triplets_archive import ArchivedTriplet, EXTENSION as TRIPLET_EXTENSION
 
 
 if __name__ == '__main__':
@@ -19,7 +20,12 @@ if __name__ == '__main__':
     for image_path in sys.argv[1:]:
         if os.path.isdir(image_path):
             images = sorted(os.listdir(image_path))
-            assert (len(images) == 3)
+            assert (len(images) >= 3)
+            if len(images) > 3:
+                frames = (cv2.imread(image_path + image) for image in images)
+                for image, donate in zip(images[1:-1], extract_donates_batch(frames)):
+                    print("{} {}".format("YES!" if donate is not None else "NO! ", image_path + image))
+                continue
             img0 = cv2.imread(image_path + images[0])
             img1 = cv2.imread(image_path + images[1])
             img2 = cv2.imread(image_path + images[2])
@@ -28,6 +34,10 @@ if __name__ == '__main__':
             donate = extract_donate_robust(img0, img1, img2)
             if donate is None:
                 img = img1
+        elif image_path.endswith(TRIPLET_EXTENSION):
+            img0, img1, img2 = ArchivedTriplet(image_path).frames()
+            print("{}:".format(image_path))
+            donate = extract_donate_robust(img0, img1, img2)
         else:
             img = cv2.imread(image_path)
             if img is None:
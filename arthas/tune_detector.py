@@ -0,0 +1,166 @@
+import json
+import time
+import logging
+import tempfile
+import dataclasses
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Optional
+
+import click
+import cv2
+import numpy as np
+
+import arthas.config
+from arthas.utils.donates_detector import candidate_masks_stacked, detect_donates_in_candidates
+from arthas.utils.detector_params import DetectorParams
+from arthas.utils.donates_detector_utils import from_100_to_255  # type: ignore
+from arthas.utils.synthetic_donates import EvaluationResult, generate_triplets, save_triplets, \
+    load_triplets_labels, load_triplet
+
+logger = logging.getLogger("Detector tuning")
+
+
+# motion thresholds are taken from a small grid so that many configurations share cached motion masks
+appeared_thresholds = [30, 40, 50, 60, 70]
+gone_thresholds = [10, 15, 20, 30]
+
+
+@dataclasses.dataclass
+class TuningResult:
+    params: dict[str, Any]
+    precision: float
+    recall: float
+    ms_per_frame: float
+
+
+def random_params(rng: np.random.Generator) -> DetectorParams:
+    def percents_range(from_values: list[int]) -> tuple[float, float]:
+        values_range: tuple[float, float] = from_100_to_255((int(rng.choice(from_values)), 100))
+        return values_range
+
+    return DetectorParams(
+        appeared_threshold=int(rng.choice(appeared_thresholds)),
+        gone_threshold=int(rng.choice(gone_thresholds)),
+        header_hue=(int(rng.integers(185, 201)), int(rng.integers(208, 221))),
+        header_sat=percents_range([50, 60, 70, 80]),
+        header_val=percents_range([50, 60, 70, 80]),
+        donate_hue=(int(rng.integers(32, 49)), int(rng.integers(55, 71))),
+        donate_sat=percents_range([30, 40, 50, 60]),
+        donate_val=percents_range([50, 60, 70, 80]),
+        min_header_letters=int(rng.integers(5, 10)),
+        min_donate_letters=int(rng.integers(6, 11)),
+        radius=int(rng.choice([15, 20, 25, 30])),
+    )
+
+
+def evaluate_shard(
+    corpus_dir: Path, labels: list[dict[str, Any]], configs: list[DetectorParams]
+) -> tuple[list[EvaluationResult], list[float]]:
+    # Evaluates all configurations on a shard of the corpus. Configurations are grouped by motion thresholds,
+    # so motion masks of each triplet are computed once per group and only color-dependent stages are repeated.
+    triplets = [load_triplet(corpus_dir, label) for label in labels]
+
+    results = [EvaluationResult() for _ in configs]
+    # time of stages shared by a group of configurations: motion masks and color conversion
+    shared_elapsed = [0.0 for _ in configs]
+
+    hsvs: list[np.ndarray] = []
+    hsv_elapsed = 0.0
+    motion_key: Optional[tuple[int, int]] = None
+    masks: list[np.ndarray] = []
+    motion_elapsed = 0.0
+
+    order = sorted(range(len(configs)), key=lambda i: (configs[i].appeared_threshold, configs[i].gone_threshold))
+    for config_index in order:
+        params = configs[config_index]
+
+        if motion_key != (params.appeared_threshold, params.gone_threshold):
+            motion_key = (params.appeared_threshold, params.gone_threshold)
+            masks = []
+            motion_elapsed = 0.0
+            for triplet in triplets:
+                start_time = time.perf_counter()
+                centers, is_candidate = candidate_masks_stacked(np.stack(triplet.frames), params)
+                motion_elapsed += time.perf_counter() - start_time
+                masks.append(is_candidate)
+
+                if len(hsvs) < len(triplets):
+                    start_time = time.perf_counter()
+                    hsvs.append(cv2.cvtColor(centers[0], cv2.COLOR_BGR2HSV)[None])
+                    hsv_elapsed += time.perf_counter() - start_time
+
+        shared_elapsed[config_index] = motion_elapsed + hsv_elapsed
+
+        result = results[config_index]
+        for triplet, hsv, is_candidate in zip(triplets, hsvs, masks):
+            height = triplet.frames[1].shape[0]
+            start_time = time.perf_counter()
+            detected = detect_donates_in_candidates(hsv, is_candidate, height, params)[0]
+            result.elapsed += time.perf_counter() - start_time
+            result.add(triplet, detected)
+
+    return results, shared_elapsed
+
+
+@click.command()
+@click.option('-c', '--corpus-dir', default=None, type=Path, help='Labelled triplets saved by evaluate_detector')
+@click.option('-n', '--count', default=1000, help='Number of triplets to generate if there is no corpus')
+@click.option('-s', '--samples', default=200, help='Number of random configurations to evaluate')
+@click.option('-r', '--target-recall', default=0.95)
+@click.option('-j', '--processes', default=4)
+@click.option('--seed', default=239)
+@click.option('-o', '--output-path', default=None, type=Path, help='Where to save all results as JSON')
+def main(corpus_dir: Optional[Path], count: int, samples: int, target_recall: float, processes: int, seed: int,
+         output_path: Optional[Path]) -> None:
+    logging.basicConfig(level=logging.INFO, format=arthas.config.logger_format)
+    logging.getLogger("Donates detector").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if corpus_dir is None:
+            corpus_dir = Path(tmp_dir)
+            logger.info("Generating corpus of {} triplets...".format(count))
+            save_triplets(generate_triplets([cv2.imread("data/sample001/frame0.jpg")], count, seed), corpus_dir)
+
+        labels = load_triplets_labels(corpus_dir)
+        rng = np.random.default_rng(seed)
+        configs = [DetectorParams()] + [random_params(rng) for _ in range(samples)]
+
+        logger.info("Evaluating {} configurations on {} triplets with {} processes..."
+                    .format(len(configs), len(labels), processes))
+        shards = [labels[i::processes] for i in range(processes)]
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(evaluate_shard, corpus_dir, shard, configs) for shard in shards if shard]
+            shards_results = [future.result() for future in futures]
+
+    summary: list[TuningResult] = []
+    for i, params in enumerate(configs):
+        total = EvaluationResult()
+        shared_elapsed = 0.0
+        for results, shard_shared_elapsed in shards_results:
+            for field in dataclasses.fields(EvaluationResult):
+                setattr(total, field.name, getattr(total, field.name) + getattr(results[i], field.name))
+            shared_elapsed += shard_shared_elapsed[i]
+        ms_per_frame = 1000 * (total.elapsed + shared_elapsed) / max(1, total.triplets_number)
+        summary.append(TuningResult(dataclasses.asdict(params), total.precision, total.recall, ms_per_frame))
+
+    default = summary[0]
+    print("default: precision={:.3f} recall={:.3f} {:.2f} ms/frame".format(
+        default.precision, default.recall, default.ms_per_frame))
+
+    suitable = [entry for entry in summary if entry.recall >= target_recall]
+    if not suitable:
+        print("No configuration reached recall {}".format(target_recall))
+    else:
+        best = min(suitable, key=lambda entry: (entry.ms_per_frame, -entry.precision))
+        print("fastest with recall >= {}: precision={:.3f} recall={:.3f} {:.2f} ms/frame".format(
+            target_recall, best.precision, best.recall, best.ms_per_frame))
+        print(json.dumps(best.params, indent=2))
+
+    if output_path is not None:
+        with open(output_path, "w") as f:
+            json.dump([dataclasses.asdict(entry) for entry in summary], f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
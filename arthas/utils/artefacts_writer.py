@@ -0,0 +1,174 @@
+import os
+import time
+import queue
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import cv2
+import numpy as np
+
+from arthas.utils import triplets_archive
+
+logger = logging.getLogger("Artefacts writer")
+
+
+# called with the path and the encoded bytes right after encoding, before the artefact is written to disk
+EncodedCallback = Callable[[str, bytes], None]
+
+# level meaning depends on codec: compression 0-9 for png, quality 0-100 for jpg and 1-100 for webp
+CODECS = {
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION),
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+def encode_image(img: np.ndarray, codec: str, level: int) -> bytes:
+    extension, param = CODECS[codec]
+    success, encoded = cv2.imencode(extension, img, [param, level])
+    if not success:
+        raise RuntimeError("Failed to encode image to {}".format(codec))
+    return encoded.tobytes()
+
+
+@dataclass
+class ArtefactsWriterStats:
+    queued: int = 0
+    written: int = 0
+    dropped: int = 0
+    # artefacts that can't be dropped, queued over max_queue_size
+    overflowed: int = 0
+    failed: int = 0
+    max_queue_size: int = 0
+    encode_time: float = 0.0
+    write_time: float = 0.0
+
+
+@dataclass
+class Artefact:
+    path: str
+    encode: Callable[[], bytes]
+    callback: Optional[EncodedCallback]
+    overwrite: bool = True
+
+
+class ArtefactsWriter:
+    def __init__(self, codec: str = "png", level: int = 3, max_queue_size: int = 32):
+        self.check_codec(codec)
+        self.codec = codec
+        self.level = level
+
+        # the queue is bounded by write_encoded, so artefacts that can't be dropped are queued without blocking
+        self.max_queue_size = max_queue_size
+        self.queue: queue.Queue[Optional[Artefact]] = queue.Queue()
+        # stats are updated by the callers (e.g. several detection threads) and the writer thread
+        self.lock = threading.Lock()
+        self.stats = ArtefactsWriterStats()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> threading.Thread:
+        self.thread = threading.Thread(target=self.run_loop, name="Artefacts writer")
+        self.thread.start()
+        return self.thread
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        # all already queued artefacts are written before the thread finishes
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        logger.info("Artefacts writer stopped! {}".format(self.stats))
+
+    def write(
+        self,
+        path_without_extension: str,
+        img: np.ndarray,
+        callback: Optional[EncodedCallback] = None,
+        drop_if_full: bool = True,
+        codec: Optional[str] = None,
+        level: Optional[int] = None,
+        overwrite: bool = True,
+    ) -> bool:
+        image_codec = codec or self.codec
+        image_level = level if level is not None else self.level
+        self.check_codec(image_codec)
+        path = path_without_extension + CODECS[image_codec][0]
+        return self.write_encoded(path, lambda: encode_image(img, image_codec, image_level), callback, drop_if_full,
+                                  overwrite)
+
+    def write_triplet(self, path_without_extension: str, frames: list[np.ndarray], metadata: dict[str, Any]) -> bool:
+        path = path_without_extension + triplets_archive.EXTENSION
+        return self.write_encoded(path, lambda: triplets_archive.encode_triplet(frames, metadata))
+
+    def write_encoded(
+        self,
+        path: str,
+        encode: Callable[[], bytes],
+        callback: Optional[EncodedCallback] = None,
+        drop_if_full: bool = True,
+        overwrite: bool = True,
+    ) -> bool:
+        # The caller is never blocked: if the disk can't keep up, droppable artefacts are dropped and others
+        # (e.g. photos posted to telegram) are queued over max_queue_size.
+        # Without overwrite an already existing file is kept (e.g. content-addressed files are never changed).
+        with self.lock:
+            queue_size = self.queue.qsize()
+            if queue_size >= self.max_queue_size:
+                if drop_if_full:
+                    self.stats.dropped += 1
+                    logger.warning("Artefacts queue is full, {} dropped! ({} dropped in total)"
+                                   .format(path, self.stats.dropped))
+                    return False
+                self.stats.overflowed += 1
+                logger.warning("Artefacts queue is full, {} is queued over the limit".format(path))
+            self.queue.put_nowait(Artefact(path, encode, callback, overwrite))
+            self.stats.queued += 1
+            self.stats.max_queue_size = max(self.stats.max_queue_size, queue_size + 1)
+        return True
+
+    @staticmethod
+    def check_codec(codec: str) -> None:
+        if codec not in CODECS:
+            raise ValueError("Unsupported codec: {} (supported: {})".format(codec, ", ".join(CODECS)))
+
+    def run_loop(self) -> None:
+        while True:
+            artefact = self.queue.get()
+            if artefact is None:
+                break
+
+            try:
+                start_time = time.time()
+                encoded = artefact.encode()
+                with self.lock:
+                    self.stats.encode_time += time.time() - start_time
+            except Exception as e:
+                with self.lock:
+                    self.stats.failed += 1
+                logger.error("Failed to encode {}: {}".format(artefact.path, e))
+                continue
+
+            if artefact.callback is not None:
+                try:
+                    artefact.callback(artefact.path, encoded)
+                except Exception as e:
+                    logger.error("Callback failed for {}: {}".format(artefact.path, e))
+
+            if not artefact.overwrite and os.path.exists(artefact.path):
+                continue
+
+            try:
+                start_time = time.time()
+                os.makedirs(os.path.dirname(artefact.path) or ".", exist_ok=True)
+                with open(artefact.path, "wb") as f:
+                    f.write(encoded)
+                with self.lock:
+                    self.stats.write_time += time.time() - start_time
+                    self.stats.written += 1
+            except Exception as e:
+                with self.lock:
+                    self.stats.failed += 1
+                logger.error("Failed to write {}: {}".format(artefact.path, e))
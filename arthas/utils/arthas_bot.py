@@ -1,14 +1,22 @@
-import logging
-import pathlib
 import time
+import asyncio
+import logging
+import threading
 from collections import namedtuple
+from typing import Any, Callable, Optional, Union
 
-import cv2
 import numpy as np
-from wrapt import synchronized
 
-from arthas.utils.donates_detector import extract_donate_robust
-from arthas.utils.file_storage import FileStorage
+from arthas.utils.artefacts_writer import ArtefactsWriter
+from arthas.utils.detection_pool import DetectionPool
+from arthas.utils.donates_archive import DonatesArchive
+from arthas.utils.donates_tracker import DonateDetection, DonatesTracker
+from arthas.utils.file_storage import wait_background_saves
+from arthas.utils.multi_channel_monitor import MultiChannelYoutubeMonitor
+from arthas.utils.sqlite_storage import (
+    CLIPS_NAMESPACE, SqliteStore, SqliteStorage, SqliteStorageView, migrate_clips_from_json
+)
+from arthas.utils.storage_journal import StorageJournal
 from arthas.utils.stream_video import StreamVideoSnapshots
 from arthas.utils.telegram_chat_bot import TelegramChatBot
 from arthas.utils.youtube_api import YoutubeAPI
@@ -22,179 +30,254 @@ ClipInfo = namedtuple('ClipInfo',
                       'clip_url clip_id video_id offset duration username message telegram_message_id')
 
 
-class ArthasBot:
-    def __init__(
-        self,
-        google_api_key: str,
-        channel_name: str,
-        telegram_token: str,
-        telegram_channel: str,
-    ):
+class StreamPipeline:
+    # Everything about one watched channel: stream events, its video and its donates tracker.
+    # Stream events and frames come on the bot event loop, frames are detected in the detection pool threads
+    # shared by all pipelines, the telegram outbox, artefacts writer and state store are shared through the bot.
+    # Event handlers never wait for the detection: they only share the screenshot and reset flags with it.
+    def __init__(self, bot: "ArthasBot", channel_name: str, monitor: YoutubeStreamerMonitor):
+        self.bot = bot
         self.channel_name = channel_name
+        self.monitor = monitor
 
-        self.telegram_bot = TelegramChatBot(telegram_channel, telegram_token)
-
-        self.api = YoutubeAPI(google_api_key)
-        self.video_tracker = StreamVideoSnapshots()
-        self.stream_monitor = YoutubeStreamerMonitor(channel_name, self.api)
+        self.video_tracker = StreamVideoSnapshots(use_event_loop=True)
+        self.donates_tracker = DonatesTracker()
+        self.detection_stream = bot.detection_pool.register(channel_name, self.on_video_screen)
 
         self.waiting_for_screenshot = False
+        # the tracker is reset by the detection thread, a frame of the previous video may still be in detection
+        self.reset_requested = False
+        self.detection_lock = threading.Lock()
+        self.video_id: Optional[str] = None
 
-        self.clips_ids_by_video_id: FileStorage[dict[str, str]] = FileStorage("clips.json", dirpath="state/clips")
-        self.clips = {}
-
-        self.clips_ids_by_video_id.load()
-        if self.clips_ids_by_video_id.value is None:
-            self.clips_ids_by_video_id.value = {}
-        else:
-            logger.info("Loading clips...")
-            deleted_number = 0
-            for video_id, clips_ids in self.clips_ids_by_video_id.value.items():
-                for clip_id in clips_ids:
-                    self.clips[clip_id] = self.create_clip_storage(video_id, clip_id)
-                    self.clips[clip_id].load(ClipInfo)
-                    if self.clips[clip_id].value is None:
-                        deleted_number += 1
-            logger.info("{} clips loaded! ({} deleted)".format(len(self.clips), deleted_number))
-
-        self.stream_monitor.add_new_post_callback(self.on_new_post)
-        self.stream_monitor.add_channel_status_callback(self.on_channel_status_changed)
-        self.stream_monitor.add_start_callback(self.on_stream_started)
-        self.stream_monitor.add_game_changed_callback(self.on_game_changed)
-        self.stream_monitor.add_title_changed_callback(self.on_title_changed)
-        self.stream_monitor.add_stop_callback(self.on_stream_stopped)
-
-    def run(self) -> None:
-        logger.info("Starting telegram bot...")
-        self.telegram_bot.start()
+        self.video_tracker.add_image_callback(self.on_video_frame)
 
-        if self.stream_monitor.streamer_state.value is not None:
-            assert False
-            # self.start_donates_detection()
+        self.monitor.add_new_post_callback(self.on_new_post)
+        self.monitor.add_channel_status_callback(self.on_channel_status_changed)
+        self.monitor.add_start_callback(self.on_stream_started)
+        self.monitor.add_resume_callback(self.on_stream_resumed)
+        self.monitor.add_game_changed_callback(self.on_game_changed)
+        self.monitor.add_title_changed_callback(self.on_title_changed)
+        self.monitor.add_stop_callback(self.on_stream_stopped)
 
-        logger.info("Starting stream monitor...")
-        monitor_thread = self.stream_monitor.start()
-
-        # Waiting for interruption (Ctrl+C)
-        self.telegram_bot.join()
-
-        self.stop_donates_detection()
-
-        if monitor_thread is not None:
-            logger.info("Stopping stream monitor...")
-            self.stream_monitor.stop()
-            monitor_thread.join()
-
-        logger.info("Stopping telegram bot...")
-        self.telegram_bot.stop()
-
-    @synchronized
     def on_stream_started(self, video_id: str, title: str, game_name: str) -> None:
-        self.telegram_bot.send_message(
+        self.bot.telegram_bot.send_message(
             f'Величайший подрубил!\n{game_name}\n{title}\nhttps://www.youtube.com/watch?v={video_id}'
         )
-        self.waiting_for_screenshot = True
+        self.request_screenshot()
+
+        self.start_donates_detection(video_id)
 
+    def on_stream_resumed(self, video_id: str, title: str) -> None:
+        # the bot was restarted during the stream, the start was already announced
+        logger.info("Resuming donates detection for {}...".format(video_id))
         self.start_donates_detection(video_id)
 
-    @synchronized
     def on_game_changed(self, game_name: str) -> None:
-        self.telegram_bot.send_message("Игра: {}".format(game_name))
-        self.waiting_for_screenshot = True
+        self.bot.telegram_bot.send_message("Игра: {}".format(game_name))
+        self.request_screenshot()
+
+    def request_screenshot(self) -> None:
+        with self.detection_lock:
+            self.waiting_for_screenshot = True
 
-    @synchronized
     def on_title_changed(self, title: str) -> None:
-        self.telegram_bot.send_message("Название стрима: {}".format(title))
+        self.bot.telegram_bot.send_message("Название стрима: {}".format(title))
 
-    @synchronized
     def on_stream_stopped(self) -> None:
-        self.telegram_bot.send_message("Папич отрубил :(((9(9((9(((((99(9")
+        self.bot.telegram_bot.send_message("Папич отрубил :(((9(9((9(((((99(9")
 
         self.stop_donates_detection()
 
-    @synchronized
     def on_channel_status_changed(self, status: str) -> None:
-        self.telegram_bot.send_message("Статус канала: {}".format(status))
+        self.bot.telegram_bot.send_message("Статус канала: {}".format(status))
 
-    @synchronized
     def on_new_post(self, body: str) -> None:
-        self.telegram_bot.send_message(body)
+        self.bot.telegram_bot.send_message(body)
 
     def start_donates_detection(self, video_id: str) -> None:
         logger.info("Starting video streaming for {}...".format(self.channel_name))
 
-        self.video_frame_index_cur = 0
-        self.video_frame_index_prev_processed = 0
-        self.video_frame_index_prev_donate = 0
-        self.video_key_imgs: list[np.ndarray] = []
+        self.video_id = video_id
+        # frames of the previous video that weren't detected yet are dropped
+        self.bot.detection_pool.clear(self.detection_stream)
+        with self.detection_lock:
+            self.reset_requested = True
 
-        self.video_tracker.add_image_callback(self.on_video_screen)
         self.video_tracker.start(video_id)
 
     def stop_donates_detection(self) -> None:
         logging.info("Stopping video streaming...")
 
-        self.video_tracker.image_callbacks = []
         if not self.video_tracker.stopped:
             logger.info("Stopping stream video...")
             self.video_tracker.stop()
+        self.bot.detection_pool.clear(self.detection_stream)
+
+    def on_video_frame(self, img: np.ndarray) -> None:
+        # called on the event loop, detection runs in the shared pool
+        self.bot.detection_pool.submit(self.detection_stream, img)
 
-    @synchronized
     def on_video_screen(self, img: np.ndarray) -> None:
-        if self.waiting_for_screenshot:
+        # called from a detection thread, frames of the pipeline are never processed concurrently
+        with self.detection_lock:
+            take_screenshot = self.waiting_for_screenshot
             self.waiting_for_screenshot = False
+            reset = self.reset_requested
+            self.reset_requested = False
+
+        if reset:
+            self.donates_tracker.reset()
+
+        if take_screenshot:
             current_time = time.time()
 
             logger.info("Saving and sending screenshot {}!".format(current_time))
 
-            screenshots_path = "screenshots"
-            pathlib.Path(screenshots_path).mkdir(exist_ok=True)
-            donate_path = screenshots_path + "/{}.png".format(current_time)
+            self.bot.post_photo("screenshots/{}".format(current_time), img)
 
-            cv2.imwrite(donate_path, img)
-            with open(donate_path, 'rb') as photo_file:
-                self.telegram_bot.send_photo(photo_file)
+        detection = self.donates_tracker.on_image(img)
+        if detection is None:
+            return
 
-        self.video_frame_index_cur += 1
-        frames_passed = self.video_frame_index_cur - self.video_frame_index_prev_processed
+        # for testing puproses
+        self.bot.artefacts_writer.write_triplet("donates_triplets/{}".format(detection.donate_id), detection.triplet, {
+            "donate_id": detection.donate_id,
+            "channel": self.channel_name,
+            "frame_index": detection.frame_index,
+            "timestamp_ms": detection.timestamp_ms,
+            "skipped": detection.skipped,
+        })
 
-        if frames_passed < 1:
-            return
+        if not detection.skipped:
+            self.on_donate(detection)
 
-        cur_time = int(round(time.time() * 1000))
-        self.video_frame_index_prev_processed = self.video_frame_index_cur
+    def on_donate(self, detection: DonateDetection) -> None:
+        archive = self.bot.donates_archive
+        donate = archive.create(detection.donate_id, detection.donate_img, self.video_id,
+                                detection.timestamp_ms, detection.frame_index, detection.bbox)
+        # the file is named by its content, an identical already archived crop is not written again.
+        # The donate is indexed by the artefacts writer thread, so the detection thread doesn't wait for a commit
+        self.bot.post_photo(archive.path_without_extension(donate.content_hash), detection.donate_img, overwrite=False,
+                            on_sent=lambda: archive.add(donate))
 
-        self.video_key_imgs.append(img)
-        if len(self.video_key_imgs) != 4:
-            return
-        self.video_key_imgs = self.video_key_imgs[1:]
 
-        donate_img = extract_donate_robust(self.video_key_imgs[0], self.video_key_imgs[1], self.video_key_imgs[2])
-        if donate_img is not None:
-            donate_id = "{}_{}".format(cur_time, self.video_frame_index_cur)
+class ArthasBot:
+    def __init__(
+        self,
+        google_api_key: str,
+        channel_names: list[str],
+        telegram_token: str,
+        telegram_channel: str,
+        artefacts_codec: str = "png",
+        artefacts_level: int = 3,
+        artefacts_queue_size: int = 32,
+        photo_codec: str = "jpg",
+        photo_level: int = 95,
+        telegram_polling: bool = False,
+        state_store_path: str = "state/state.sqlite3",
+        clips_cache_size: int = 256,
+        storage_journal: bool = False,
+        youtube_daily_quota_units: int = 10000,
+        detection_workers: int = 2,
+    ):
+        self.channel_names = channel_names
+
+        self.telegram_bot = TelegramChatBot(telegram_channel, telegram_token, polling=telegram_polling)
+
+        self.api = YoutubeAPI(google_api_key)
+        self.artefacts_writer = ArtefactsWriter(artefacts_codec, artefacts_level, artefacts_queue_size)
+        self.detection_pool = DetectionPool(detection_workers)
+        self.photo_codec = photo_codec
+        self.photo_level = photo_level
+        # with the journal streamer state changes share fsyncs instead of rewriting a file each
+        self.storage_journal = StorageJournal("state") if storage_journal else None
+
+        # several channels are polled together with batched requests
+        self.stream_monitor: Union[YoutubeStreamerMonitor, MultiChannelYoutubeMonitor]
+        if len(channel_names) == 1:
+            self.stream_monitor = YoutubeStreamerMonitor(channel_names[0], self.api, journal=self.storage_journal,
+                                                         daily_quota_units=youtube_daily_quota_units)
+            channel_monitors = {channel_names[0]: self.stream_monitor}
+        else:
+            self.stream_monitor = MultiChannelYoutubeMonitor(channel_names, self.api, journal=self.storage_journal,
+                                                             daily_quota_units=youtube_daily_quota_units)
+            channel_monitors = self.stream_monitor.monitors
+
+        self.state_store = SqliteStore(state_store_path)
+        migrate_clips_from_json(self.state_store)
+        # clips are loaded from the store on first access, so startup doesn't depend on the number of clips
+        self.clips: SqliteStorageView[ClipInfo] = SqliteStorageView(self.state_store, CLIPS_NAMESPACE, ClipInfo,
+                                                                    max_cached=clips_cache_size)
+        self.donates_archive = DonatesArchive(self.state_store, "donates", photo_codec)
+
+        self.pipelines = {
+            channel_name: StreamPipeline(self, channel_name, monitor)
+            for channel_name, monitor in channel_monitors.items()
+        }
+
+    def run(self) -> None:
+        asyncio.run(self.run_async())
+
+    async def run_async(self) -> None:
+        # The stream monitor, video pipes and telegram sender are served by one event loop, only the detection pool
+        # and the artefacts writer (CPU-heavy and disk work) have their own threads
+        self.artefacts_writer.start()
+        self.detection_pool.start()
+
+        logger.info("Starting telegram bot...")
+        telegram_task = asyncio.create_task(self.telegram_bot.run_async())
+
+        # a stream running before the restart is resumed by the monitor right after it starts
+        logger.info("Starting stream monitor...")
+        monitor_task = asyncio.create_task(self.stream_monitor.run_async())
+
+        # Waiting for interruption (Ctrl+C)
+        await self.telegram_bot.wait_for_stop_signal()
+
+        logger.info("Stopping stream monitor...")
+        self.stream_monitor.stop()
+        monitor_task.cancel()
+        await asyncio.gather(monitor_task, return_exceptions=True)
+
+        for pipeline in self.pipelines.values():
+            pipeline.stop_donates_detection()
+
+        # the threads may post photos until they are stopped, so the loop keeps sending while they are joined
+        logger.info("Stopping detection...")
+        await asyncio.to_thread(self.detection_pool.stop)
+
+        logger.info("Stopping artefacts writer...")
+        await asyncio.to_thread(self.artefacts_writer.stop)
+
+        logger.info("Stopping telegram bot...")
+        self.telegram_bot.stop_async()
+        await telegram_task
+
+        # the last states saved by the monitor may still be written
+        await asyncio.to_thread(wait_background_saves)
 
-            logging.info("Donate detected! id={}".format(donate_id))
+        logger.info("YouTube API latencies: {}".format(self.api.http.stats_summary()))
+        logger.info("YouTube API rate limiter waits: {}".format(self.api.rate_limiter.stats_summary()))
 
-            # for testing puproses
-            donate_path = "donates_triplets/{}".format(donate_id)
-            pathlib.Path(donate_path).mkdir(parents=True, exist_ok=True)
-            for i in range(3):
-                cv2.imwrite(donate_path + "/{}_{}.png".format(donate_id, i), self.video_key_imgs[i])
+        if self.storage_journal is not None:
+            logger.info("Stopping storage journal...")
+            self.storage_journal.stop()
 
-            if self.video_frame_index_cur - self.video_frame_index_prev_donate < 13:
-                logging.warning("Donate skipped because of donate timeout! (donate_id={})".format(donate_id))
-            else:
-                self.video_frame_index_prev_donate = self.video_frame_index_cur
-                self.on_donate(donate_img, donate_id)
+    def post_photo(self, path_without_extension: str, img: np.ndarray, overwrite: bool = True,
+                   on_sent: Optional[Callable[[], Any]] = None) -> None:
+        # the photo is encoded once: the same bytes are sent from memory and then saved to disk.
+        # on_sent is called by the artefacts writer thread after the photo is queued for sending
+        def callback(photo_path: str, encoded: bytes) -> None:
+            self.send_photo(photo_path, encoded)
+            if on_sent is not None:
+                on_sent()
 
-    def on_donate(self, donate_img: np.ndarray, donate_id: str) -> None:
-        donates_path = "donates"
-        pathlib.Path(donates_path).mkdir(exist_ok=True)
-        donate_path = donates_path + "/{}.png".format(donate_id)
+        self.artefacts_writer.write(path_without_extension, img, callback, drop_if_full=False,
+                                    codec=self.photo_codec, level=self.photo_level, overwrite=overwrite)
 
-        cv2.imwrite(donate_path, donate_img)
-        with open(donate_path, 'rb') as photo_file:
-            self.telegram_bot.send_photo(photo_file)
+    def send_photo(self, photo_path: str, encoded: bytes) -> None:
+        self.telegram_bot.send_photo(encoded, filename=photo_path.split("/")[-1])
 
-    def create_clip_storage(self, video_id: str, clip_id: str) -> FileStorage[ClipInfo]:
-        return FileStorage("clip_{}.json".format(clip_id), dirpath="state/clips/{}".format(video_id))
+    def create_clip_storage(self, video_id: str, clip_id: str) -> SqliteStorage[ClipInfo]:
+        return SqliteStorage(self.state_store, CLIPS_NAMESPACE, clip_id, video_id)
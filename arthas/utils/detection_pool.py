@@ -0,0 +1,126 @@
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger("Detection pool")
+
+
+FrameHandler = Callable[[np.ndarray], None]
+
+
+@dataclass
+class DetectionStreamStats:
+    submitted: int = 0
+    processed: int = 0
+    dropped: int = 0
+    failed: int = 0
+    busy_time: float = 0.0
+
+
+@dataclass
+class DetectionStream:
+    name: str
+    handler: FrameHandler
+    frames: "deque[np.ndarray]"
+    # the stream is in the ready queue or is being processed by a worker
+    scheduled: bool = False
+    stats: DetectionStreamStats = field(default_factory=DetectionStreamStats)
+
+
+class DetectionPool:
+    # Worker threads shared by the detection of several streams.
+    # Every stream has its own bounded queue of frames (the oldest frame is dropped when the stream can't keep up)
+    # and is processed by at most one worker at a time, because its tracker depends on the order of frames.
+    # Streams with pending frames are served round-robin one frame per turn, so a busy stream doesn't starve others.
+    def __init__(self, workers_number: int = 2, max_pending_frames: int = 8):
+        self.workers_number = workers_number
+        self.max_pending_frames = max_pending_frames
+
+        self.streams: list[DetectionStream] = []
+        self.ready: deque[DetectionStream] = deque()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.threads: list[threading.Thread] = []
+
+    def register(self, name: str, handler: FrameHandler) -> DetectionStream:
+        stream = DetectionStream(name, handler, deque(maxlen=self.max_pending_frames))
+        with self.condition:
+            self.streams.append(stream)
+        return stream
+
+    def submit(self, stream: DetectionStream, img: np.ndarray) -> None:
+        with self.condition:
+            stream.stats.submitted += 1
+            if len(stream.frames) == self.max_pending_frames:
+                stream.stats.dropped += 1
+                logger.warning("Detection of {} can't keep up, frame dropped! ({} dropped in total)"
+                               .format(stream.name, stream.stats.dropped))
+            stream.frames.append(img)
+            if not stream.scheduled:
+                stream.scheduled = True
+                self.ready.append(stream)
+                self.condition.notify()
+
+    def clear(self, stream: DetectionStream) -> None:
+        # pending frames of a stopped stream are not processed
+        with self.condition:
+            stream.frames.clear()
+
+    def start(self) -> None:
+        self.stopped = False
+        self.threads = [
+            threading.Thread(target=self.run_loop, name="Detection worker {}".format(i))
+            for i in range(self.workers_number)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self) -> None:
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        for stream in self.streams:
+            logger.info("Detection of {} stopped! {}".format(stream.name, stream.stats))
+
+    def next_frame(self) -> Optional[tuple[DetectionStream, np.ndarray]]:
+        with self.condition:
+            while not self.stopped:
+                while self.ready:
+                    stream = self.ready.popleft()
+                    if stream.frames:
+                        return stream, stream.frames.popleft()
+                    stream.scheduled = False
+                self.condition.wait()
+            return None
+
+    def run_loop(self) -> None:
+        while True:
+            next_frame = self.next_frame()
+            if next_frame is None:
+                break
+            stream, img = next_frame
+
+            start_time = time.monotonic()
+            try:
+                stream.handler(img)
+                stream.stats.processed += 1
+            except Exception as e:
+                stream.stats.failed += 1
+                logger.error("Detection of {} failed: {}".format(stream.name, e))
+            stream.stats.busy_time += time.monotonic() - start_time
+
+            with self.condition:
+                # back to the end of the ready queue if there are more frames
+                if stream.frames:
+                    self.ready.append(stream)
+                    self.condition.notify()
+                else:
+                    stream.scheduled = False
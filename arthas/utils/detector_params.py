@@ -0,0 +1,23 @@
+from dataclasses import dataclass
+
+# the detector utils are not typed, so the typed parameters of the detector are kept here
+from arthas.utils.donates_detector_utils import (  # type: ignore
+    appeared_threshold, gone_threshold, header_hue, header_sat, header_val, donate_hue, donate_sat, donate_val,
+    min_header_letters, min_donate_letters, donate_letters_radius
+)
+
+
+@dataclass(frozen=True)
+class DetectorParams:
+    # hand-tuned constants of the detector, see tune_detector
+    appeared_threshold: int = appeared_threshold
+    gone_threshold: int = gone_threshold
+    header_hue: tuple[float, float] = header_hue
+    header_sat: tuple[float, float] = header_sat
+    header_val: tuple[float, float] = header_val
+    donate_hue: tuple[float, float] = donate_hue
+    donate_sat: tuple[float, float] = donate_sat
+    donate_val: tuple[float, float] = donate_val
+    min_header_letters: int = min_header_letters
+    min_donate_letters: int = min_donate_letters
+    radius: float = donate_letters_radius
@@ -0,0 +1,137 @@
+import os
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+from arthas.utils.artefacts_writer import CODECS
+from arthas.utils.sqlite_storage import SqliteStore
+
+logger = logging.getLogger("Donates archive")
+
+
+DONATES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS donates (
+    donate_id TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    path TEXT NOT NULL,
+    video_id TEXT,
+    timestamp_ms INTEGER NOT NULL,
+    frame_index INTEGER NOT NULL,
+    from_x INTEGER NOT NULL,
+    to_x INTEGER NOT NULL,
+    from_y INTEGER NOT NULL,
+    to_y INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS donates_video_id ON donates (video_id, timestamp_ms);
+CREATE INDEX IF NOT EXISTS donates_timestamp_ms ON donates (timestamp_ms);
+CREATE INDEX IF NOT EXISTS donates_content_hash ON donates (content_hash);
+"""
+
+DONATES_COLUMNS = "donate_id, content_hash, path, video_id, timestamp_ms, frame_index, from_x, to_x, from_y, to_y"
+
+
+@dataclass
+class ArchivedDonate:
+    donate_id: str
+    content_hash: str
+    path: str
+    video_id: Optional[str]
+    timestamp_ms: int
+    frame_index: int
+    bbox: tuple[int, int, int, int]  # from_x, to_x, from_y, to_y
+
+    @staticmethod
+    def from_row(row: tuple[Any, ...]) -> "ArchivedDonate":
+        return ArchivedDonate(*row[:6], bbox=tuple(row[6:]))  # type: ignore
+
+
+def image_content_hash(img: np.ndarray) -> str:
+    # hash of the pixels (not of the encoded file), so identical crops are found before encoding
+    content_hash = hashlib.sha256("{}{}".format(img.shape, img.dtype).encode("utf-8"))
+    content_hash.update(np.ascontiguousarray(img).data)
+    return content_hash.hexdigest()
+
+
+class DonatesArchive:
+    # Donate crops are stored by content: dirpath/ab/cd/abcd...<ext>, identical crops share one file.
+    # Each detection is a row in the index of the store, so donates of a stream are found without listing files.
+    def __init__(self, store: SqliteStore, dirpath: str = "donates", codec: str = "png"):
+        self.store = store
+        self.dirpath = dirpath
+        self.extension = CODECS[codec][0]
+        self.store.executescript(DONATES_SCHEMA)
+
+    def path_without_extension(self, content_hash: str) -> str:
+        return os.path.join(self.dirpath, content_hash[:2], content_hash[2:4], content_hash)
+
+    def create(
+        self,
+        donate_id: str,
+        img: np.ndarray,
+        video_id: Optional[str],
+        timestamp_ms: int,
+        frame_index: int,
+        bbox: tuple[float, float, float, float],
+    ) -> ArchivedDonate:
+        # The donate isn't indexed yet: add() commits to the store, so it's called off the detection threads
+        content_hash = image_content_hash(img)
+        return ArchivedDonate(
+            donate_id=donate_id,
+            content_hash=content_hash,
+            path=self.path_without_extension(content_hash) + self.extension,
+            video_id=video_id,
+            timestamp_ms=int(timestamp_ms),
+            frame_index=int(frame_index),
+            bbox=tuple(int(v) for v in bbox),  # type: ignore
+        )
+
+    def add(self, donate: ArchivedDonate) -> bool:
+        # Returns whether the image of the donate is new (otherwise the file is already archived)
+        with self.store.transaction():
+            is_new = not self.store.query(
+                "SELECT 1 FROM donates WHERE content_hash = ? LIMIT 1", (donate.content_hash,))
+            self.store.execute(
+                "INSERT OR REPLACE INTO donates ({}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)".format(DONATES_COLUMNS),
+                (donate.donate_id, donate.content_hash, donate.path, donate.video_id, donate.timestamp_ms,
+                 donate.frame_index) + donate.bbox)
+
+        if not is_new:
+            logger.info("Donate {} is a duplicate of an archived image {}".format(donate.donate_id, donate.path))
+        return is_new
+
+    def get(self, donate_id: str) -> Optional[ArchivedDonate]:
+        rows = self.store.query("SELECT {} FROM donates WHERE donate_id = ?".format(DONATES_COLUMNS), (donate_id,))
+        return ArchivedDonate.from_row(rows[0]) if rows else None
+
+    def find(
+        self,
+        video_id: Optional[str] = None,
+        from_timestamp_ms: Optional[int] = None,
+        to_timestamp_ms: Optional[int] = None,
+    ) -> list[ArchivedDonate]:
+        conditions = []
+        parameters: list[Any] = []
+        if video_id is not None:
+            conditions.append("video_id = ?")
+            parameters.append(video_id)
+        if from_timestamp_ms is not None:
+            conditions.append("timestamp_ms >= ?")
+            parameters.append(from_timestamp_ms)
+        if to_timestamp_ms is not None:
+            conditions.append("timestamp_ms < ?")
+            parameters.append(to_timestamp_ms)
+
+        query = "SELECT {} FROM donates".format(DONATES_COLUMNS)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY timestamp_ms"
+
+        rows = self.store.query(query, parameters)
+        return [ArchivedDonate.from_row(row) for row in rows]
+
+    def videos_ids(self) -> list[str]:
+        rows = self.store.query("SELECT DISTINCT video_id FROM donates WHERE video_id IS NOT NULL")
+        return [video_id for video_id, in rows]
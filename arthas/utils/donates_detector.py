@@ -1,13 +1,32 @@
-from typing import Optional
+import itertools
+from typing import Iterable, Iterator, Optional, Union
 
 import cv2
 import numpy as np
 
 import arthas
-from arthas.utils.donates_detector_utils import estimate_is_appeared, estimate_is_gone, detect_donate  # type: ignore
+from arthas.utils.donates_detector_utils import (  # type: ignore
+    estimate_is_appeared, estimate_is_gone, detect_donate, frames_diff, is_appeared_from_diff, is_gone_from_diff,
+    letters_color_mask, detect_letters_in_mask, find_donate_header_y, locate_donate, donate_roi_from_y,
+    donate_roi_to_y, motion_masks_margin
+)
+from arthas.utils.detector_params import DetectorParams
+
+
+XYRange = tuple[float, float, float, float]
 
 
 def extract_donate_robust(prev: np.ndarray, cur: np.ndarray, next: np.ndarray) -> Optional[np.ndarray]:
+    xy_range = detect_donate_robust(prev, cur, next)
+
+    if xy_range is None:
+        return None
+    else:
+        from_x, to_x, from_y, to_y = xy_range
+        return cur[from_y:to_y, from_x:to_x]
+
+
+def detect_donate_robust(prev: np.ndarray, cur: np.ndarray, next: np.ndarray) -> Optional[XYRange]:
     enable_debug_dir = arthas.utils.donates_detector_utils.enable_debug_dir
     if enable_debug_dir:
         cv2.imwrite(enable_debug_dir + "00_prev.png", prev)
@@ -33,10 +52,96 @@ def extract_donate_robust(prev: np.ndarray, cur: np.ndarray, next: np.ndarray) -
     if enable_debug_dir:
         cv2.imwrite(enable_debug_dir + "22_frame_without_old_data_and_without_what_is_gone.png", img)
 
-    xy_range = detect_donate(img)
+    xy_range: Optional[XYRange] = detect_donate(img)
+    return xy_range
 
-    if xy_range is None:
-        return None
-    else:
-        from_x, to_x, from_y, to_y = xy_range
-        return cur[from_y:to_y, from_x:to_x]
+
+Frames = Union[np.ndarray, Iterable[np.ndarray]]
+
+
+def extract_donates_batch(frames: Frames, batch_size: int = 32) -> list[Optional[np.ndarray]]:
+    # Returns one result per center frame, i.e. len(frames) - 2 results (frames[1], ..., frames[-2])
+    return list(iterate_donates_batch(frames, batch_size))
+
+
+def iterate_donates_batch(frames: Frames, batch_size: int = 32) -> Iterator[Optional[np.ndarray]]:
+    assert batch_size >= 3
+
+    frames_iterator = iter(frames)
+    chunk: list[np.ndarray] = []
+    while True:
+        # consecutive chunks overlap by two frames so that each frame is a center of exactly one triplet
+        chunk = chunk[-2:] + list(itertools.islice(frames_iterator, batch_size - len(chunk[-2:])))
+        if len(chunk) < 3:
+            return
+        yield from extract_donates_stacked(np.stack(chunk))
+        if len(chunk) < batch_size:
+            return
+
+
+def extract_donates_stacked(frames: np.ndarray) -> list[Optional[np.ndarray]]:
+    # frames: (N, H, W, 3) stack of consecutive frames
+    results: list[Optional[np.ndarray]] = []
+    for cur, xy_range in zip(frames[1:-1], detect_donates_stacked(frames)):
+        if xy_range is None:
+            results.append(None)
+        else:
+            from_x, to_x, from_y, to_y = xy_range
+            results.append(cur[from_y:to_y, from_x:to_x].copy())
+    return results
+
+
+def detect_donates_stacked(frames: np.ndarray, params: Optional[DetectorParams] = None) -> list[Optional[XYRange]]:
+    if params is None:
+        params = DetectorParams()
+    assert frames.ndim == 4 and frames.shape[-1] == 3
+    height, width = frames.shape[1:3]
+    if len(frames) < 3:
+        return []
+
+    centers, is_candidate = candidate_masks_stacked(frames, params)
+    hsv = cv2.cvtColor(centers.reshape(-1, width, 3), cv2.COLOR_BGR2HSV).reshape(centers.shape)
+    return detect_donates_in_candidates(hsv, is_candidate, height, params)
+
+
+def candidate_masks_stacked(frames: np.ndarray, params: DetectorParams) -> tuple[np.ndarray, np.ndarray]:
+    # Returns ROI of the center frames and masks of pixels that appeared on them and are not gone on the next frames
+    height = frames.shape[1]
+
+    # Only the ROI is needed for detection, plus a few rows to keep morphology near the ROI border exact
+    roi_to_y = min(height, donate_roi_to_y)
+    frames = frames[:, donate_roi_from_y:min(height, roi_to_y + motion_masks_margin)]
+    roi_height = roi_to_y - donate_roi_from_y
+
+    # Each diff of adjacent frames is shared by two triplets: 'is gone' for the first and 'is appeared' for the second
+    diffs = frames_diff(frames[:-1], frames[1:])
+    is_appeared = np.stack([is_appeared_from_diff(diff, params.appeared_threshold) for diff in diffs[:-1]])
+    is_gone = np.stack([is_gone_from_diff(diff, params.gone_threshold) for diff in diffs[1:]])
+    is_candidate = np.logical_and(is_appeared[:, :roi_height], ~is_gone[:, :roi_height])
+
+    return np.ascontiguousarray(frames[1:-1, :roi_height]), is_candidate
+
+
+def detect_donates_in_candidates(
+    hsv: np.ndarray, is_candidate: np.ndarray, height: int, params: DetectorParams
+) -> list[Optional[XYRange]]:
+    # Color thresholds of all center frames at once, masked pixels are black and so never match the letters colors
+    n, roi_height, width = hsv.shape[:3]
+    header_masks = np.logical_and(
+        letters_color_mask(hsv, params.header_hue, params.header_sat, params.header_val), is_candidate)
+    donate_masks = np.logical_and(
+        letters_color_mask(hsv, params.donate_hue, params.donate_sat, params.donate_val), is_candidate)
+
+    results: list[Optional[XYRange]] = []
+    for i in range(n):
+        header_letters = detect_letters_in_mask(np.uint8(header_masks[i]) * 255, params.radius)
+        donate_header_y = find_donate_header_y(header_letters, width, height, params.min_header_letters)
+        if donate_header_y is None:
+            results.append(None)
+            continue
+
+        donate_letters = detect_letters_in_mask(np.uint8(donate_masks[i]) * 255, params.radius)
+        results.append(locate_donate(header_letters, donate_letters, donate_header_y, width, height, roi_height,
+                                     params.radius, params.min_donate_letters))
+
+    return results
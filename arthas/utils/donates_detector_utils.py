@@ -38,6 +38,38 @@ typical_letter_width = 14
 minimum_donate_border_width = 600
 
 
+def letters_color_mask(
+    hsv: np.ndarray,
+    hue_range: tuple[float, float],
+    sat_range: tuple[float, float],
+    val_range: tuple[float, float],
+) -> np.ndarray:
+    # works with any leading dimensions, e.g. with (N, H, W, 3) batch of frames
+    hue_mask = np.logical_and(hsv[..., 0] >= hue_range[0] / 2, hsv[..., 0] <= hue_range[1] / 2)
+    sat_mask = np.logical_and(hsv[..., 1] >= sat_range[0], hsv[..., 1] <= sat_range[1])
+    val_mask = np.logical_and(hsv[..., 2] >= val_range[0], hsv[..., 2] <= val_range[1])
+    return np.logical_and(hue_mask, np.logical_and(sat_mask, val_mask))
+
+
+def detect_letters_in_mask(mask: np.ndarray, radius: float) -> list[KeyPoint]:
+    params = cv2.SimpleBlobDetector_Params()
+    params.thresholdStep = 1
+    params.minThreshold = 127
+    params.maxThreshold = 129  # should be 128, but this is workaround to https://github.com/opencv/opencv/issues/6667
+    params.filterByArea = True
+    params.minArea = 10
+    params.maxArea = np.pi * radius * radius
+    params.filterByColor = False
+    params.blobColor = 255
+    params.filterByCircularity = False
+    params.filterByConvexity = False
+    params.filterByInertia = False
+
+    detector = cv2.SimpleBlobDetector_create(params)
+
+    return detector.detect(mask)
+
+
 def detect_letters(
     rgb: np.ndarray,
     hue_range: tuple[float, float],
@@ -57,11 +89,7 @@ def detect_letters(
         cv2.imwrite(debug_prefix_name + "30_image_after_crop_to_detect_letters.png", rgb)
 
     hsv = cv2.cvtColor(rgb, cv2.COLOR_BGR2HSV)
-
-    hue_mask = np.logical_and(hsv[:, :, 0] >= hue_range[0] / 2, hsv[:, :, 0] <= hue_range[1] / 2)
-    sat_mask = np.logical_and(hsv[:, :, 1] >= sat_range[0], hsv[:, :, 1] <= sat_range[1])
-    val_mask = np.logical_and(hsv[:, :, 2] >= val_range[0], hsv[:, :, 2] <= val_range[1])
-    mask = np.logical_and(hue_mask, np.logical_and(sat_mask, val_mask))
+    mask = letters_color_mask(hsv, hue_range, sat_range, val_range)
 
     if enable_debug_gui:
         rgb_copy = rgb.copy()
@@ -74,23 +102,8 @@ def detect_letters(
         rgb_copy[~mask] = 0
         cv2.imwrite(debug_prefix_name + "31_pixels_with_letters_colo_by_hue_sat_val.png", rgb_copy)
 
-    params = cv2.SimpleBlobDetector_Params()
-    params.thresholdStep = 1
-    params.minThreshold = 127
-    params.maxThreshold = 129  # should be 128, but this is workaround to https://github.com/opencv/opencv/issues/6667
-    params.filterByArea = True
-    params.minArea = 10
-    params.maxArea = np.pi * radius * radius
-    params.filterByColor = False
-    params.blobColor = 255
-    params.filterByCircularity = False
-    params.filterByConvexity = False
-    params.filterByInertia = False
-
-    detector = cv2.SimpleBlobDetector_create(params)
-
     mask = np.uint8(mask) * 255
-    blobs = detector.detect(mask)
+    blobs = detect_letters_in_mask(mask, radius)
 
     if enable_debug_gui:
         blobs_mask = mask.astype(np.uint8)
@@ -164,27 +177,58 @@ def plot_graph_for_blobs(img: np.ndarray, letters_blobs: list[KeyPoint]) -> np.n
     return img_with_letters_hists
 
 
+donate_roi_from_y = 0
+donate_roi_to_y = 400
+donate_letters_radius = 25
+
+appeared_threshold = 50
+gone_threshold = 20
+min_header_letters = 7
+min_donate_letters = 8
+
+
 def detect_donate(img: np.ndarray) -> Optional[tuple[float, float, float, float]]:
     height, width = img.shape[:2]
 
-    img_from_y = 0
-    img_to_y = 400
-    img = img[img_from_y:img_to_y, :, :]
-    radius = 25
+    img = img[donate_roi_from_y:donate_roi_to_y, :, :]
+    radius = donate_letters_radius
 
     header_letters = detect_letters(img, header_hue, header_sat, header_val, radius, debug_prefix_name="30_header_")
-    header_graph_y = letter_graph_by_y(header_letters, width, height)
     if enable_debug_dir:
         cv2.imwrite(enable_debug_dir + "30_header_99_plot_blobs_hists.png", plot_graph_for_blobs(img, header_letters))
-    donate_header_y = np.argmax(header_graph_y)
-    if header_graph_y[donate_header_y] < 7:
+    donate_header_y = find_donate_header_y(header_letters, width, height)
+    if donate_header_y is None:
         return None
 
     donate_letters = detect_letters(img, donate_hue, donate_sat, donate_val, radius, debug_prefix_name="31_donate_")
-    donate_graph_y = letter_graph_by_y(donate_letters, width, height)
     if enable_debug_dir:
         cv2.imwrite(enable_debug_dir + "31_donate_99_plot_blobs_hists.png", plot_graph_for_blobs(img, donate_letters))
-    if np.max(donate_graph_y) < 8:
+
+    return locate_donate(header_letters, donate_letters, donate_header_y, width, height, len(img))
+
+
+def find_donate_header_y(
+    header_letters: list[KeyPoint], width: int, height: int, min_letters: int = min_header_letters
+) -> Optional[int]:
+    header_graph_y = letter_graph_by_y(header_letters, width, height)
+    donate_header_y = np.argmax(header_graph_y)
+    if header_graph_y[donate_header_y] < min_letters:
+        return None
+    return donate_header_y
+
+
+def locate_donate(
+    header_letters: list[KeyPoint],
+    donate_letters: list[KeyPoint],
+    donate_header_y: int,
+    width: int,
+    height: int,
+    roi_height: int,
+    radius: float = donate_letters_radius,
+    min_letters: int = min_donate_letters,
+) -> Optional[tuple[float, float, float, float]]:
+    donate_graph_y = letter_graph_by_y(donate_letters, width, height)
+    if np.max(donate_graph_y) < min_letters:
         return None
 
     threshold = np.max(donate_graph_y) / 2
@@ -197,14 +241,14 @@ def detect_donate(img: np.ndarray) -> Optional[tuple[float, float, float, float]
     from_y = donate_header_y - radius
 
     from_y = max(0, from_y)
-    to_y = min(to_y, len(img))
+    to_y = min(to_y, roi_height)
 
     donate_graph_x = letter_graph_by_x([blob for blob in itertools.chain(header_letters, donate_letters)
                                         if from_y <= blob.pt[1] <= to_y],
                                        width, height,
                                        forced_blob_width=typical_letter_width * 4)
 
-    donate_graph_x = scipy.ndimage.filters.maximum_filter1d(donate_graph_x, 3 * radius)
+    donate_graph_x = scipy.ndimage.filters.maximum_filter1d(donate_graph_x, int(3 * radius))
     max_radius = 0
     for donate_graph_x_part in [donate_graph_x[:width // 2][::-1], donate_graph_x[width // 2:]]:
         donate_graph_x_part[-1] = 0
@@ -223,13 +267,27 @@ def detect_donate(img: np.ndarray) -> Optional[tuple[float, float, float, float]
         from_x = max(0, center_x - minimum_donate_border_width//2)
         to_x = min(center_x + minimum_donate_border_width//2, width)
 
-    return from_x, to_x, img_from_y + from_y, img_from_y + to_y
+    return from_x, to_x, donate_roi_from_y + from_y, donate_roi_from_y + to_y
+
+
+# how many rows around ROI affect motion masks inside of it (erode + dilate with 5x5 kernel)
+motion_masks_margin = 4
+
+
+def frames_diff(img0: np.ndarray, img1: np.ndarray) -> np.ndarray:
+    # works with any leading dimensions, e.g. with (N, H, W, 3) batch of frames
+    return np.uint8(np.abs(np.int16(img0) - img1))
 
 
 def estimate_is_appeared(img0: np.ndarray, img1: np.ndarray) -> bool:
-    threshold = 50
-    diff = np.uint8(np.abs(np.float32(img0) - img1))
+    return is_appeared_from_diff(frames_diff(img0, img1))
 
+
+def estimate_is_gone(img0: np.ndarray, img1: np.ndarray) -> bool:
+    return is_gone_from_diff(frames_diff(img0, img1))
+
+
+def is_appeared_from_diff(diff: np.ndarray, threshold: int = appeared_threshold) -> np.ndarray:
     diff = 255 * np.uint8(np.uint8(diff > threshold).sum(axis=-1) >= 1)
     diff = cv2.erode(diff, np.ones((5, 5), np.uint8), 1)
     diff = cv2.dilate(diff, np.ones((5, 5), np.uint8), 1)
@@ -237,9 +295,7 @@ def estimate_is_appeared(img0: np.ndarray, img1: np.ndarray) -> bool:
     return diff != 0
 
 
-def estimate_is_gone(img0: np.ndarray, img1: np.ndarray) -> bool:
-    threshold = 20
-    diff = np.uint8(np.abs(np.float32(img0) - img1))
+def is_gone_from_diff(diff: np.ndarray, threshold: int = gone_threshold) -> np.ndarray:
     diff = cv2.erode(diff, np.ones((5, 5), np.uint8), 1)
     diff = cv2.dilate(diff, np.ones((5, 5), np.uint8), 1)
 
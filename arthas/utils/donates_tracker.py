@@ -0,0 +1,74 @@
+import time
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from arthas.utils.donates_detector import XYRange, detect_donate_robust
+
+logger = logging.getLogger("Donates tracker")
+
+
+@dataclass
+class DonateDetection:
+    donate_id: str
+    frame_index: int
+    timestamp_ms: int
+    donate_img: np.ndarray
+    bbox: XYRange  # from_x, to_x, from_y, to_y of donate_img in the frame
+    triplet: list[np.ndarray]
+    skipped: bool
+
+
+class DonatesTracker:
+    def __init__(self, donate_timeout_frames: int = 13):
+        self.donate_timeout_frames = donate_timeout_frames
+        self.reset()
+
+    def reset(self) -> None:
+        self.frame_index_cur = 0
+        self.frame_index_prev_processed = 0
+        self.frame_index_prev_donate = 0
+        self.key_imgs: list[np.ndarray] = []
+
+    def on_image(self, img: np.ndarray, timestamp_ms: Optional[int] = None) -> Optional[DonateDetection]:
+        self.frame_index_cur += 1
+        frames_passed = self.frame_index_cur - self.frame_index_prev_processed
+
+        if frames_passed < 1:
+            return None
+
+        if timestamp_ms is None:
+            timestamp_ms = int(round(time.time() * 1000))
+        self.frame_index_prev_processed = self.frame_index_cur
+
+        self.key_imgs.append(img)
+        if len(self.key_imgs) != 4:
+            return None
+        self.key_imgs = self.key_imgs[1:]
+
+        bbox = detect_donate_robust(self.key_imgs[0], self.key_imgs[1], self.key_imgs[2])
+        if bbox is None:
+            return None
+        from_x, to_x, from_y, to_y = bbox
+        donate_img = self.key_imgs[1][from_y:to_y, from_x:to_x]
+
+        donate_id = "{}_{}".format(timestamp_ms, self.frame_index_cur)
+        logger.info("Donate detected! id={}".format(donate_id))
+
+        skipped = self.frame_index_cur - self.frame_index_prev_donate < self.donate_timeout_frames
+        if skipped:
+            logger.warning("Donate skipped because of donate timeout! (donate_id={})".format(donate_id))
+        else:
+            self.frame_index_prev_donate = self.frame_index_cur
+
+        return DonateDetection(
+            donate_id=donate_id,
+            frame_index=self.frame_index_cur,
+            timestamp_ms=timestamp_ms,
+            donate_img=donate_img,
+            bbox=bbox,
+            triplet=list(self.key_imgs),
+            skipped=skipped,
+        )
@@ -0,0 +1,51 @@
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from telegram.error import TelegramError
+
+logger = logging.getLogger("Fake telegram bot")
+
+
+@dataclass
+class SentRequest:
+    method: str
+    kwargs: dict[str, Any]
+    time: float
+
+
+class FakeBot:
+    # Local stand-in for telegram.Bot: records requests instead of sending them, can simulate errors and latency
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests: list[SentRequest] = []
+        self.errors: list[TelegramError] = []
+        self.lock = threading.Lock()
+
+    def fail_next(self, error: TelegramError) -> None:
+        # e.g. telegram.error.RetryAfter(5) or telegram.error.TimedOut()
+        with self.lock:
+            self.errors.append(error)
+
+    def request(self, method: str, **kwargs: Any) -> int:
+        time.sleep(self.latency)
+        with self.lock:
+            if self.errors:
+                raise self.errors.pop(0)
+            self.requests.append(SentRequest(method, kwargs, time.monotonic()))
+            logger.debug("{} {}".format(method, kwargs))
+            return len(self.requests)
+
+    def send_message(self, chat_id: str, text: str, **kwargs: Any) -> int:
+        return self.request("send_message", chat_id=chat_id, text=text, **kwargs)
+
+    def edit_message_text(self, chat_id: str, text: str, message_id: Optional[str] = None, **kwargs: Any) -> int:
+        return self.request("edit_message_text", chat_id=chat_id, text=text, message_id=message_id, **kwargs)
+
+    def send_photo(self, chat_id: str, photo: Any, **kwargs: Any) -> int:
+        return self.request("send_photo", chat_id=chat_id, photo=photo, **kwargs)
+
+    def send_media_group(self, chat_id: str, media: list[Any], **kwargs: Any) -> int:
+        return self.request("send_media_group", chat_id=chat_id, media=media, **kwargs)
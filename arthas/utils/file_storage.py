@@ -1,56 +1,105 @@
 import dataclasses
 import os
+import copy
 import json
 import logging
-from typing import Any, Generic, TypeVar, Callable, Optional, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Generic, TypeVar, Callable, Optional, Union
+
+if TYPE_CHECKING:
+    from arthas.utils.storage_journal import StorageJournal
 
 logger = logging.getLogger("File storage")
 
 
 T = TypeVar('T')
 
+# One thread writes all background saves in the order they were made, so an older value never overwrites
+# a newer one
+BACKGROUND_SAVER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Storage saver")
+
+
+def wait_background_saves() -> None:
+    BACKGROUND_SAVER.submit(lambda: None).result()
+
+
+def value_to_json(value: Any) -> Union[dict[Any, Any], str]:
+    if isinstance(value, str):
+        return value
+    elif isinstance(value, dict):
+        return value
+    elif hasattr(value, '_asdict'):  # namedtuple
+        return dict(value._asdict())
+    else:
+        return dataclasses.asdict(value)
+
+
+def write_json_file(filepath: str, data: Any) -> None:
+    # Written to a temporary file and renamed, so the file always contains either the old or the new data
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+
+    filepath_tmp = filepath + ".tmp"
+    with open(filepath_tmp, 'w') as state_file_tmp:
+        json.dump(data, state_file_tmp)
+        state_file_tmp.flush()
+        os.fsync(state_file_tmp.fileno())
+        state_file_tmp.close()
+
+        os.rename(filepath_tmp, filepath)
+
 
 class FileStorage(Generic[T]):
-    def __init__(self, filename: str, *, dirpath: str = "."):
+    def __init__(self, filename: str, *, dirpath: str = ".", journal: Optional["StorageJournal"] = None):
         self.value: Optional[T] = None
         self.dirpath = dirpath
         self.filepath = os.path.join(dirpath, filename)
         self.filepath_tmp = self.filepath + ".tmp"
+        # with a journal changes are appended to a shared log and written to the file on compaction
+        self.journal = journal
+        # with background saves save() takes a copy of the value and returns without waiting for fsync
+        # (e.g. on an event loop), see BACKGROUND_SAVER
+        self.background_saves = False
 
     def save(self) -> None:
-        if self.value is None:
+        data = value_to_json(self.value) if self.value is not None else None
+        if self.background_saves:
+            future = BACKGROUND_SAVER.submit(self.write, copy.deepcopy(data))
+            future.add_done_callback(self.on_background_save_done)
+        else:
+            self.write(data)
+
+    def on_background_save_done(self, future: "Future[None]") -> None:
+        if future.exception() is not None:
+            logger.error("Failed to save {}: {}".format(self.filepath, future.exception()))
+
+    def write(self, data: Any) -> None:
+        if self.journal is not None:
+            self.journal.write(self.filepath, data)
+            logger.info("State journaled! ({})".format(self.filepath))
+        elif data is None:
             try:
                 os.remove(self.filepath)
                 logger.info("State deleted! ({})".format(self.filepath))
             except FileNotFoundError:
                 logger.warning("No state already! ({})".format(self.filepath))
         else:
-            os.makedirs(self.dirpath, exist_ok=True)
-
-            with open(self.filepath_tmp, 'w') as state_file_tmp:
-                value_for_json: Union[dict[Any, Any], str]
-                if isinstance(self.value, str):
-                    value_for_json = self.value
-                elif isinstance(self.value, dict):
-                    value_for_json = self.value
-                else:
-                    value_for_json = dataclasses.asdict(self.value)
-                json.dump(value_for_json, state_file_tmp)
-                state_file_tmp.flush()
-                os.fsync(state_file_tmp.fileno())
-                state_file_tmp.close()
-
-                os.rename(self.filepath_tmp, self.filepath)
+            write_json_file(self.filepath, data)
             logger.info("State saved! ({})".format(self.filepath))
 
     def load(self, constructor: Optional[Callable[..., T]] = None) -> None:
         try:
-            with open(self.filepath, mode='r') as state_file:
-                data = json.load(state_file)
-                if constructor is not None:
-                    self.value = constructor(**data)
-                else:
-                    self.value = data
+            if self.journal is not None and self.journal.contains(self.filepath):
+                data = self.journal.read(self.filepath)
+                if data is None:
+                    raise FileNotFoundError(self.filepath)
+            else:
+                with open(self.filepath, mode='r') as state_file:
+                    data = json.load(state_file)
+
+            if constructor is not None:
+                self.value = constructor(**data)
+            else:
+                self.value = data
             logger.info("State loaded! ({})".format(self.filepath))
         except FileNotFoundError:
             logger.info("No state found, initialized with None! ({})".format(self.filepath))
@@ -0,0 +1,159 @@
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger("HTTP client")
+
+
+# (connect, read) in seconds, without them a stalled connection blocks the monitor forever
+DEFAULT_TIMEOUT = (3.05, 10.0)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+LATENCIES_WINDOW = 256
+CONDITIONAL_CACHE_SIZE = 256
+
+
+@dataclass
+class EndpointStats:
+    requests: int = 0
+    errors: int = 0
+    not_modified: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    # latencies of the last LATENCIES_WINDOW requests for percentiles
+    latencies: "deque[float]" = field(default_factory=lambda: deque(maxlen=LATENCIES_WINDOW), repr=False)
+
+    def add(self, elapsed: float, failed: bool, not_modified: bool = False) -> None:
+        self.requests += 1
+        self.errors += int(failed)
+        self.not_modified += int(not_modified)
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.latencies.append(elapsed)
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.requests if self.requests else 0.0
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "not_modified": self.not_modified,
+            "mean": round(self.mean_time, 4),
+            "p50": round(self.percentile(0.5), 4),
+            "p95": round(self.percentile(0.95), 4),
+            "max": round(self.max_time, 4),
+        }
+
+
+class HttpClient:
+    # One keep-alive connection pool for all requests of an API (instead of a new session and
+    # TCP+TLS handshake per call), with timeouts, retries with exponential backoff and latency stats per endpoint
+    def __init__(
+        self,
+        headers: Optional[dict[str, str]] = None,
+        timeout: tuple[float, float] = DEFAULT_TIMEOUT,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        pool_maxsize: int = 4,
+    ):
+        self.timeout = timeout
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            # the last response is returned as is, callers handle error statuses in the payload
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if headers is not None:
+            self.session.headers.update(headers)
+
+        self.stats: dict[str, EndpointStats] = {}
+        self.lock = threading.Lock()
+        # last successful response by url for conditional requests (ETag / Last-Modified validators)
+        self.conditional_cache: OrderedDict[str, requests.Response] = OrderedDict()
+
+    def get(
+        self,
+        url: str,
+        endpoint: Optional[str] = None,
+        headers: Optional[dict[str, str]] = None,
+        conditional: bool = False,
+        **kwargs: Any,
+    ) -> requests.Response:
+        # endpoint is a name for statistics (e.g. "youtube/videos"), by default the url without the query.
+        # With conditional=True the previous response of the url is revalidated with If-None-Match/If-Modified-Since
+        # and returned as is if the server answers 304 Not Modified.
+        endpoint = endpoint or url.split("?", 1)[0]
+        cached_response = self.get_conditional_cache(url) if conditional else None
+        if cached_response is not None:
+            headers = dict(headers or {})
+            if "ETag" in cached_response.headers:
+                headers["If-None-Match"] = cached_response.headers["ETag"]
+            if "Last-Modified" in cached_response.headers:
+                headers["If-Modified-Since"] = cached_response.headers["Last-Modified"]
+
+        failed = True
+        not_modified = False
+        start_time = time.monotonic()
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout, **kwargs)
+            if response.status_code == 304 and cached_response is not None:
+                not_modified = True
+                failed = False
+                return cached_response
+            failed = not response.ok
+            if conditional and response.ok and ("ETag" in response.headers or "Last-Modified" in response.headers):
+                self.put_conditional_cache(url, response)
+            return response
+        finally:
+            elapsed = time.monotonic() - start_time
+            with self.lock:
+                self.stats.setdefault(endpoint, EndpointStats()).add(elapsed, failed, not_modified)
+            logger.debug("GET {} {:.3f} s{}".format(
+                endpoint, elapsed, " (failed)" if failed else " (not modified)" if not_modified else ""))
+
+    def get_conditional_cache(self, url: str) -> Optional[requests.Response]:
+        with self.lock:
+            response = self.conditional_cache.get(url)
+            if response is not None:
+                self.conditional_cache.move_to_end(url)
+            return response
+
+    def put_conditional_cache(self, url: str, response: requests.Response) -> None:
+        with self.lock:
+            self.conditional_cache[url] = response
+            self.conditional_cache.move_to_end(url)
+            while len(self.conditional_cache) > CONDITIONAL_CACHE_SIZE:
+                self.conditional_cache.popitem(last=False)
+
+    def stats_summary(self) -> dict[str, dict[str, Any]]:
+        with self.lock:
+            return {endpoint: stats.summary() for endpoint, stats in self.stats.items()}
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+from arthas.utils.file_storage import FileStorage
+from arthas.utils.polling_scheduler import PollingScheduler
+from arthas.utils.storage_journal import StorageJournal
+from arthas.utils.twitch_api import API
+from arthas.utils.twitch_stream_monitor import StreamerMonitor
+from arthas.utils.youtube_api import YoutubeAPI, VideoInfo, VideoStatus
+from arthas.utils.youtube_stream_monitor import YoutubeStreamerMonitor, StreamerState
+
+logger = logging.getLogger("Multi channel monitor")
+
+
+class MultiChannelYoutubeMonitor:
+    # Watches several channels with one thread: statuses of all candidate videos of all channels are
+    # requested together (up to 50 ids per videos call) and every channel monitor gets its part of the results,
+    # so callbacks are added to the per-channel monitors from channel(). Channels are discovered through their feeds
+    # (no quota), so the quota spent per poll grows with the number of videos / 50, not with the number of channels.
+    def __init__(
+        self,
+        usernames: list[str],
+        api: YoutubeAPI,
+        journal: Optional[StorageJournal] = None,
+        daily_quota_units: Optional[int] = 10000,
+    ):
+        self.api = api
+        self.journal = journal
+        self.stopped = False
+        self.stop_event = threading.Event()
+
+        self.scheduler = PollingScheduler(journal=journal, daily_quota_units=daily_quota_units)
+        self.monitors = {
+            username: YoutubeStreamerMonitor(username, api, journal, state_suffix="_{}".format(username),
+                                             scheduler=self.scheduler)
+            for username in usernames
+        }
+
+    def channel(self, username: str) -> YoutubeStreamerMonitor:
+        return self.monitors[username]
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run_loop, name="Multi channel stream monitor")
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self.stopped = True
+        self.stop_event.set()
+
+    def init_states(self) -> None:
+        # Each channel has its own state file (streamer_state_<username>.json). A bot that monitored one channel
+        # saved it to streamer_state.json, so the state is moved to the channel it belongs to (a running stream
+        # is resumed instead of being announced again)
+        single_channel_state: FileStorage[StreamerState] = FileStorage("streamer_state.json", dirpath="state",
+                                                                       journal=self.journal)
+        single_channel_state.load(StreamerState)
+
+        for username, monitor in self.monitors.items():
+            if single_channel_state.value is None or monitor.streamer_state.value is not None:
+                monitor.init_state()
+                continue
+
+            # init_state() keeps the state only if it's of this channel
+            monitor.streamer_state.value = single_channel_state.value
+            monitor.init_state()
+            if monitor.streamer_state.value is single_channel_state.value:
+                logger.info("{}: state migrated from {}".format(username, single_channel_state.filepath))
+                monitor.streamer_state.save()
+                single_channel_state.value = None
+                single_channel_state.save()
+
+    def poll(self) -> None:
+        self.update(*self.fetch_video_infos())
+
+    def fetch_video_infos(self) -> tuple[dict[str, list[str]], dict[str, VideoInfo]]:
+        # the network part of a poll: candidate video ids by channel and infos of all of them.
+        # A channel whose feed can't be fetched is skipped, the others are still polled
+        candidate_ids = {}
+        for username, monitor in self.monitors.items():
+            try:
+                candidate_ids[username] = monitor.candidate_video_ids(use_playlist=False)
+            except Exception as e:
+                logger.error("{}: {}".format(username, e))
+        all_ids = [video_id for video_ids in candidate_ids.values() for video_id in video_ids]
+        return candidate_ids, {video_info.id: video_info for video_info in self.api.get_video_infos(all_ids)}
+
+    def update(self, candidate_ids: dict[str, list[str]], video_infos: dict[str, VideoInfo]) -> None:
+        for username, video_ids in candidate_ids.items():
+            monitor = self.monitors[username]
+            try:
+                monitor.update([video_infos[video_id] for video_id in video_ids if video_id in video_infos])
+            except Exception as e:
+                logger.error("{}: {}".format(username, e))
+
+        # the scheduler is shared, so a scheduled video of any channel counts
+        self.scheduler.set_scheduled_video_known(
+            any(video_info.status == VideoStatus.Scheduled for video_info in video_infos.values()))
+
+    def resume_streams(self) -> None:
+        self.resume(*self.fetch_running_video_infos())
+
+    def fetch_running_video_infos(self) -> tuple[dict[str, str], dict[str, VideoInfo]]:
+        # streams running before the restart are checked with one request
+        running_ids = {
+            username: monitor.streamer_state.value.video_id for username, monitor in self.monitors.items()
+            if monitor.streamer_state.value is not None and monitor.streamer_state.value.video_id is not None
+        }
+        if not running_ids:
+            return running_ids, {}
+        return running_ids, {
+            video_info.id: video_info for video_info in self.api.get_video_infos(list(running_ids.values()))
+        }
+
+    def resume(self, running_ids: dict[str, str], video_infos: dict[str, VideoInfo]) -> None:
+        for username, video_id in running_ids.items():
+            if video_id in video_infos:
+                try:
+                    self.monitors[username].resume(video_infos[video_id])
+                except Exception as e:
+                    logger.error("{}: {}".format(username, e))
+
+    def run_loop(self) -> None:
+        self.init_states()
+
+        try:
+            self.resume_streams()
+        except Exception as e:
+            logger.error(e)
+
+        while not self.stopped:
+            quota_units_used = self.api.quota_units_used
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(e)
+            finally:
+                units_per_poll = self.api.quota_units_used - quota_units_used
+                self.scheduler.spend_quota(units_per_poll)
+                any_running = any(monitor.is_stream_running() for monitor in self.monitors.values())
+                self.stop_event.wait(self.scheduler.next_interval(any_running, max(1, units_per_poll)))
+
+        self.scheduler.save()
+
+    async def run_async(self) -> None:
+        # see YoutubeStreamerMonitor.run_async. A migrated state is saved before the old file is deleted,
+        # so the states are initialized before background saves are enabled
+        await asyncio.to_thread(self.init_states)
+        self.scheduler.state.background_saves = True
+        for monitor in self.monitors.values():
+            monitor.streamer_state.background_saves = True
+
+        try:
+            self.resume(*await asyncio.to_thread(self.fetch_running_video_infos))
+        except Exception as e:
+            logger.error(e)
+
+        try:
+            while not self.stopped:
+                quota_units_used = self.api.quota_units_used
+                try:
+                    self.update(*await asyncio.to_thread(self.fetch_video_infos))
+                except Exception as e:
+                    logger.error(e)
+                finally:
+                    units_per_poll = self.api.quota_units_used - quota_units_used
+                    self.scheduler.spend_quota(units_per_poll)
+                any_running = any(monitor.is_stream_running() for monitor in self.monitors.values())
+                await asyncio.sleep(self.scheduler.next_interval(any_running, max(1, units_per_poll)))
+        finally:
+            self.scheduler.save()
+
+
+class MultiChannelTwitchMonitor:
+    # The same for Twitch: streams of all users are requested with one Helix call (user_id repeated)
+    def __init__(self, usernames: list[str], api: API, journal: Optional[StorageJournal] = None):
+        self.api = api
+        self.stopped = False
+        self.stop_event = threading.Event()
+
+        self.scheduler = PollingScheduler("twitch_polling_state.json", journal=journal, min_interval=10.0,
+                                          running_interval=20.0, max_interval=300.0)
+        self.monitors = {
+            username: StreamerMonitor(username, api, journal, state_suffix="_{}".format(username),
+                                      scheduler=self.scheduler)
+            for username in usernames
+        }
+
+    def channel(self, username: str) -> StreamerMonitor:
+        return self.monitors[username]
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run_loop, name="Multi channel stream monitor")
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self.stopped = True
+        self.stop_event.set()
+
+    def poll(self) -> None:
+        monitors_by_user_id = {
+            monitor.user_id: monitor for monitor in self.monitors.values() if monitor.user_id is not None
+        }
+        streams = self.api.get_users_streams(list(monitors_by_user_id))
+
+        for user_id, monitor in monitors_by_user_id.items():
+            try:
+                monitor.update(streams.get(user_id))
+            except Exception as e:
+                logger.error("{}: {}".format(monitor.username, e))
+
+    def run_loop(self) -> None:
+        for monitor in self.monitors.values():
+            monitor.init_user()
+
+        while not self.stopped:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(e)
+            finally:
+                any_running = any(monitor.streamer_state.value is not None for monitor in self.monitors.values())
+                self.stop_event.wait(self.scheduler.next_interval(any_running, 0))
+
+        self.scheduler.save()
@@ -0,0 +1,56 @@
+import time
+import logging
+import threading
+from typing import Any, Optional
+
+from arthas.utils.file_storage import FileStorage
+from arthas.utils.storage_journal import StorageJournal
+
+logger = logging.getLogger("Persistent cache")
+
+
+class PersistentCache:
+    # Small key -> JSON value cache kept in state/<filename> between restarts.
+    # Entries expire after ttl seconds, the least recently used ones are evicted above max_size entries.
+    def __init__(
+        self,
+        filename: str,
+        ttl: float = 7 * 24 * 60 * 60,
+        max_size: int = 256,
+        journal: Optional[StorageJournal] = None,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+        # key -> {"value": ..., "expires_at": unix time}, ordered from the least to the most recently used
+        self.storage: FileStorage[dict[str, dict[str, Any]]] = FileStorage(filename, dirpath="state", journal=journal)
+        self.storage.load()
+        if self.storage.value is None:
+            self.storage.value = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            assert self.storage.value is not None
+            entry = self.storage.value.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] < time.time():
+                del self.storage.value[key]
+                self.storage.save()
+                return None
+            # moved to the end as the most recently used, the order is saved too, so the eviction after a restart
+            # is still by the last use (nothing is saved if the entry is already the last one)
+            if key != next(reversed(self.storage.value)):
+                self.storage.value[key] = self.storage.value.pop(key)
+                self.storage.save()
+            return entry["value"]
+
+    def put(self, key: str, value: Any) -> None:
+        with self.lock:
+            assert self.storage.value is not None
+            self.storage.value.pop(key, None)
+            self.storage.value[key] = {"value": value, "expires_at": time.time() + self.ttl}
+            while len(self.storage.value) > self.max_size:
+                del self.storage.value[next(iter(self.storage.value))]
+            self.storage.save()
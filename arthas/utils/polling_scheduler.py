@@ -0,0 +1,152 @@
+import time
+import logging
+import datetime
+from dataclasses import dataclass, field
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from arthas.utils.file_storage import FileStorage
+from arthas.utils.storage_journal import StorageJournal
+
+logger = logging.getLogger("Polling scheduler")
+
+
+# YouTube Data API quota is reset at midnight Pacific Time
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+DAY_SECONDS = 24 * 60 * 60
+MAX_STARTS_HISTORY = 256
+# used quota is saved not after every poll but after spending this number of units
+QUOTA_SAVE_UNITS = 10
+
+
+@dataclass
+class PollingState:
+    # unix times of the recent stream starts
+    starts: list[float] = field(default_factory=list)
+    quota_day: str = ""
+    quota_used: int = 0
+
+
+class PollingScheduler:
+    # Chooses the delay before the next poll of the stream state:
+    #  - min_interval while a scheduled video is known or near a time of day when streams usually started,
+    #  - running_interval while a stream is running,
+    #  - otherwise the interval grows by backoff_factor after each idle poll up to max_interval.
+    # With daily_quota_units the interval is never shorter than the one that spends the rest of the quota
+    # evenly until the quota reset.
+    def __init__(
+        self,
+        filename: str = "polling_state.json",
+        journal: Optional[StorageJournal] = None,
+        daily_quota_units: Optional[int] = None,
+        min_interval: float = 15.0,
+        running_interval: float = 60.0,
+        max_interval: float = 600.0,
+        backoff_factor: float = 1.5,
+        likely_start_window: float = 45 * 60,
+    ):
+        self.daily_quota_units = daily_quota_units
+        self.min_interval = min_interval
+        self.running_interval = running_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.likely_start_window = likely_start_window
+
+        self.state: FileStorage[PollingState] = FileStorage(filename, dirpath="state", journal=journal)
+        self.state.load(PollingState)
+        if self.state.value is None:
+            self.state.value = PollingState()
+
+        self.idle_interval = min_interval
+        self.scheduled_video_known = False
+        self.unsaved_quota_units = 0
+
+    def record_stream_start(self, start_time: Optional[float] = None) -> None:
+        assert self.state.value is not None
+        self.state.value.starts.append(start_time if start_time is not None else time.time())
+        self.state.value.starts = self.state.value.starts[-MAX_STARTS_HISTORY:]
+        self.state.save()
+        self.scheduled_video_known = False
+
+    def set_scheduled_video_known(self, known: bool) -> None:
+        if known and not self.scheduled_video_known:
+            logger.info("Scheduled video found, polling more often")
+        self.scheduled_video_known = known
+
+    def spend_quota(self, units: int, current_time: Optional[float] = None) -> None:
+        assert self.state.value is not None
+        if units == 0:
+            return
+        quota_day = self.quota_day(current_time)
+        if self.state.value.quota_day != quota_day:
+            self.state.value.quota_day = quota_day
+            self.state.value.quota_used = 0
+        self.state.value.quota_used += units
+
+        self.unsaved_quota_units += units
+        if self.unsaved_quota_units >= QUOTA_SAVE_UNITS:
+            self.save()
+
+    def quota_day(self, current_time: Optional[float] = None) -> str:
+        current_time = current_time if current_time is not None else time.time()
+        return datetime.datetime.fromtimestamp(current_time, QUOTA_TIMEZONE).date().isoformat()
+
+    def is_likely_start_time(self, current_time: float) -> bool:
+        # compares only the time of day: streams usually start at about the same hour
+        assert self.state.value is not None
+        seconds_of_day = self.seconds_of_day(current_time)
+        for start_time in self.state.value.starts:
+            distance = abs(self.seconds_of_day(start_time) - seconds_of_day)
+            if min(distance, DAY_SECONDS - distance) <= self.likely_start_window:
+                return True
+        return False
+
+    @staticmethod
+    def seconds_of_day(timestamp: float) -> float:
+        moment = datetime.datetime.fromtimestamp(timestamp, QUOTA_TIMEZONE)
+        return moment.hour * 3600 + moment.minute * 60 + moment.second
+
+    def quota_interval(self, current_time: float, units_per_poll: int) -> float:
+        # the shortest interval that doesn't exhaust the daily quota before the reset
+        assert self.state.value is not None
+        if self.daily_quota_units is None or units_per_poll == 0:
+            return 0.0
+
+        quota_used = self.state.value.quota_used if self.state.value.quota_day == self.quota_day(current_time) else 0
+        quota_left = self.daily_quota_units - quota_used
+        if quota_left < units_per_poll:
+            logger.warning("Daily quota is exhausted ({} units used)".format(quota_used))
+            return self.seconds_until_quota_reset(current_time)
+        return self.seconds_until_quota_reset(current_time) * units_per_poll / quota_left
+
+    @staticmethod
+    def seconds_until_quota_reset(current_time: float) -> float:
+        moment = datetime.datetime.fromtimestamp(current_time, QUOTA_TIMEZONE)
+        next_day = datetime.datetime.combine(moment.date() + datetime.timedelta(days=1), datetime.time(),
+                                             tzinfo=QUOTA_TIMEZONE)
+        return next_day.timestamp() - current_time
+
+    def next_interval(
+        self,
+        stream_running: bool,
+        units_per_poll: int = 1,
+        current_time: Optional[float] = None,
+    ) -> float:
+        current_time = current_time if current_time is not None else time.time()
+
+        if stream_running:
+            interval = self.running_interval
+        elif self.scheduled_video_known or self.is_likely_start_time(current_time):
+            self.idle_interval = self.min_interval
+            interval = self.min_interval
+        else:
+            interval = self.idle_interval
+            self.idle_interval = min(self.max_interval, self.idle_interval * self.backoff_factor)
+
+        interval = max(interval, self.quota_interval(current_time, units_per_poll))
+        logger.debug("Next poll in {:.1f} s".format(interval))
+        return interval
+
+    def save(self) -> None:
+        self.state.save()
+        self.unsaved_quota_units = 0
@@ -0,0 +1,180 @@
+import time
+import heapq
+import hashlib
+import asyncio
+import logging
+import itertools
+import threading
+from dataclasses import dataclass
+from enum import IntEnum, unique
+from typing import Any
+
+logger = logging.getLogger("Rate limiter")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        # rate - tokens per second, capacity - maximal burst
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self) -> None:
+        current_time = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (current_time - self.updated_time) * self.rate)
+        self.updated_time = current_time
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        # Returns 0.0 if tokens were taken, otherwise how long to wait until they will be available
+        with self.lock:
+            self.refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        # Blocks the calling thread until tokens are available, returns the waited time
+        waited = 0.0
+        while True:
+            wait_time = self.try_acquire(tokens)
+            if wait_time == 0.0:
+                return waited
+            time.sleep(wait_time)
+            waited += wait_time
+
+
+@unique
+class Priority(IntEnum):
+    # lower values are served first
+    StreamState = 0
+    Normal = 1
+
+
+@dataclass
+class RateLimiterStats:
+    acquired: int = 0
+    waited: int = 0
+    total_wait_time: float = 0.0
+    max_wait_time: float = 0.0
+
+    def add(self, wait_time: float) -> None:
+        # wait_time is 0.0 for a caller that got the tokens without sleeping
+        self.acquired += 1
+        self.waited += int(wait_time > 0.0)
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "mean_wait": round(self.total_wait_time / self.acquired if self.acquired else 0.0, 4),
+            "max_wait": round(self.max_wait_time, 4),
+        }
+
+
+class RateLimiter(TokenBucket):
+    # Token bucket shared by all clients of the same quota (see get_rate_limiter), waiting callers are served
+    # in the order of priority and then of arrival, so a stream state check doesn't wait behind a queue of other
+    # requests. acquire blocks the calling thread, acquire_async only suspends the calling coroutine.
+    def __init__(self, name: str, rate: float, capacity: float = 1.0):
+        super().__init__(rate, capacity)
+        self.name = name
+        self.condition = threading.Condition(self.lock)
+        # (priority, ticket number, tokens) of the waiting callers
+        self.waiters: list[tuple[int, int, float]] = []
+        self.tickets = itertools.count()
+        self.stats: dict[Priority, RateLimiterStats] = {priority: RateLimiterStats() for priority in Priority}
+
+    def enqueue(self, priority: Priority, tokens: float) -> tuple[int, int, float]:
+        with self.lock:
+            waiter = (int(priority), next(self.tickets), tokens)
+            heapq.heappush(self.waiters, waiter)
+            return waiter
+
+    def poll(self, waiter: tuple[int, int, float]) -> float:
+        # Takes the tokens if the waiter is the first one, returns 0.0 then or the estimated time to wait
+        with self.lock:
+            self.refill()
+            if self.waiters[0] == waiter and self.tokens >= waiter[2]:
+                heapq.heappop(self.waiters)
+                self.tokens -= waiter[2]
+                self.condition.notify_all()
+                return 0.0
+            # tokens of all the waiters ahead have to be refilled first
+            tokens_ahead = sum(other[2] for other in self.waiters if other < waiter)
+            wait_time = (tokens_ahead + waiter[2] - self.tokens) / self.rate
+            # a waiter behind others with enough tokens in the bucket rechecks soon
+            return wait_time if wait_time > 0.0 else min(0.01, 1.0 / self.rate)
+
+    def cancel(self, waiter: tuple[int, int, float]) -> None:
+        with self.lock:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                heapq.heapify(self.waiters)
+                self.condition.notify_all()
+
+    def acquire(self, tokens: float = 1.0, priority: Priority = Priority.Normal) -> float:
+        start_time = time.monotonic()
+        waiter = self.enqueue(priority, tokens)
+        slept = False
+        try:
+            while True:
+                wait_time = self.poll(waiter)
+                if wait_time == 0.0:
+                    break
+                slept = True
+                # woken up earlier if the queue changes, e.g. a waiter ahead took its tokens
+                with self.condition:
+                    self.condition.wait(wait_time)
+        except BaseException:
+            self.cancel(waiter)
+            raise
+        return self.add_stats(priority, time.monotonic() - start_time if slept else 0.0)
+
+    async def acquire_async(self, tokens: float = 1.0, priority: Priority = Priority.Normal) -> float:
+        start_time = time.monotonic()
+        waiter = self.enqueue(priority, tokens)
+        slept = False
+        try:
+            while True:
+                wait_time = self.poll(waiter)
+                if wait_time == 0.0:
+                    break
+                slept = True
+                await asyncio.sleep(wait_time)
+        except BaseException:
+            self.cancel(waiter)
+            raise
+        return self.add_stats(priority, time.monotonic() - start_time if slept else 0.0)
+
+    def add_stats(self, priority: Priority, wait_time: float) -> float:
+        with self.lock:
+            self.stats[priority].add(wait_time)
+        if wait_time > 1.0:
+            logger.debug("{}: waited {:.2f} s for {} request".format(self.name, wait_time, priority.name))
+        return wait_time
+
+    def stats_summary(self) -> dict[str, dict[str, Any]]:
+        with self.lock:
+            return {priority.name: stats.summary() for priority, stats in self.stats.items()}
+
+
+def key_alias(key: str) -> str:
+    # a short stable name of an API key or client id for limiter names, which are logged
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+
+
+rate_limiters: dict[str, RateLimiter] = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, rate: float, capacity: float = 1.0) -> RateLimiter:
+    # The limiter of a quota by its name, created by the first client: rate and capacity of later calls are ignored
+    with rate_limiters_lock:
+        if name not in rate_limiters:
+            rate_limiters[name] = RateLimiter(name, rate, capacity)
+        return rate_limiters[name]
@@ -0,0 +1,273 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Any, Generic, TypeVar, Callable, Iterator, Optional, Sequence
+
+from arthas.utils.file_storage import value_to_json
+
+logger = logging.getLogger("SQLite storage")
+
+
+T = TypeVar('T')
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    video_id TEXT,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_video_id ON entries (namespace, video_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+CLIPS_NAMESPACE = "clips"
+
+
+class SqliteStore:
+    # One database file instead of a JSON file per value: entries are addressed by (namespace, key)
+    # and can be looked up by video_id, writes inside transaction() are committed (and synced) once
+    def __init__(self, path: str = "state/state.sqlite3", synchronous: str = "FULL"):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL: readers don't block the writer and a commit is one sequential append instead of a rewrite
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # FULL syncs the WAL on every commit, so a committed entry survives a power loss like an fsynced file.
+        # NORMAL syncs only on checkpoints: commits are faster, but the last ones can be lost on a power loss
+        # (not on a crash of the process)
+        assert synchronous in ("FULL", "NORMAL"), "Unsupported synchronous mode: {}".format(synchronous)
+        self.connection.execute("PRAGMA synchronous={}".format(synchronous))
+        self.connection.executescript(SCHEMA)
+
+        self.lock = threading.RLock()
+        self.transaction_depth = 0
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        # Nested transactions are merged to the outermost one
+        with self.lock:
+            if self.transaction_depth == 0:
+                self.connection.execute("BEGIN")
+            self.transaction_depth += 1
+            try:
+                yield
+            except BaseException:
+                self.transaction_depth -= 1
+                if self.transaction_depth == 0:
+                    self.connection.execute("ROLLBACK")
+                raise
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                self.connection.execute("COMMIT")
+
+    def query(self, sql: str, parameters: Sequence[Any] = ()) -> list[tuple[Any, ...]]:
+        # For other tables kept in the same database (e.g. the donates index)
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def execute(self, sql: str, parameters: Sequence[Any] = ()) -> int:
+        # Number of changed rows, the change is committed unless it's inside an outer transaction()
+        with self.transaction():
+            return self.connection.execute(sql, parameters).rowcount
+
+    def executescript(self, script: str) -> None:
+        with self.lock:
+            self.connection.executescript(script)
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        entry = self.get_entry(namespace, key)
+        return entry[1] if entry is not None else None
+
+    def get_entry(self, namespace: str, key: str) -> Optional[tuple[Optional[str], Any]]:
+        # (video_id, value) of the entry
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT video_id, value FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return (row[0], json.loads(row[1])) if row is not None else None
+
+    def put(self, namespace: str, key: str, value: Any, video_id: Optional[str] = None) -> None:
+        with self.transaction():
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, video_id, value) VALUES (?, ?, ?, ?)",
+                (namespace, key, video_id, json.dumps(value_to_json(value))))
+
+    def delete(self, namespace: str, key: str) -> bool:
+        with self.transaction():
+            cursor = self.connection.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+        return cursor.rowcount > 0
+
+    def items(self, namespace: str, video_id: Optional[str] = None) -> list[tuple[str, Any]]:
+        with self.lock:
+            if video_id is None:
+                rows = self.connection.execute(
+                    "SELECT key, value FROM entries WHERE namespace = ?", (namespace,)).fetchall()
+            else:
+                rows = self.connection.execute(
+                    "SELECT key, value FROM entries WHERE namespace = ? AND video_id = ?",
+                    (namespace, video_id)).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def keys(self, namespace: str) -> list[str]:
+        with self.lock:
+            rows = self.connection.execute("SELECT key FROM entries WHERE namespace = ?", (namespace,)).fetchall()
+        return [key for key, in rows]
+
+    def count(self, namespace: str) -> int:
+        with self.lock:
+            count, = self.connection.execute(
+                "SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)).fetchone()
+        return int(count)
+
+    def keys_by_video_id(self, namespace: str) -> dict[str, list[str]]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT video_id, key FROM entries WHERE namespace = ? ORDER BY video_id", (namespace,)).fetchall()
+        keys_by_video_id: dict[str, list[str]] = {}
+        for video_id, key in rows:
+            keys_by_video_id.setdefault(video_id, []).append(key)
+        return keys_by_video_id
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self.transaction():
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+class SqliteStorage(Generic[T]):
+    # Same interface as FileStorage, but the value is kept in a SqliteStore
+    def __init__(self, store: SqliteStore, namespace: str, key: str, video_id: Optional[str] = None):
+        self.value: Optional[T] = None
+        self.store = store
+        self.namespace = namespace
+        self.key = key
+        self.video_id = video_id
+
+    def save(self) -> None:
+        if self.value is None:
+            if self.store.delete(self.namespace, self.key):
+                logger.info("State deleted! ({}/{})".format(self.namespace, self.key))
+            else:
+                logger.warning("No state already! ({}/{})".format(self.namespace, self.key))
+        else:
+            self.store.put(self.namespace, self.key, self.value, self.video_id)
+            logger.info("State saved! ({}/{})".format(self.namespace, self.key))
+
+    def load(self, constructor: Optional[Callable[..., T]] = None) -> None:
+        data = self.store.get(self.namespace, self.key)
+        if data is None:
+            logger.info("No state found, initialized with None! ({}/{})".format(self.namespace, self.key))
+            self.value = None
+        elif constructor is not None:
+            self.value = constructor(**data)
+        else:
+            self.value = data
+
+
+class SqliteStorageView(MutableMapping[str, SqliteStorage[T]], Generic[T]):
+    # Mapping key -> SqliteStorage of a namespace, storages are loaded on first access
+    # and at most max_cached of them are kept in memory (least recently used are evicted).
+    # The store is the source of truth: an assigned storage is saved at once, so an evicted one is never lost.
+    def __init__(self, store: SqliteStore, namespace: str, constructor: Optional[Callable[..., T]] = None,
+                 max_cached: int = 256):
+        self.store = store
+        self.namespace = namespace
+        self.constructor = constructor
+        self.max_cached = max_cached
+        self.cached: OrderedDict[str, SqliteStorage[T]] = OrderedDict()
+
+    def __getitem__(self, key: str) -> SqliteStorage[T]:
+        storage = self.cached.get(key)
+        if storage is not None:
+            self.cached.move_to_end(key)
+            return storage
+
+        entry = self.store.get_entry(self.namespace, key)
+        if entry is None:
+            raise KeyError(key)
+        video_id, data = entry
+        storage = SqliteStorage(self.store, self.namespace, key, video_id)
+        storage.value = self.constructor(**data) if self.constructor is not None else data
+        self.cache(key, storage)
+        return storage
+
+    def __setitem__(self, key: str, storage: SqliteStorage[T]) -> None:
+        assert storage.namespace == self.namespace and storage.key == key, \
+            "Storage {}/{} can't be assigned to {}/{}".format(storage.namespace, storage.key, self.namespace, key)
+        storage.save()
+        if storage.value is None:
+            # saving None deletes the entry
+            self.cached.pop(key, None)
+        else:
+            self.cache(key, storage)
+
+    def __delitem__(self, key: str) -> None:
+        self.cached.pop(key, None)
+        if not self.store.delete(self.namespace, key):
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.cached or (isinstance(key, str) and self.store.get_entry(self.namespace, key) is not None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.store.keys(self.namespace))
+
+    def __len__(self) -> int:
+        return self.store.count(self.namespace)
+
+    def cache(self, key: str, storage: SqliteStorage[T]) -> None:
+        self.cached[key] = storage
+        self.cached.move_to_end(key)
+        while len(self.cached) > self.max_cached:
+            self.cached.popitem(last=False)
+
+
+def migrate_clips_from_json(store: SqliteStore, dirpath: str = "state/clips") -> int:
+    # One-time import of the old layout: dirpath/clips.json with clips ids by video id
+    # and dirpath/<video_id>/clip_<clip_id>.json per clip. JSON files are left in place as a backup.
+    if store.get_meta("clips_migrated_from_json") is not None:
+        return 0
+
+    migrated_number = 0
+    clips_ids_path = os.path.join(dirpath, "clips.json")
+    if os.path.exists(clips_ids_path):
+        logger.info("Migrating clips from {}...".format(dirpath))
+        with open(clips_ids_path) as f:
+            clips_ids_by_video_id: dict[str, list[str]] = json.load(f)
+
+        with store.transaction():
+            for video_id, clips_ids in clips_ids_by_video_id.items():
+                for clip_id in clips_ids:
+                    clip_path = os.path.join(dirpath, video_id, "clip_{}.json".format(clip_id))
+                    try:
+                        with open(clip_path) as f:
+                            clip = json.load(f)
+                    except FileNotFoundError:
+                        continue
+                    store.put(CLIPS_NAMESPACE, clip_id, clip, video_id)
+                    migrated_number += 1
+            store.set_meta("clips_migrated_from_json", dirpath)
+        logger.info("{} clips migrated!".format(migrated_number))
+    else:
+        store.set_meta("clips_migrated_from_json", dirpath)
+
+    return migrated_number
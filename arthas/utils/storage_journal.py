@@ -0,0 +1,188 @@
+import os
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from arthas.utils.file_storage import write_json_file
+
+logger = logging.getLogger("Storage journal")
+
+
+@dataclass
+class StorageJournalStats:
+    writes: int = 0
+    commits: int = 0
+    compactions: int = 0
+    # every fsync of the journal: commits, files written by compactions, log swaps and their directories
+    fsyncs: int = 0
+
+
+def fsync_dir(dirpath: str) -> None:
+    # makes created, renamed and removed entries of the directory durable
+    fd = os.open(dirpath or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StorageJournal:
+    # Append-only log shared by many FileStorage instances.
+    # Every record is a JSON line {"path": ..., "value": ...} (value null means the file is deleted).
+    # write() returns at once, records appended within commit_delay of the first pending one share one fsync
+    # (group commit), so a burst of saves costs one fsync instead of one per save. Like with a file per state,
+    # a crash never leaves a torn or mixed state: the log is replayed up to the last complete record, but the saves
+    # of the last commit_delay seconds may be lost.
+    # Files are written only when the log grows over compaction_size: the latest values are written to their own
+    # files and the log is replaced by one with the records appended meanwhile, so files stay readable without
+    # the journal and the log doesn't grow forever.
+    def __init__(self, dirpath: str = "state", commit_delay: float = 1.0, compaction_size: int = 1 << 20):
+        self.dirpath = dirpath
+        self.path = os.path.join(dirpath, "journal.log")
+        self.commit_delay = commit_delay
+        self.compaction_size = compaction_size
+        self.stats = StorageJournalStats()
+
+        # latest values of the files changed since the last compaction
+        self.values: dict[str, Any] = {}
+        # values being written to their files by compact(), read until the files are written
+        self.compacting: dict[str, Any] = {}
+        self.buffer: list[str] = []
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.stop_event = threading.Event()
+        # after the thread is finished writers commit by themselves
+        self.finished = False
+
+        os.makedirs(dirpath, exist_ok=True)
+        self.file = open(self.path, 'a')
+        self.recover()
+
+        self.thread = threading.Thread(target=self.run_loop, name="Storage journal", daemon=True)
+        self.thread.start()
+
+    def recover(self) -> None:
+        # A torn last record (crash in the middle of an append) was never committed, so it is skipped
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning("Skipped broken journal record: {!r}".format(line))
+                        break
+                    self.values[record["path"]] = record["value"]
+        except FileNotFoundError:
+            return
+
+        if os.path.getsize(self.path) > 0:
+            logger.info("{} states recovered from the journal".format(len(self.values)))
+            self.compact()
+
+    def contains(self, filepath: str) -> bool:
+        with self.condition:
+            return filepath in self.values or filepath in self.compacting
+
+    def read(self, filepath: str) -> Optional[Any]:
+        with self.condition:
+            if filepath in self.values:
+                return self.values[filepath]
+            return self.compacting[filepath]
+
+    def write(self, filepath: str, value: Optional[Any]) -> None:
+        # The record is committed by the journal thread within commit_delay
+        with self.condition:
+            self.values[filepath] = value
+            self.buffer.append(self.record(filepath, value))
+            self.stats.writes += 1
+            if self.finished:
+                self.append("".join(self.buffer))
+                self.buffer.clear()
+            self.condition.notify_all()
+
+    def run_loop(self) -> None:
+        # The file is written only by this thread (or by the owner before the thread starts and after it's finished),
+        # so the fsync is made without the lock and writers keep appending to the buffer meanwhile
+        while True:
+            with self.condition:
+                while not self.buffer and not self.stopped:
+                    self.condition.wait()
+                if not self.buffer:
+                    self.finished = True
+                    return
+
+            # let other records join the commit, stop() doesn't wait for the delay
+            self.stop_event.wait(self.commit_delay)
+
+            self.commit()
+            if self.file.tell() > self.compaction_size:
+                self.compact()
+
+    def commit(self) -> None:
+        with self.condition:
+            data = "".join(self.buffer)
+            self.buffer.clear()
+        if data:
+            self.append(data)
+
+    def append(self, data: str) -> None:
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.stats.commits += 1
+        self.stats.fsyncs += 1
+
+    @staticmethod
+    def record(filepath: str, value: Optional[Any]) -> str:
+        return json.dumps({"path": filepath, "value": value}) + "\n"
+
+    def compact(self) -> None:
+        # Files are written without the lock, writers keep journaling new values meanwhile.
+        # The log is replaced only after the files and their directories are synced: if it crashes before,
+        # the old log is replayed on the next start, the new log has the values changed during the compaction.
+        with self.condition:
+            self.compacting = self.values
+            self.values = {}
+
+        dirpaths = set()
+        for filepath, value in self.compacting.items():
+            if value is None:
+                try:
+                    os.remove(filepath)
+                except FileNotFoundError:
+                    pass
+            else:
+                write_json_file(filepath, value)
+                self.stats.fsyncs += 1
+            dirpaths.add(os.path.dirname(filepath))
+        for dirpath in dirpaths:
+            fsync_dir(dirpath)
+            self.stats.fsyncs += 1
+
+        with self.condition:
+            path_tmp = self.path + ".tmp"
+            with open(path_tmp, 'w') as f:
+                f.write("".join(self.record(filepath, value) for filepath, value in self.values.items()))
+                f.flush()
+                os.fsync(f.fileno())
+            self.file.close()
+            os.replace(path_tmp, self.path)
+            fsync_dir(self.dirpath)
+            self.stats.fsyncs += 2
+            self.file = open(self.path, 'a')
+
+            self.compacting = {}
+            self.stats.compactions += 1
+        logger.info("Journal compacted! {}".format(self.stats))
+
+    def stop(self) -> None:
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.stop_event.set()
+        self.thread.join()
+        self.compact()
+        with self.condition:
+            self.file.close()
@@ -1,11 +1,12 @@
 import os
+import asyncio
 import tempfile
 from io import TextIOWrapper
-from typing import Callable, Optional
+from typing import IO, Callable, Optional
 
 import time
-import fcntl
 import signal
+import selectors
 import pathlib
 import logging
 import threading
@@ -18,11 +19,71 @@ logger = logging.getLogger("Stream snapshots")
 
 ImageCallback = Callable[[np.ndarray], None]
 
+FRAME_WIDTH = 1920
+FRAME_HEIGHT = 1080
+FRAME_SIZE = FRAME_WIDTH * FRAME_HEIGHT * 3
+# the video is restarted if there is no frame for this time
+NO_IMAGE_TIMEOUT = 60
+
+
+def ffmpeg_frames_command(
+    input_path: str,
+    fps: Optional[float] = 1,
+    extra_input_args: Optional[list[str]] = None,
+    extra_output_args: Optional[list[str]] = None,
+) -> list[str]:
+    command = ["ffmpeg"] + (extra_input_args or []) + [
+        '-i', input_path,
+        '-pix_fmt', 'bgr24',  # opencv requires bgr24 pixel format.
+    ]
+    if fps is not None:
+        command += ["-r", str(fps)]
+    command += extra_output_args or []
+    command += ['-vcodec', 'rawvideo',
+                '-an', '-sn',  # we want to disable audio processing (there is no audio)
+                '-loglevel', 'debug',
+                '-f', 'image2pipe', '-']
+    return command
+
+
+class FrameReader:
+    # Assembles frames from a non-blocking pipe, every reader of a video has its own one
+    def __init__(self) -> None:
+        self.raw_image = bytearray(FRAME_SIZE)
+        self.raw_image_size = 0
+
+    def read_image(self, fd: int) -> Optional[np.ndarray]:
+        # Reads what is available in the pipe straight into the frame buffer, returns the image once it's complete.
+        # Raises EOFError if the pipe is closed.
+        try:
+            read_size = os.readv(fd, [memoryview(self.raw_image)[self.raw_image_size:]])
+        except BlockingIOError:
+            return None
+        if read_size == 0:
+            raise EOFError()
+
+        self.raw_image_size += read_size
+        if self.raw_image_size < FRAME_SIZE:
+            return None
+
+        # callbacks may keep the image, so the next one is read into a new buffer
+        img = np.frombuffer(self.raw_image, dtype=np.uint8).reshape((FRAME_HEIGHT, FRAME_WIDTH, 3))
+        self.raw_image = bytearray(FRAME_SIZE)
+        self.raw_image_size = 0
+        return img
+
 
 class StreamVideoSnapshots:
     STREAM_URL = 'https://www.youtube.com/watch?v={video_id}'
 
-    def __init__(self) -> None:
+    def __init__(self, use_event_loop: bool = False) -> None:
+        # With use_event_loop the pipe is read by the running asyncio loop when it has data (start() must be called
+        # on the loop), otherwise by an own thread
+        self.use_event_loop = use_event_loop
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.watchdog: Optional[asyncio.TimerHandle] = None
+        self.frame_reader = FrameReader()
+
         with tempfile.NamedTemporaryFile(delete=True) as f:
             self.fifo_filename = f.name
         self.logs_dir = pathlib.Path("stream_video_logs")
@@ -34,6 +95,8 @@ class StreamVideoSnapshots:
         self.ffmpeg_process_log: Optional[TextIOWrapper] = None
 
         self.thread: Optional[threading.Thread] = None
+        # the write end of the pipe waking up run_loop, closed by stop()
+        self.wakeup_fd: Optional[int] = None
         self.stopped = True
         self.lock = threading.RLock()
 
@@ -61,82 +124,133 @@ class StreamVideoSnapshots:
             ]
             logger.info("streamlink launched: {}".format(" ".join(streamlink_command)))
 
-            self.streamlink_process_log = (self.logs_dir / "{}_streamlink".format(timestamp)).open("a")
+            self.streamlink_process_log = (self.logs_dir / "{}_{}_streamlink".format(timestamp, video_id)).open("a")
             self.streamlink_process = subprocess.Popen(
                 streamlink_command, stdout=self.streamlink_process_log, stderr=self.streamlink_process_log
             )
 
-            ffmpeg_command = ["ffmpeg",
-                              '-i', self.fifo_filename,  # named pipe
-                              '-pix_fmt', 'bgr24',  # opencv requires bgr24 pixel format.
-                              "-r", "1",
-                              '-vcodec', 'rawvideo',
-                              '-an', '-sn',  # we want to disable audio processing (there is no audio)
-                              '-loglevel', 'debug',
-                              '-f', 'image2pipe', '-']
+            ffmpeg_command = ffmpeg_frames_command(self.fifo_filename)  # named pipe
             logger.info("ffmpeg launched:     {}".format(" ".join(ffmpeg_command)))
 
-            self.ffmpeg_process_log = (self.logs_dir / "{}_ffmpeg".format(timestamp)).open("a")
+            self.ffmpeg_process_log = (self.logs_dir / "{}_{}_ffmpeg".format(timestamp, video_id)).open("a")
             self.ffmpeg_process = subprocess.Popen(ffmpeg_command, stdout=subprocess.PIPE, stderr=self.ffmpeg_process_log)
 
             logger.info("Video start timestamp: {}".format(timestamp))
 
             self.stopped = False
-
-            self.thread = threading.Thread(target=lambda: self.run_loop(video_id), name="Stream snapshots")
-            self.thread.start()
+            self.frame_reader = FrameReader()
+
+            if self.use_event_loop:
+                self.start_reader(video_id)
+            else:
+                assert self.ffmpeg_process.stdout is not None
+                wakeup_fd, self.wakeup_fd = os.pipe()
+                self.thread = threading.Thread(
+                    target=self.run_loop, args=(video_id, self.ffmpeg_process.stdout, self.frame_reader, wakeup_fd),
+                    name="Stream snapshots"
+                )
+                self.thread.start()
         finally:
             self.lock.release()
 
-    def run_loop(self, video_id: str) -> None:
+    def run_loop(self, video_id: str, stdout: IO[bytes], frame_reader: FrameReader, wakeup_fd: int) -> None:
+        # The thread sleeps in select() until ffmpeg writes something, stop() or the watchdog timeout.
+        # stdout is kept here, so its fd stays open after stop() drops the process.
         failed = False
         restart = False
-        raw_image = b""
 
-        assert self.ffmpeg_process is not None
-        assert self.ffmpeg_process.stdout is not None
-        flag = fcntl.fcntl(self.ffmpeg_process.stdout, fcntl.F_GETFL)
-        fcntl.fcntl(self.ffmpeg_process.stdout.fileno(), fcntl.F_SETFL, flag | os.O_NONBLOCK)
+        fd = stdout.fileno()
+        os.set_blocking(fd, False)
+        previous_img_time = time.monotonic()
 
-        previous_img_time = time.time()
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            # closed by stop()
+            selector.register(wakeup_fd, selectors.EVENT_READ)
 
-        while not self.stopped and not failed and not restart:
-            try:
-                img = None
-
-                self.lock.acquire()
+            # self.stopped isn't checked: it's shared with the thread of the next start(), the wakeup pipe is not
+            while not failed and not restart:
                 try:
-                    if self.stopped:
+                    timeout = NO_IMAGE_TIMEOUT - (time.monotonic() - previous_img_time)
+                    if timeout <= 0:
+                        logger.error("No image for a minute!")
+                        restart = True
+                        break
+
+                    events = selector.select(timeout)
+                    if any(key.fd == wakeup_fd for key, _ in events):
+                        # stopped, the frame buffer may already belong to the next start()
                         break
-                    new_data = self.ffmpeg_process.stdout.read(1920 * 1080 * 3 - len(raw_image))
-                    if new_data is not None and len(new_data) > 0:
-                        raw_image += new_data
-                        if len(raw_image) == 1080 * 1920 * 3:
-                            img = np.frombuffer(raw_image, dtype=np.uint8)
-                            raw_image = b''
-                            img = img.reshape((1080, 1920, 3))
-                    else:
-                        time.sleep(0.001)
-                finally:
-                    self.lock.release()
-
-                current_time = time.time()
-
-                if img is not None:
-                    self.on_image(img)
-                    previous_img_time = current_time
-
-                if current_time - previous_img_time > 60:
-                    logger.error("No image for a minute!")
-                    restart = True
-            except Exception as e:
-                logger.error(e)
+                    for key, _ in events:
+                        try:
+                            img = frame_reader.read_image(fd)
+                        except EOFError:
+                            # ffmpeg exited, the watchdog restarts the video
+                            logger.error("ffmpeg pipe closed!")
+                            selector.unregister(fd)
+                            continue
+                        if img is not None:
+                            previous_img_time = time.monotonic()
+                            self.on_image(img)
+                except Exception as e:
+                    logger.error(e)
+
+        stdout.close()
+        os.close(wakeup_fd)
 
         if restart:
             self.start(video_id)
         elif failed:
             self.failed()
 
+    def start_reader(self, video_id: str) -> None:
+        # called on the loop: the pipe is read only when ffmpeg has written something, no polling and no thread
+        assert self.ffmpeg_process is not None
+        assert self.ffmpeg_process.stdout is not None
+        self.loop = asyncio.get_running_loop()
+        fd = self.ffmpeg_process.stdout.fileno()
+        os.set_blocking(fd, False)
+        self.loop.add_reader(fd, self.on_readable, fd, video_id)
+        self.reset_watchdog(video_id)
+
+    def on_readable(self, fd: int, video_id: str) -> None:
+        try:
+            img = self.frame_reader.read_image(fd)
+        except (EOFError, OSError) as e:
+            # ffmpeg exited, the watchdog restarts the video
+            logger.error("ffmpeg pipe closed! {}".format(e))
+            assert self.loop is not None
+            self.loop.remove_reader(fd)
+            return
+        if img is None:
+            return
+
+        self.reset_watchdog(video_id)
+        try:
+            self.on_image(img)
+        except Exception as e:
+            logger.error(e)
+
+    def reset_watchdog(self, video_id: str) -> None:
+        assert self.loop is not None
+        if self.watchdog is not None:
+            self.watchdog.cancel()
+        self.watchdog = self.loop.call_later(NO_IMAGE_TIMEOUT, self.on_no_image, video_id)
+
+    def on_no_image(self, video_id: str) -> None:
+        self.watchdog = None
+        if not self.stopped:
+            logger.error("No image for a minute!")
+            self.start(video_id)
+
+    def stop_reader(self) -> None:
+        if self.watchdog is not None:
+            self.watchdog.cancel()
+            self.watchdog = None
+        if self.loop is not None and self.ffmpeg_process is not None and self.ffmpeg_process.stdout is not None:
+            self.loop.remove_reader(self.ffmpeg_process.stdout.fileno())
+        self.loop = None
+
     def failed(self) -> None:
         self.stop()
 
@@ -151,6 +265,10 @@ class StreamVideoSnapshots:
         self.lock.acquire()
         try:
             self.stopped = True
+            self.stop_reader()
+            if self.wakeup_fd is not None:
+                os.close(self.wakeup_fd)
+                self.wakeup_fd = None
             if self.streamlink_process is not None:
                 logger.info("Stopping streamlink process...")
                 try:
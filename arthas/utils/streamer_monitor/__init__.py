@@ -5,6 +5,8 @@ from typing import Callable, Protocol
 NewPostCallback = Callable[[str], None]
 StatusChangedCallback = Callable[[str], None]
 StartedCallback = Callable[[str, str, str], None]
+# a stream that was running before the restart of the bot is still running (video/stream id, title)
+ResumedCallback = Callable[[str, str], None]
 TitleChangedCallback = Callable[[str], None]
 GameChangedCallback = Callable[[str], None]
 StoppedCallback = Callable[[], None]
@@ -0,0 +1,216 @@
+import json
+import string
+from pathlib import Path
+from dataclasses import dataclass
+from enum import Enum, auto, unique
+from typing import Any, Iterator, Optional
+
+import cv2
+import numpy as np
+
+# BGR colors of real donates (see base_color_median_* in donates_detector_utils)
+header_color = (232, 155, 20)
+donate_color = (82, 192, 214)
+
+font = cv2.FONT_HERSHEY_DUPLEX
+nickname_alphabet = string.ascii_letters + string.digits + "_"
+message_words = [
+    "папич", "привет", "arthas", "лучший", "стрим", "го", "катку",
+    "spasibo", "за", "контент", "когда", "дота", "wow", "kek",
+    "lol", "донат", "ахаха", "100", "рублей",
+]
+
+
+@unique
+class TripletKind(Enum):
+    Appeared = auto()  # donate appears on the center frame - the only one positive kind
+    AppearedLater = auto()  # donate appears on the next frame
+    AlreadyShown = auto()  # donate is shown on all three frames
+    Disappearing = auto()  # donate is gone on the next frame
+    NoDonate = auto()
+
+
+@dataclass
+class SyntheticTriplet:
+    frames: tuple[np.ndarray, np.ndarray, np.ndarray]
+    kind: TripletKind
+    # (from_x, to_x, from_y, to_y) of the donate on the center frame, only for TripletKind.Appeared
+    bbox: Optional[tuple[int, int, int, int]]
+
+    @property
+    def is_positive(self) -> bool:
+        return self.kind == TripletKind.Appeared
+
+
+@dataclass
+class DonateOverlay:
+    nickname: str
+    message_lines: list[str]
+    center_x: int
+    from_y: int
+    scale: float
+    thickness: int
+
+
+def random_overlay(rng: np.random.Generator, width: int) -> DonateOverlay:
+    nickname = "".join(rng.choice(list(nickname_alphabet), size=rng.integers(3, 20)))
+    # cv2.putText can't draw cyrillic letters, so they are replaced with latin ones of the same count
+    words = [word if word.isascii() else "x" * len(word)
+             for word in rng.choice(message_words, size=rng.integers(2, 24))]
+    words_per_line = int(rng.integers(3, 9))
+    message_lines = [" ".join(words[i:i + words_per_line]) for i in range(0, len(words), words_per_line)]
+    return DonateOverlay(
+        nickname=nickname + " - {} RUB".format(rng.choice([50, 100, 300, 500, 1000, 5000])),
+        message_lines=message_lines,
+        center_x=int(rng.integers(width // 3, 2 * width // 3)),
+        from_y=int(rng.integers(10, 120)),
+        scale=float(rng.uniform(0.9, 1.3)),
+        thickness=int(rng.integers(2, 4)),
+    )
+
+
+def render_overlay(
+    img: np.ndarray, overlay: DonateOverlay, alpha: float = 1.0
+) -> tuple[np.ndarray, tuple[int, int, int, int]]:
+    lines = [(overlay.nickname, header_color)] + [(line, donate_color) for line in overlay.message_lines]
+
+    layer = img.copy()
+    from_x, to_x = img.shape[1], 0
+    y = overlay.from_y
+    for text, color in lines:
+        (text_width, text_height), baseline = cv2.getTextSize(text, font, overlay.scale, overlay.thickness)
+        x = overlay.center_x - text_width // 2
+        y += text_height + baseline
+        cv2.putText(layer, text, (x, y), font, overlay.scale, color, overlay.thickness, cv2.LINE_AA)
+        from_x, to_x = min(from_x, x), max(to_x, x + text_width)
+    bbox = (max(0, from_x), min(img.shape[1], to_x), overlay.from_y, min(img.shape[0], y + baseline))
+
+    if alpha >= 1.0:
+        return layer, bbox
+    return cv2.addWeighted(layer, alpha, img, 1.0 - alpha, 0), bbox
+
+
+def jitter_background(img: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    # small changes of the background between frames: sensor noise and a moving rectangle somewhere
+    img = np.clip(img.astype(np.int16) + rng.integers(-3, 4, img.shape, dtype=np.int16), 0, 255).astype(np.uint8)
+    height, width = img.shape[:2]
+    x, y = int(rng.integers(0, width - 100)), int(rng.integers(0, height - 100))
+    color = tuple(int(c) for c in rng.integers(0, 256, 3))
+    cv2.rectangle(img, (x, y), (x + 100, y + 100), color, -1)
+    return img
+
+
+def generate_triplet(background: np.ndarray, rng: np.random.Generator,
+                     positive_ratio: float = 0.5) -> SyntheticTriplet:
+    height, width = background.shape[:2]
+    frames = [jitter_background(background, rng) for _ in range(3)]
+
+    if rng.random() < positive_ratio:
+        kind = TripletKind.Appeared
+    else:
+        kind = TripletKind(int(rng.integers(TripletKind.AppearedLater.value, TripletKind.NoDonate.value + 1)))
+
+    overlay = random_overlay(rng, width)
+    # fade in/out animation: alpha of the overlay on each of the three frames
+    fade = float(rng.uniform(0.6, 1.0))
+    alphas = {
+        TripletKind.Appeared: (0.0, fade, 1.0),
+        TripletKind.AppearedLater: (0.0, 0.0, fade),
+        TripletKind.AlreadyShown: (1.0, 1.0, 1.0),
+        TripletKind.Disappearing: (1.0, 1.0, 1.0 - fade),
+        TripletKind.NoDonate: (0.0, 0.0, 0.0),
+    }[kind]
+
+    bbox = None
+    for i, alpha in enumerate(alphas):
+        if alpha > 0.0:
+            frames[i], overlay_bbox = render_overlay(frames[i], overlay, alpha)
+            if i == 1 and kind == TripletKind.Appeared:
+                bbox = overlay_bbox
+
+    return SyntheticTriplet((frames[0], frames[1], frames[2]), kind, bbox)
+
+
+def generate_triplets(backgrounds: list[np.ndarray], count: int, seed: int = 239,
+                      positive_ratio: float = 0.5) -> Iterator[SyntheticTriplet]:
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        background = backgrounds[int(rng.integers(0, len(backgrounds)))]
+        yield generate_triplet(background, rng, positive_ratio)
+
+
+def is_bbox_matched(detected: tuple[float, float, float, float], expected: tuple[int, int, int, int]) -> bool:
+    # detected range is expected to cover the center of the donate
+    from_x, to_x, from_y, to_y = detected
+    center_x = (expected[0] + expected[1]) / 2
+    center_y = (expected[2] + expected[3]) / 2
+    return from_x <= center_x <= to_x and from_y <= center_y <= to_y
+
+
+@dataclass
+class EvaluationResult:
+    true_positives: int = 0
+    false_positives: int = 0
+    false_negatives: int = 0
+    true_negatives: int = 0
+    triplets_number: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def precision(self) -> float:
+        return self.true_positives / max(1, self.true_positives + self.false_positives)
+
+    @property
+    def recall(self) -> float:
+        return self.true_positives / max(1, self.true_positives + self.false_negatives)
+
+    @property
+    def fps(self) -> float:
+        # each triplet is a single processed (center) frame
+        return self.triplets_number / max(self.elapsed, 1e-9)
+
+    def add(self, triplet: SyntheticTriplet, detected: Optional[tuple[float, float, float, float]]) -> None:
+        self.triplets_number += 1
+        if triplet.is_positive:
+            assert triplet.bbox is not None
+            if detected is not None and is_bbox_matched(detected, triplet.bbox):
+                self.true_positives += 1
+            else:
+                self.false_negatives += 1
+                if detected is not None:
+                    self.false_positives += 1
+        elif detected is not None:
+            self.false_positives += 1
+        else:
+            self.true_negatives += 1
+
+
+def save_triplets(triplets: Iterator[SyntheticTriplet], dirpath: Path) -> int:
+    dirpath.mkdir(parents=True, exist_ok=True)
+    labels = []
+    for i, triplet in enumerate(triplets):
+        name = "{:06d}".format(i)
+        (dirpath / name).mkdir(exist_ok=True)
+        for j, frame in enumerate(triplet.frames):
+            cv2.imwrite(str(dirpath / name / "frame{}.png".format(j)), frame)
+        labels.append({"name": name, "kind": triplet.kind.name, "bbox": triplet.bbox})
+    with open(dirpath / "labels.json", "w") as f:
+        json.dump(labels, f, indent=1)
+    return len(labels)
+
+
+def load_triplets_labels(dirpath: Path) -> list[dict[str, Any]]:
+    with open(dirpath / "labels.json") as f:
+        labels: list[dict[str, Any]] = json.load(f)
+    return labels
+
+
+def load_triplet(dirpath: Path, label: dict[str, Any]) -> SyntheticTriplet:
+    img0, img1, img2 = [cv2.imread(str(dirpath / label["name"] / "frame{}.png".format(j))) for j in range(3)]
+    bbox = tuple(label["bbox"]) if label["bbox"] is not None else None
+    return SyntheticTriplet((img0, img1, img2), TripletKind[label["kind"]], bbox)
+
+
+def load_triplets(dirpath: Path) -> Iterator[SyntheticTriplet]:
+    for label in load_triplets_labels(dirpath):
+        yield load_triplet(dirpath, label)
@@ -1,59 +1,107 @@
-import time
+import signal
+import asyncio
 import logging
+import threading
 from io import BufferedReader
-from typing import Union
+from types import FrameType
+from typing import Any, Optional, Union
 
-from telegram import Bot, Message
+from telegram import Bot
 from telegram.ext import Updater, CallbackContext
 
+from arthas.utils.telegram_outbox import TelegramOutbox
+
 logger = logging.getLogger("Telegram bot")
 
 
 class TelegramChatBot:
-    def __init__(self, channel: str, token: str):
-        self.channel = channel
-
-        self.updater = Updater(token)
-        self.bot: Bot = self.updater.bot
-
-        self.updater.dispatcher.add_error_handler(self.error_handler)
+    STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGABRT)
 
-        self.previous_query_time: float = 0
-        self.query_timeout: float = 1.0
+    def __init__(self, channel: str, token: str, bot: Optional[Any] = None, polling: bool = False):
+        self.channel = channel
 
-    def send_message(self, text: str) -> Message:
+        # The bot only posts to the channel, so by default there is no updater polling for incoming updates.
+        # bot can be replaced with a local fake (see fake_telegram_bot.FakeBot)
+        self.updater: Optional[Updater] = None
+        if bot is None:
+            if polling:
+                self.updater = Updater(token)
+                self.updater.dispatcher.add_error_handler(self.error_handler)
+                bot = self.updater.bot
+            else:
+                bot = Bot(token)
+        self.bot: Bot = bot
+        self.stop_event = threading.Event()
+
+        # all requests are sent from the outbox thread with rate limiting and retries, so sending never blocks
+        self.outbox = TelegramOutbox(self.bot, "@{}".format(self.channel))
+
+    def send_message(self, text: str) -> None:
         logger.info("Sending message with text: {}".format(text))
+        self.outbox.post_message(text)
 
-        self.ensure_timeout()
-        return self.bot.send_message(chat_id="@{}".format(self.channel), text=text, disable_web_page_preview=True)
-
-    def edit_message(self, message_id: str, text: str) -> Union[Message, bool]:
+    def edit_message(self, message_id: str, text: str) -> None:
         logger.info("Editing message with id={}, new text: {}".format(message_id, text))
+        self.outbox.post_edit_message(message_id, text)
 
-        self.ensure_timeout()
-        return self.bot.edit_message_text(chat_id="@{}".format(self.channel), text=text, message_id=message_id)
-
-    def send_photo(self, photo_file: BufferedReader) -> Message:
-        return self.bot.send_photo("@{}".format(self.channel), photo=photo_file)
-
-    def ensure_timeout(self) -> None:
-        current_time = time.time()
-        passed = current_time - self.previous_query_time
-
-        if passed < self.query_timeout:
-            # logger.debug("Faced timeout!")
-            time.sleep(1.1 * self.query_timeout - passed)
-
-        self.previous_query_time = current_time
+    def send_photo(self, photo: Union[BufferedReader, bytes], filename: Optional[str] = None) -> None:
+        # photo is either an opened file or an already encoded image (e.g. from cv2.imencode), no disk round trip
+        logger.info("Sending photo {}".format(filename or ""))
+        self.outbox.post_photo(photo, filename)
 
     def start(self) -> None:
-        self.updater.start_polling(read_latency=10)
+        self.outbox.start()
+        if self.updater is not None:
+            self.updater.start_polling(read_latency=10)
 
     def stop(self) -> None:
-        self.updater.stop()
+        if self.updater is not None:
+            self.updater.stop()
+        self.outbox.stop()
+
+    async def run_async(self) -> None:
+        # Sends everything posted until stop_async() on the running loop instead of the outbox thread.
+        # The updater (only with polling) still has its own threads.
+        self.outbox.open()
+        if self.updater is not None:
+            self.updater.start_polling(read_latency=10)
+        await self.outbox.run_async()
+
+    def stop_async(self) -> None:
+        if self.updater is not None:
+            self.updater.stop()
+        self.outbox.close()
 
     def join(self) -> None:
-        self.updater.idle()
+        if self.updater is not None:
+            self.updater.idle(self.STOP_SIGNALS)
+            return
+
+        # Blocks until a stop signal (Ctrl+C, systemctl stop) is received, like Updater.idle() does
+        for signum in self.STOP_SIGNALS:
+            signal.signal(signum, self.signal_handler)
+        self.stop_event.wait()
+
+    async def wait_for_stop_signal(self) -> None:
+        # the same as join() for a bot running on an event loop
+        loop = asyncio.get_running_loop()
+        stop_event = asyncio.Event()
+        for signum in self.STOP_SIGNALS:
+            loop.add_signal_handler(signum, self.async_signal_handler, signum, stop_event)
+        try:
+            await stop_event.wait()
+        finally:
+            for signum in self.STOP_SIGNALS:
+                loop.remove_signal_handler(signum)
+
+    @staticmethod
+    def async_signal_handler(signum: int, stop_event: asyncio.Event) -> None:
+        logger.info("Received signal {}, stopping...".format(signal.Signals(signum).name))
+        stop_event.set()
+
+    def signal_handler(self, signum: int, frame: Optional[FrameType]) -> None:
+        logger.info("Received signal {}, stopping...".format(signal.Signals(signum).name))
+        self.stop_event.set()
 
     @staticmethod
     def error_handler(update: object, context: CallbackContext) -> None:
@@ -0,0 +1,194 @@
+import time
+import asyncio
+import logging
+import functools
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Optional, Union
+
+from telegram import Bot, InputMediaPhoto
+from telegram.error import RetryAfter, BadRequest, Unauthorized, NetworkError, TelegramError
+
+from arthas.utils.rate_limiter import get_rate_limiter
+
+logger = logging.getLogger("Telegram outbox")
+
+
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+# no more than 20 messages per minute to the same group/channel, about one message per second
+CHAT_MESSAGES_PER_SECOND = 20 / 60
+CHAT_MESSAGES_BURST = 3
+
+MAX_MEDIA_GROUP_SIZE = 10
+
+
+@dataclass
+class OutboxItem:
+    method: str
+    kwargs: dict[str, Any]
+
+
+@dataclass
+class TelegramOutboxStats:
+    queued: int = 0
+    sent: int = 0
+    media_groups: int = 0
+    retries: int = 0
+    failed: int = 0
+    rate_limit_wait_time: float = 0.0
+    max_queue_size: int = 0
+    send_time_by_method: dict[str, float] = field(default_factory=dict)
+
+
+class TelegramOutbox:
+    # Requests are sent by the run_async coroutine on an event loop, blocking Bot calls are made in its executor.
+    # post_* methods can be called from any thread. Without an event loop of the caller start() runs one in a thread.
+    def __init__(
+        self,
+        bot: Bot,
+        chat_id: str,
+        media_group_delay: float = 3.0,
+        max_attempts: int = 5,
+        max_backoff: float = 60.0,
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        # photos posted within this delay after each other are sent as one media group
+        self.media_group_delay = media_group_delay
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+
+        self.rate_limiter = get_rate_limiter("telegram/{}".format(chat_id), CHAT_MESSAGES_PER_SECOND,
+                                             CHAT_MESSAGES_BURST)
+        # created by open() on the loop of run_async
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queue: Optional[asyncio.Queue[Optional[OutboxItem]]] = None
+        self.stats = TelegramOutboxStats()
+        self.thread: Optional[threading.Thread] = None
+
+    def open(self) -> None:
+        # binds the outbox to the running loop, must be called on it before anything is posted
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def start(self) -> threading.Thread:
+        opened = threading.Event()
+
+        async def run() -> None:
+            self.open()
+            opened.set()
+            await self.run_async()
+
+        self.thread = threading.Thread(target=asyncio.run, args=(run(),), name="Telegram outbox")
+        self.thread.start()
+        opened.wait()
+        return self.thread
+
+    def stop(self) -> None:
+        # everything already posted is sent before run_async returns
+        self.close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self) -> None:
+        self.put(None)
+
+    def post_message(self, text: str) -> None:
+        self.put(OutboxItem("send_message", {"text": text, "disable_web_page_preview": True}))
+
+    def post_edit_message(self, message_id: str, text: str) -> None:
+        self.put(OutboxItem("edit_message_text", {"message_id": message_id, "text": text}))
+
+    def post_photo(self, photo: Union[bytes, Any], filename: Optional[str] = None) -> None:
+        self.put(OutboxItem("send_photo", {"photo": photo, "filename": filename}))
+
+    def put(self, item: Optional[OutboxItem]) -> None:
+        assert self.loop is not None and self.queue is not None, "The outbox is not opened"
+        try:
+            in_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self.put_nowait(item)
+        else:
+            self.loop.call_soon_threadsafe(self.put_nowait, item)
+
+    def put_nowait(self, item: Optional[OutboxItem]) -> None:
+        assert self.queue is not None
+        self.queue.put_nowait(item)
+        if item is not None:
+            self.stats.queued += 1
+            self.stats.max_queue_size = max(self.stats.max_queue_size, self.queue.qsize())
+
+    async def run_async(self) -> None:
+        assert self.queue is not None
+        # an item taken from the queue while collecting a burst of photos, None is a stop request
+        pending: list[Optional[OutboxItem]] = []
+        while True:
+            item = pending.pop() if pending else await self.queue.get()
+            if item is None:
+                break
+
+            if item.method != "send_photo":
+                await self.send(item)
+                continue
+
+            # a burst of photos (e.g. several donates in a row) is coalesced to media groups
+            photos = [item]
+            deadline = time.monotonic() + self.media_group_delay
+            while len(photos) < MAX_MEDIA_GROUP_SIZE:
+                try:
+                    next_item = await asyncio.wait_for(self.queue.get(), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    break
+                if next_item is None or next_item.method != "send_photo":
+                    pending.append(next_item)
+                    break
+                photos.append(next_item)
+
+            if len(photos) == 1:
+                await self.send(photos[0])
+            else:
+                media = [InputMediaPhoto(photo.kwargs["photo"], filename=photo.kwargs["filename"]) for photo in photos]
+                await self.send(OutboxItem("send_media_group", {"media": media}))
+                self.stats.media_groups += 1
+
+        logger.info("Telegram outbox stopped! {}".format(self.stats))
+
+    async def send(self, item: OutboxItem) -> None:
+        loop = asyncio.get_running_loop()
+        backoff = 1.0
+        for attempt in range(1, self.max_attempts + 1):
+            self.stats.rate_limit_wait_time += await self.rate_limiter.acquire_async()
+            try:
+                start_time = time.monotonic()
+                await loop.run_in_executor(
+                    None, functools.partial(getattr(self.bot, item.method), chat_id=self.chat_id, **item.kwargs))
+                elapsed = time.monotonic() - start_time
+                self.stats.send_time_by_method[item.method] = \
+                    self.stats.send_time_by_method.get(item.method, 0.0) + elapsed
+                self.stats.sent += 1
+                return
+            except RetryAfter as e:
+                logger.warning("Flood limit exceeded, retry after {} s ({})".format(e.retry_after, item.method))
+                wait_time = float(e.retry_after)
+            except (BadRequest, Unauthorized) as e:
+                # BadRequest is a NetworkError, but the same request would fail again
+                logger.error("Failed to send {}: {}".format(item.method, e))
+                break
+            except NetworkError as e:
+                # includes TimedOut
+                logger.warning("Network error: {}, retry after {} s ({})".format(e, backoff, item.method))
+                wait_time = backoff
+                backoff = min(2 * backoff, self.max_backoff)
+            except TelegramError as e:
+                logger.error("Failed to send {}: {}".format(item.method, e))
+                break
+
+            if attempt < self.max_attempts:
+                self.stats.retries += 1
+                await asyncio.sleep(wait_time)
+
+        self.stats.failed += 1
+        logger.error("{} dropped after {} attempts".format(item.method, attempt))
@@ -0,0 +1,121 @@
+import json
+import mmap
+import zlib
+import struct
+from pathlib import Path
+from typing import Any, Iterator, Optional, Sequence
+
+import numpy as np
+
+from arthas.utils.donates_detector_utils import donate_roi_from_y, donate_roi_to_y, motion_masks_margin  # type: ignore
+
+# Container of one detection triplet:
+#   MAGIC | u32 header length | JSON header | 3 zlib-compressed chunks
+# Only the donate ROI of the frames is stored (with a margin that keeps motion masks exact), the first frame as is
+# and the second and the third ones as uint8 wraparound deltas to the first one (static pixels become zeros).
+# Each chunk is additionally filtered with a horizontal difference (like PNG "Sub" filter) before compression.
+MAGIC = b"ARTHAS_TRIPLET1\n"
+EXTENSION = ".trp"
+HEADER_LENGTH = struct.Struct("<I")
+
+
+def triplet_roi_rows(height: int) -> tuple[int, int]:
+    return donate_roi_from_y, min(height, donate_roi_to_y + motion_masks_margin)
+
+
+def sub_filter(img: np.ndarray) -> np.ndarray:
+    filtered = img.copy()
+    np.subtract(img[:, 1:], img[:, :-1], out=filtered[:, 1:], dtype=np.uint8)
+    return filtered
+
+
+def sub_unfilter(filtered: np.ndarray) -> np.ndarray:
+    return np.cumsum(filtered, axis=1, dtype=np.uint8)
+
+
+def encode_triplet(frames: Sequence[np.ndarray], metadata: Optional[dict[str, Any]] = None, level: int = 6) -> bytes:
+    assert len(frames) == 3
+    from_y, to_y = triplet_roi_rows(frames[0].shape[0])
+    rois = [np.ascontiguousarray(frame[from_y:to_y]) for frame in frames]
+
+    planes = [rois[0], np.subtract(rois[1], rois[0], dtype=np.uint8), np.subtract(rois[2], rois[0], dtype=np.uint8)]
+    chunks = [zlib.compress(sub_filter(plane).tobytes(), level) for plane in planes]
+    header = json.dumps({
+        "frame_shape": list(frames[0].shape),
+        "roi_rows": [from_y, to_y],
+        "chunks_sizes": [len(chunk) for chunk in chunks],
+        "metadata": metadata or {},
+    }).encode("utf-8")
+
+    return b"".join([MAGIC, HEADER_LENGTH.pack(len(header)), header] + chunks)
+
+
+class ArchivedTriplet:
+    # Memory-mapped triplet: the header is parsed on open, frames are decompressed only on request
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a triplet archive: {}".format(path))
+        offset = len(MAGIC)
+        header_length, = HEADER_LENGTH.unpack_from(self.mmap, offset)
+        offset += HEADER_LENGTH.size
+        header = json.loads(self.mmap[offset:offset + header_length].decode("utf-8"))
+        offset += header_length
+
+        self.frame_shape: tuple[int, ...] = tuple(header["frame_shape"])
+        self.roi_rows: tuple[int, int] = tuple(header["roi_rows"])
+        self.metadata: dict[str, Any] = header["metadata"]
+        self.chunks_offsets = []
+        for size in header["chunks_sizes"]:
+            self.chunks_offsets.append((offset, offset + size))
+            offset += size
+
+        self._first_frame: Optional[np.ndarray] = None
+
+    @property
+    def roi_shape(self) -> tuple[int, ...]:
+        return (self.roi_rows[1] - self.roi_rows[0],) + self.frame_shape[1:]
+
+    def decode_chunk(self, i: int) -> np.ndarray:
+        from_offset, to_offset = self.chunks_offsets[i]
+        raw = zlib.decompress(self.mmap[from_offset:to_offset])
+        return sub_unfilter(np.frombuffer(raw, dtype=np.uint8).reshape(self.roi_shape))
+
+    def frame(self, i: int) -> np.ndarray:
+        # ROI of the i-th frame (rows roi_rows of the original frame)
+        if self._first_frame is None:
+            self._first_frame = self.decode_chunk(0)
+        if i == 0:
+            return self._first_frame
+        frame: np.ndarray = np.add(self._first_frame, self.decode_chunk(i), dtype=np.uint8)
+        return frame
+
+    def frames(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self.frame(0), self.frame(1), self.frame(2)
+
+    def close(self) -> None:
+        self.mmap.close()
+
+
+class TripletsArchive:
+    # Random access to a directory with triplets, files are opened only when accessed
+    def __init__(self, dirpath: Path):
+        self.dirpath = dirpath
+        self.paths = sorted(dirpath.rglob("*" + EXTENSION))
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, i: int) -> ArchivedTriplet:
+        return ArchivedTriplet(self.paths[i])
+
+    def __iter__(self) -> Iterator[ArchivedTriplet]:
+        for path in self.paths:
+            triplet = ArchivedTriplet(path)
+            try:
+                yield triplet
+            finally:
+                triplet.close()
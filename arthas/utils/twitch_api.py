@@ -2,18 +2,24 @@ import logging
 from http import HTTPStatus
 from typing import Optional, Any, Protocol
 
-import requests
-
-from arthas.utils.timeout_watcher import TimeoutWatcher
+from arthas.utils.http_client import HttpClient
+from arthas.utils.persistent_cache import PersistentCache
+from arthas.utils.rate_limiter import Priority, get_rate_limiter, key_alias
 
 logger = logging.getLogger("API")
 
 
+# about one query per 1.1 seconds, shared by all clients with the same Client-ID
+QUERIES_PER_SECOND = 1 / 1.1
+
+
 class API(Protocol):
     def get_user_id(self, username: str) -> str: ...
 
     def get_user_stream(self, user_id: str) -> Optional[dict[str, str]]: ...
 
+    def get_users_streams(self, user_ids: list[str]) -> dict[str, Optional[dict[str, str]]]: ...
+
     # def get_game_info(self, game_id: str) -> dict[str, str]: ...
 
     # def get_clip(self, clipname: str) -> dict[str, str]: ...
@@ -26,38 +32,43 @@ class API(Protocol):
 class TwitchAPI:
     API_URL = "https://api.twitch.tv/helix"
     API_URL_V5 = "https://api.twitch.tv/kraken"
+    MAX_IDS_PER_QUERY = 100
 
-    def __init__(self, client_id: str, oauth_key: str):
+    def __init__(self, client_id: str, oauth_key: str, http: Optional[HttpClient] = None):
         self.client_id = client_id
         self.oauth_key = oauth_key
 
-        self.timeout = TimeoutWatcher()
+        self.rate_limiter = get_rate_limiter("twitch/{}".format(key_alias(client_id)), QUERIES_PER_SECOND)
+        # both Helix and v5 requests go to api.twitch.tv, so they share the pool, headers are set per request
+        self.http = http or HttpClient(headers={'Client-ID': self.client_id})
 
-        self.cache_get_user_id: dict[str, dict[str, str]] = {}
-        self.cache_get_game: dict[str, dict[str, str]] = {}
+        # users and games are kept between restarts, empty results are not cached
+        self.cache_get_user_id = PersistentCache("twitch_users_cache.json")
+        self.cache_get_game = PersistentCache("twitch_games_cache.json", max_size=1024)
 
     def get_user_id(self, username: str) -> str:
         # https://dev.twitch.tv/docs/api/reference#get-users
-        if username in self.cache_get_user_id:
-            user_data = self.cache_get_user_id[username]
-        else:
+        user_data = self.cache_get_user_id.get(username)
+        if user_data is None:
             logger.debug("Searching for user with login={}...".format(username))
             user_data = self.query('users', login=username)
-            self.cache_get_user_id[username] = user_data
+            if user_data:
+                self.cache_get_user_id.put(username, user_data)
 
         if not user_data:
             raise KeyError("No user with login={} found!".format(username))
 
-        logger.info("User with login={} has id={}.".format(username, user_data['id']))
-        return user_data['id']
+        user_id = str(user_data['id'])
+        logger.info("User with login={} has id={}.".format(username, user_id))
+        return user_id
 
     def get_game_info(self, game_id: str) -> dict[str, str]:
         # https://dev.twitch.tv/docs/api/reference#get-games
-        if game_id in self.cache_get_game:
-            game_data = self.cache_get_game[game_id]
-        else:
+        game_data = self.cache_get_game.get(game_id)
+        if game_data is None:
             game_data = self.query('games', id=game_id)
-            self.cache_get_game[game_id] = game_data
+            if game_data:
+                self.cache_get_game.put(game_id, game_data)
 
         if not game_data:
             logger.warning("No game with id={} found!".format(game_id))
@@ -67,11 +78,34 @@ class TwitchAPI:
 
     def get_user_stream(self, user_id: str) -> Optional[dict[str, str]]:
         # https://dev.twitch.tv/docs/api/reference#get-streams
-        stream_data = self.query('streams', user_id=user_id)
+        stream_data = self.query('streams', priority=Priority.StreamState, user_id=user_id)
 
         if not stream_data:
             return None
 
+        return self.stream_from_data(stream_data)
+
+    def get_users_streams(self, user_ids: list[str]) -> dict[str, Optional[dict[str, str]]]:
+        # Streams of several users with one request per MAX_IDS_PER_QUERY users (user_id is repeated in the query)
+        streams: dict[str, Optional[dict[str, str]]] = {user_id: None for user_id in user_ids}
+        for i in range(0, len(user_ids), self.MAX_IDS_PER_QUERY):
+            chunk = user_ids[i:i + self.MAX_IDS_PER_QUERY]
+            url = self.API_URL + '/streams?' + "&".join("user_id={}".format(user_id) for user_id in chunk) + \
+                "&first={}".format(len(chunk))
+            self.rate_limiter.acquire(priority=Priority.StreamState)
+            data = self.http.get(url, endpoint='helix/streams',
+                                 headers={'Authorization': f'Bearer {self.oauth_key[6:]}'}).json()
+
+            if 'status' in data and data['status'] == HTTPStatus.TOO_MANY_REQUESTS:
+                logger.error(data)
+                raise RuntimeError(data['error'])
+
+            for stream_data in data.get('data', []):
+                streams[stream_data['user_id']] = self.stream_from_data(stream_data)
+        return streams
+
+    @staticmethod
+    def stream_from_data(stream_data: dict[str, Any]) -> dict[str, str]:
         return {
             'stream_id': stream_data['id'],
             'title': stream_data['title'],
@@ -113,16 +147,15 @@ class TwitchAPI:
                 'created_at': last_post['created_at'],
                 'body': last_post['body']}
 
-    def query(self, method: str, single_data: bool = True, **values: str) -> Any:
+    def query(self, method: str, single_data: bool = True, priority: Priority = Priority.Normal, **values: str) -> Any:
         url = self.API_URL + '/' + method
 
         if len(values) > 0:
             url += "?" + ",".join(["{}={}".format(key, value) for key, value in values.items()])
 
-        web = requests.Session()
-        web.headers.update({'Client-ID': self.client_id, 'Authorization': f'Bearer {self.oauth_key[6:]}'})
-        self.timeout.ensure_timeout()
-        data = web.get(url).json()
+        self.rate_limiter.acquire(priority=priority)
+        data = self.http.get(url, endpoint=f'helix/{method}',
+                             headers={'Authorization': f'Bearer {self.oauth_key[6:]}'}).json()
 
         if not single_data:
             return data
@@ -149,11 +182,9 @@ class TwitchAPI:
         if len(values) > 0:
             url += "?" + "&".join(["{}={}".format(key, value) for key, value in values.items()])
 
-        web = requests.Session()
-        web.headers.update({'Client-ID': self.client_id,
-                            'Accept': "application/vnd.twitchtv.v5+json"})
-        self.timeout.ensure_timeout()
-        data = web.get(url).json()
+        self.rate_limiter.acquire()
+        data = self.http.get(url, endpoint=f'kraken/{method}',
+                             headers={'Accept': "application/vnd.twitchtv.v5+json"}).json()
 
         if 'status' in data:
             if data['status'] == HTTPStatus.TOO_MANY_REQUESTS:
@@ -1,6 +1,11 @@
+import re
+import time
 import socket
+import asyncio
 import logging
 import threading
+from collections import deque
+from dataclasses import dataclass
 
 from abc import ABC
 from typing import Optional, Callable
@@ -9,6 +14,7 @@ logger = logging.getLogger("IRC monitor")
 
 
 OnMessageCallback = Callable[[str, str], None]
+OnChatMessageCallback = Callable[["ChatMessage"], None]
 
 
 class ChatMonitor(ABC):
@@ -22,24 +28,120 @@ class ChatMonitor(ABC):
         pass
 
 
+# Twitch pings about every 5 minutes, silence for longer means a dead connection
+READ_TIMEOUT = 6 * 60
+READ_SIZE = 1 << 16
+MAX_RECONNECT_DELAY = 60.0
+# a connection that worked for this time resets the reconnect delay
+STABLE_CONNECTION_TIME = 60.0
+
+TAG_ESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+
+def unescape_tag_value(value: str) -> str:
+    # https://ircv3.net/specs/extensions/message-tags#escaping-values
+    if "\\" not in value:
+        return value
+    result = []
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char == "\\" and i + 1 < len(value):
+            i += 1
+            result.append(TAG_ESCAPES.get(value[i], value[i]))
+        elif char != "\\":
+            result.append(char)
+        i += 1
+    return "".join(result)
+
+
+def parse_tags(raw_tags: str) -> dict[str, str]:
+    tags = {}
+    for tag in raw_tags.split(";"):
+        key, _, value = tag.partition("=")
+        tags[key] = unescape_tag_value(value)
+    return tags
+
+
+@dataclass
+class ChatMessage:
+    username: str
+    message: str
+    # IRCv3 tags as sent (e.g. "badges=...;color=#FF0000;display-name=..."), parsed only on demand
+    raw_tags: str = ""
+
+    @property
+    def tags(self) -> dict[str, str]:
+        return parse_tags(self.raw_tags) if self.raw_tags else {}
+
+
+@dataclass
+class IRCStats:
+    bytes: int = 0
+    lines: int = 0
+    messages: int = 0
+    unexpected: int = 0
+    pings: int = 0
+    reconnects: int = 0
+
+
+class LineBuffer:
+    # Splits received bytes into lines: a whole chunk is split and decoded at once, only an incomplete last line
+    # is kept for the next chunk (a multibyte character can't be split by \r\n, so decoding whole lines is safe)
+    def __init__(self) -> None:
+        self.rest = b""
+
+    def feed(self, data: bytes) -> list[str]:
+        data = self.rest + data if self.rest else data
+        complete, separator, self.rest = data.rpartition(b"\r\n")
+        if not separator:
+            return []
+        return complete.decode("utf-8", errors="replace").split("\r\n")
+
+
 # See https://dev.twitch.tv/docs/irc
 class IRCTwitchMonitor(ChatMonitor):
-    def __init__(self, nickname: str, oauth_key: str, channel: str, host: str, port: int = 6667):
+    def __init__(
+        self,
+        nickname: str,
+        oauth_key: str,
+        channel: str,
+        host: str,
+        port: int = 6667,
+        use_event_loop: bool = False,
+        request_tags: bool = False,
+    ):
         self.nickname = nickname
         self.oauth_key = oauth_key
         self.channel = channel
         self.host = host
         self.port = port
+        # with tags every message carries display name, badges, emotes, etc. in ChatMessage.raw_tags
+        self.request_tags = request_tags
 
         self.socket: Optional[socket.socket] = None
         self.stopped = False
 
-        self.buffer = b''
-        self.lines: list[str] = []
+        self.line_buffer = LineBuffer()
+        self.lines: deque[str] = deque()
+        self.stats = IRCStats()
+
+        # :<user>!<user>@<user>.tmi.twitch.tv PRIVMSG #<channel> :<message>, optionally prefixed by @<tags>
+        self.privmsg_pattern = re.compile(
+            r"(?:@(?P<tags>\S*) )?:(?P<user>[^!\s]+)!(?P=user)@(?P=user)\.tmi\.twitch\.tv PRIVMSG #{} :(?P<message>.*)"
+            .format(re.escape(channel)), re.DOTALL
+        )
+        # only the server command, a chat message can't match it
+        self.reconnect_pattern = re.compile(r"(?:@\S* )?:tmi\.twitch\.tv RECONNECT")
+        self.reconnect_requested = False
 
         self.messages_callbacks: list[OnMessageCallback] = []
+        self.chat_messages_callbacks: list[OnChatMessageCallback] = []
 
-        self.connect()
+        # with use_event_loop the connection is made by run_async on the loop
+        self.writer: Optional[asyncio.StreamWriter] = None
+        if not use_event_loop:
+            self.connect()
 
     def connect(self) -> None:
         self.socket = socket.socket()
@@ -47,10 +149,7 @@ class IRCTwitchMonitor(ChatMonitor):
         self.socket.connect((self.host, self.port))
         logger.info("Socket connected!")
 
-        logger.info("Authorizing...")
-        self.send("PASS " + self.oauth_key)
-        self.send("NICK " + self.nickname)
-        self.send("JOIN #" + self.channel)
+        self.authorize()
 
         while True:
             line = self.next_line()
@@ -62,19 +161,25 @@ class IRCTwitchMonitor(ChatMonitor):
 
         logger.info("Authorized!")
 
+    def authorize(self) -> None:
+        logger.info("Authorizing...")
+        if self.request_tags:
+            self.send("CAP REQ :twitch.tv/tags twitch.tv/commands")
+        self.send("PASS " + self.oauth_key)
+        self.send("NICK " + self.nickname)
+        self.send("JOIN #" + self.channel)
+
     def next_line(self) -> str:
         while len(self.lines) == 0:
             assert self.socket, 'Socket is not initialized. Probably `connect()` method was not called'
-            self.buffer = self.buffer + self.socket.recv(1024)
-            if len(self.buffer) == 0:
+            data = self.socket.recv(READ_SIZE)
+            if len(data) == 0:
                 logger.error("Empty buffer!")
                 raise ConnectionAbortedError("Empty buffer!")
-            lines_bytes = self.buffer.split("\r\n".encode("utf-8"))
-            self.buffer = lines_bytes.pop()
+            self.stats.bytes += len(data)
+            self.lines.extend(self.line_buffer.feed(data))
 
-            self.lines = [line_bytes.decode("utf-8") for line_bytes in lines_bytes]
-
-        return self.lines.pop(0)
+        return self.lines.popleft()
 
     def start(self) -> threading.Thread:
         thread = threading.Thread(target=self.run_loop, name="IRC monitor")
@@ -86,60 +191,116 @@ class IRCTwitchMonitor(ChatMonitor):
 
     def run_loop(self) -> None:
         while not self.stopped:
-            line = self.next_line()
-
-            if line == "PING :tmi.twitch.tv":
-                self.send("PONG :tmi.twitch.tv")
-                continue
-
-            user_message = self.parse_message(line)
-            if user_message is not None:
-                username, message = user_message
+            self.on_line(self.next_line())
 
-                for callback in self.messages_callbacks:
-                    callback(username, message)
-                continue
+    async def run_async(self) -> None:
+        # The same as connect() and run_loop() as a coroutine: the connection is reopened with a growing delay
+        # when it's lost, silent for READ_TIMEOUT or Twitch asks to reconnect. Stopped by cancelling the task.
+        reconnect_delay = 1.0
+        while not self.stopped:
+            connected_time = time.monotonic()
+            requested = False
+            try:
+                await self.serve_connection()
+                requested = True
+            except (OSError, EOFError, asyncio.TimeoutError) as e:
+                logger.error("Connection lost: {}".format(str(e) or type(e).__name__))
+            if self.stopped:
+                break
 
-            logger.warning("Unexpected message: {}".format(line))
+            stable = time.monotonic() - connected_time >= STABLE_CONNECTION_TIME
+            if stable:
+                reconnect_delay = 1.0
+            # a requested reconnect is made at once, unless the server keeps requesting it
+            if not (requested and stable):
+                logger.info("Reconnecting in {} s...".format(reconnect_delay))
+                await asyncio.sleep(reconnect_delay)
+                reconnect_delay = min(2 * reconnect_delay, MAX_RECONNECT_DELAY)
+            self.stats.reconnects += 1
+
+    async def serve_connection(self) -> None:
+        logger.info("Connecting socket...")
+        reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        logger.info("Socket connected!")
+        line_buffer = LineBuffer()
+        self.reconnect_requested = False
+        try:
+            self.authorize()
+            await self.writer.drain()
+
+            authorized = False
+            while not self.stopped:
+                data = await asyncio.wait_for(reader.read(READ_SIZE), READ_TIMEOUT)
+                if not data:
+                    raise EOFError("Connection closed by the server")
+                self.stats.bytes += len(data)
+
+                for line in line_buffer.feed(data):
+                    if authorized:
+                        self.on_line(line)
+                        if self.reconnect_requested:
+                            return
+                        continue
+                    logger.debug(line)
+                    if "End of /NAMES list" in line:
+                        logger.info("Authorized!")
+                        authorized = True
+
+                # PONGs are buffered by send()
+                await self.writer.drain()
+        finally:
+            self.writer.close()
+            self.writer = None
+
+    def on_line(self, line: str) -> None:
+        self.stats.lines += 1
+        chat_message = self.parse_chat_message(line)
+        if chat_message is not None:
+            self.stats.messages += 1
+            for callback in self.messages_callbacks:
+                callback(chat_message.username, chat_message.message)
+            for chat_callback in self.chat_messages_callbacks:
+                chat_callback(chat_message)
+            return
+
+        if line.startswith("PING "):
+            self.stats.pings += 1
+            self.send("PONG " + line[5:])
+            return
+
+        if self.reconnect_pattern.fullmatch(line):
+            # handled by run_async, the socket path of run_loop waits for the server to close the connection
+            logger.info("Reconnect requested by the server")
+            self.reconnect_requested = True
+            return
+
+        self.stats.unexpected += 1
+        logger.warning("Unexpected message: {}".format(line))
 
     def add_message_callback(self, callback: OnMessageCallback) -> None:
         self.messages_callbacks.append(callback)
 
-    def parse_message(self, line: str) -> Optional[tuple[str, str]]:
-        # Expected format:
-        # :<user>!<user>@<user>.tmi.twitch.tv
-        parts = line.split('.tmi.twitch.tv PRIVMSG #{} :'.format(self.channel), 1)
-        if len(parts) != 2:
-            return None
-        raw_username, message = parts
+    def add_chat_message_callback(self, callback: OnChatMessageCallback) -> None:
+        # like add_message_callback, but with the tags of the message
+        self.chat_messages_callbacks.append(callback)
 
-        username = self.parse_username(raw_username)
-        if not username:
+    def parse_chat_message(self, line: str) -> Optional[ChatMessage]:
+        match = self.privmsg_pattern.fullmatch(line)
+        if match is None:
             return None
+        return ChatMessage(match.group("user"), match.group("message"), match.group("tags") or "")
 
-        return username, message
-
-    def parse_username(self, username_part: str) -> Optional[str]:
-        # Username part format:
-        # :<user>!<user>@<user>
-        if not username_part.startswith(":"):
-            return None
-        username_part = username_part[1:]
-
-        parts1_23 = username_part.split("!")
-        if len(parts1_23) != 2:
-            return None
-
-        parts23 = parts1_23[1].split("@")
-        if len(parts23) != 2:
-            return None
-
-        if parts1_23[0] != parts23[0] or parts23[0] != parts23[1]:
+    def parse_message(self, line: str) -> Optional[tuple[str, str]]:
+        chat_message = self.parse_chat_message(line)
+        if chat_message is None:
             return None
-
-        return parts1_23[0]
+        return chat_message.username, chat_message.message
 
     def send(self, content: str) -> None:
+        if self.writer is not None:
+            # buffered, flushed by run_async
+            self.writer.write((content + "\r\n").encode("utf-8"))
+            return
         assert self.socket, 'Socket is not initialized. Probably `connect()` method was not called'
         self.socket.send((content + "\r\n").encode("utf-8"))
 
@@ -1,4 +1,3 @@
-import time
 import logging
 from dataclasses import dataclass
 from typing import Callable, Optional, Protocol
@@ -6,6 +5,8 @@ from typing import Callable, Optional, Protocol
 import threading
 
 from arthas.utils.file_storage import FileStorage
+from arthas.utils.polling_scheduler import PollingScheduler
+from arthas.utils.storage_journal import StorageJournal
 from arthas.utils.streamer_monitor import StartedCallback, TitleChangedCallback, GameChangedCallback, StoppedCallback, \
     NewPostCallback, StatusChangedCallback
 from arthas.utils.twitch_api import API
@@ -33,13 +34,21 @@ class ChannelState:
 
 
 class StreamerMonitor:
-    def __init__(self, username: str, api: API):
+    def __init__(
+        self,
+        username: str,
+        api: API,
+        journal: Optional[StorageJournal] = None,
+        state_suffix: str = "",
+        scheduler: Optional[PollingScheduler] = None,
+    ):
         self.api = api
 
         self.username = username
         self.user_id: Optional[str] = None
 
         self.stopped = False
+        self.stop_event = threading.Event()
 
         self.start_callbacks: list[StartedCallback] = []
         self.title_changed_callbacks: list[TitleChangedCallback] = []
@@ -48,16 +57,21 @@ class StreamerMonitor:
         self.new_post_callbacks: list[NewPostCallback] = []
         self.channel_status_callbacks: list[StatusChangedCallback] = []
 
-        self.streamer_state: FileStorage[StreamerState] = FileStorage("streamer_state.json", dirpath="state")
+        self.streamer_state: FileStorage[StreamerState] = FileStorage(f"streamer_state{state_suffix}.json",
+                                                                      dirpath="state", journal=journal)
         self.streamer_state.load(StreamerState)
 
-        self.last_post_state: FileStorage[LastPostState] = FileStorage("last_post.json", dirpath="state")
+        self.last_post_state: FileStorage[LastPostState] = FileStorage(f"last_post{state_suffix}.json",
+                                                                       dirpath="state", journal=journal)
         self.last_post_state.load(LastPostState)
 
-        self.channel_state: FileStorage[ChannelState] = FileStorage("channel_state.json", dirpath="state")
+        self.channel_state: FileStorage[ChannelState] = FileStorage(f"channel_state{state_suffix}.json",
+                                                                    dirpath="state", journal=journal)
         self.channel_state.load(ChannelState)
 
-        self.monitor_timeout = 20.0
+        # Helix has no daily quota, only a per-minute rate limit, so the interval depends only on the history
+        self.scheduler = scheduler or PollingScheduler(
+            "twitch_polling_state.json", journal=journal, min_interval=10.0, running_interval=20.0, max_interval=300.0)
 
         ad_kw_prefixes = ["http://", "https://", "goo.gl"]
         self.ad_separators = [" " + kw for kw in ad_kw_prefixes] + [" [" + kw for kw in ad_kw_prefixes]
@@ -69,8 +83,9 @@ class StreamerMonitor:
 
     def stop(self) -> None:
         self.stopped = True
+        self.stop_event.set()
 
-    def run_loop(self) -> None:
+    def init_user(self) -> None:
         self.user_id = self.api.get_user_id(self.username)
         # self.ensure_timeout(query_following=False)  # TODO: idk
 
@@ -82,51 +97,62 @@ class StreamerMonitor:
                 logger.info("Stated initialized with None!")
                 self.streamer_state.value = None
 
+    def run_loop(self) -> None:
+        self.init_user()
+        assert self.user_id is not None
+
         while not self.stopped:
-            changed = False
             try:
-                changed = False
-                raw_current_state = self.api.get_user_stream(self.user_id)
-
-                if raw_current_state is None:
-                    if self.streamer_state.value is not None:
-                        changed = True
-                        self.notify_stream_stopped()
-                    current_state = None
-                    continue
-
-                stream_id = raw_current_state["stream_id"]
-                current_state = StreamerState(
-                    user_id=self.user_id,
-                    title=self.remove_ad(raw_current_state["title"]),
-                    game_id=raw_current_state["game_id"]
-                )
-
-                if self.streamer_state.value is None:
-                    changed = True
-                    # game_name = self.api.get_game_info(current_state.game_id)['name']
-                    game_name = ''  # TODO: idk, wheather there is such an API for youtube
-                    self.notify_stream_started(current_state.title, game_name, stream_id)
-                    continue
-
-                if current_state.title != self.streamer_state.value.title:
-                    changed = True
-                    self.notify_title_changed(current_state.title)
-
-                if current_state.game_id != self.streamer_state.value.game_id:
-                    changed = True
-                    # game_name = self.api.get_game_info(current_state.game_id)['name']
-                    game_name = ''  # TODO: idk, wheather there is such an API for youtube
-                    self.notify_game_changed(game_name)
+                self.update(self.api.get_user_stream(self.user_id))
             except Exception as e:
                 logger.error(e)
                 raise e
             finally:
-                if changed:
-                    self.streamer_state.value = current_state
-                    self.streamer_state.save()
+                self.stop_event.wait(self.scheduler.next_interval(self.streamer_state.value is not None, 0))
+
+        self.scheduler.save()
 
-                time.sleep(self.monitor_timeout)
+    def update(self, raw_current_state: Optional[dict[str, str]]) -> None:
+        # raw_current_state is the current stream of the user from the API (None if there is no stream)
+        assert self.user_id is not None
+
+        changed = False
+        current_state: Optional[StreamerState] = None
+        try:
+            if raw_current_state is None:
+                if self.streamer_state.value is not None:
+                    changed = True
+                    self.notify_stream_stopped()
+                return
+
+            stream_id = raw_current_state["stream_id"]
+            current_state = StreamerState(
+                user_id=self.user_id,
+                title=self.remove_ad(raw_current_state["title"]),
+                game_id=raw_current_state["game_id"]
+            )
+
+            if self.streamer_state.value is None:
+                changed = True
+                # game_name = self.api.get_game_info(current_state.game_id)['name']
+                game_name = ''  # TODO: idk, wheather there is such an API for youtube
+                self.scheduler.record_stream_start()
+                self.notify_stream_started(current_state.title, game_name, stream_id)
+                return
+
+            if current_state.title != self.streamer_state.value.title:
+                changed = True
+                self.notify_title_changed(current_state.title)
+
+            if current_state.game_id != self.streamer_state.value.game_id:
+                changed = True
+                # game_name = self.api.get_game_info(current_state.game_id)['name']
+                game_name = ''  # TODO: idk, wheather there is such an API for youtube
+                self.notify_game_changed(game_name)
+        finally:
+            if changed:
+                self.streamer_state.value = current_state
+                self.streamer_state.save()
 
     def remove_ad(self, status: str) -> str:
         for ad_separator in self.ad_separators:
@@ -1,11 +1,14 @@
+from collections import OrderedDict
+import dataclasses
 from dataclasses import dataclass
 from enum import Enum, auto, unique
-from typing import Any
+from typing import Any, Optional
 
-import requests
 import xmltodict
 
-from arthas.utils.timeout_watcher import TimeoutWatcher
+from arthas.utils.http_client import HttpClient
+from arthas.utils.persistent_cache import PersistentCache
+from arthas.utils.rate_limiter import Priority, get_rate_limiter, key_alias
 
 
 @dataclass
@@ -29,25 +32,53 @@ class VideoInfo:
     status: VideoStatus
 
 
+# statuses that never change again, such videos are not queried anymore
+FINAL_VIDEO_STATUSES = (VideoStatus.Ended, VideoStatus.NotStream)
+# about one query per 1.1 seconds, shared by all clients with the same key
+QUERIES_PER_SECOND = 1 / 1.1
+
+
 class YoutubeAPI:
     API_URL = "https://www.googleapis.com/youtube/v3"
     FEED_URL = 'https://www.youtube.com/feeds/videos.xml?channel_id={channel_id}'
     MAX_RESULTS = 10
-
-    def __init__(self, client_key: str):
+    MAX_VIDEO_IDS_PER_QUERY = 50
+    VIDEO_INFOS_CACHE_SIZE = 1024
+
+    def __init__(
+        self,
+        client_key: str,
+        http: Optional[HttpClient] = None,
+        users_cache: Optional[PersistentCache] = None,
+    ):
         self.client_key = client_key
-        self.timeout = TimeoutWatcher()
+        self.rate_limiter = get_rate_limiter("youtube/{}".format(key_alias(client_key)), QUERIES_PER_SECOND)
+        # API_URL and FEED_URL can be overridden on the instance to query a local stub server
+        self.http = http or HttpClient()
+        # channels don't change their ids and upload playlists, so they are resolved once and kept between restarts
+        self.users_cache = users_cache or PersistentCache("youtube_users_cache.json")
+        # all used list methods cost 1 unit of the daily quota, the feed is free
+        self.quota_units_used = 0
+
+        # video id -> info with a final status, a scheduled or live video is queried on every poll to see it change
+        self.video_infos_cache: OrderedDict[str, VideoInfo] = OrderedDict()
 
     def get_user(self, username: str) -> YoutubeUser:
+        cached_user = self.users_cache.get(username)
+        if cached_user is not None:
+            return YoutubeUser(**cached_user)
+
         found_result = self.query('channels', part='id,contentDetails', forUsername=username)
         if found_result is None:
             # Assume that channel does not have a separate username thus username is the same as channel_id
             found_result = self.query('channels', part='id,contentDetails', id=username)
 
-        return YoutubeUser(
+        user = YoutubeUser(
             id=found_result['id'],
             video_playlist_id=found_result['contentDetails']['relatedPlaylists']['uploads']
         )
+        self.users_cache.put(username, dataclasses.asdict(user))
+        return user
 
     def get_last_video_id(self, playlist_id: str) -> str:
         return self.get_video_ids(playlist_id)[0]
@@ -63,20 +94,53 @@ class YoutubeAPI:
         return [item['contentDetails']['videoId'] for item in found_result]
 
     def get_video_id_from_feed(self, channel_id: str) -> str:
-        with requests.Session() as web:
-            response = web.get(self.FEED_URL.format(channel_id=channel_id))
-            data = xmltodict.parse(response.text)
-            video_id = data['feed']['entry'][0]['yt:videoId']
-            assert isinstance(video_id, str)
-            return video_id
+        return self.get_video_ids_from_feed(channel_id)[0]
+
+    def get_video_ids_from_feed(self, channel_id: str) -> list[str]:
+        # latest videos of the channel (about 15) including upcoming and live streams, doesn't spend the quota
+        response = self.http.get(self.FEED_URL.format(channel_id=channel_id), endpoint="youtube/feed",
+                                 conditional=True)
+        data = xmltodict.parse(response.text, force_list=('entry',))
+        video_ids = [entry['yt:videoId'] for entry in data['feed'].get('entry', [])]
+        assert all(isinstance(video_id, str) for video_id in video_ids)
+        return video_ids
 
     def get_video_info(self, video_id: str) -> VideoInfo:
         return self.get_video_infos([video_id])[0]
 
     def get_video_infos(self, video_ids: list[str]) -> list[VideoInfo]:
+        # Only videos without a cached final info are queried, e.g. ended streams and uploads never again
+        cached_infos: dict[str, VideoInfo] = {}
+        for video_id in video_ids:
+            cached = self.video_infos_cache.get(video_id)
+            if cached is not None:
+                cached_infos[video_id] = cached
+                self.video_infos_cache.move_to_end(video_id)
+
+        # one query per MAX_VIDEO_IDS_PER_QUERY ids (the limit of the videos method)
+        missing_ids = list(dict.fromkeys(video_id for video_id in video_ids if video_id not in cached_infos))
+        for i in range(0, len(missing_ids), self.MAX_VIDEO_IDS_PER_QUERY):
+            for video_info in self.query_video_infos(missing_ids[i:i + self.MAX_VIDEO_IDS_PER_QUERY]):
+                cached_infos[video_info.id] = video_info
+                self.cache_video_info(video_info)
+
+        return [cached_infos[video_id] for video_id in dict.fromkeys(video_ids) if video_id in cached_infos]
+
+    def cache_video_info(self, video_info: VideoInfo) -> None:
+        if video_info.status not in FINAL_VIDEO_STATUSES:
+            return
+        self.video_infos_cache[video_info.id] = video_info
+        self.video_infos_cache.move_to_end(video_info.id)
+        while len(self.video_infos_cache) > self.VIDEO_INFOS_CACHE_SIZE:
+            self.video_infos_cache.popitem(last=False)
+
+    def query_video_infos(self, video_ids: list[str]) -> list[VideoInfo]:
         found_results = self.query(
-            'videos', part='snippet,liveStreamingDetails', id=','.join(video_ids), single_data=False
+            'videos', part='snippet,liveStreamingDetails', id=','.join(video_ids), single_data=False,
+            priority=Priority.StreamState
         )
+        if found_results is None:
+            return []
 
         video_infos = []
 
@@ -100,23 +164,23 @@ class YoutubeAPI:
         return video_infos
 
 
-    def query(self, method: str, single_data: bool = True, **kwargs: Any) -> Any:
+    def query(self, method: str, single_data: bool = True, priority: Priority = Priority.Normal, **kwargs: Any) -> Any:
         url = f'{self.API_URL}/{method}'
 
         kwargs['key'] = self.client_key
         if len(kwargs) > 0:
             url += "?" + "&".join(["{}={}".format(key, value) for key, value in kwargs.items()])
 
-        with requests.Session() as web:
-            self.timeout.ensure_timeout()
-            data = web.get(url).json()
+        self.rate_limiter.acquire(priority=priority)
+        self.quota_units_used += 1
+        data = self.http.get(url, endpoint=f'youtube/{method}', conditional=True).json()
 
-            items = data.get('items', None)
+        items = data.get('items', None)
 
-            if items is None:
-                return None
+        if items is None:
+            return None
 
-            if single_data:
-                return items[0] if len(items) else None
-            else:
-                return items
+        if single_data:
+            return items[0] if len(items) else None
+        else:
+            return items
@@ -1,4 +1,4 @@
-import time
+import asyncio
 import logging
 from dataclasses import dataclass
 from enum import unique, Enum, auto
@@ -7,10 +7,12 @@ from typing import Optional
 import threading
 
 from arthas.utils.file_storage import FileStorage
+from arthas.utils.polling_scheduler import PollingScheduler
+from arthas.utils.storage_journal import StorageJournal
 from arthas.utils.streamer_monitor import StartedCallback, TitleChangedCallback, GameChangedCallback, StoppedCallback, \
-    NewPostCallback, StatusChangedCallback
+    NewPostCallback, StatusChangedCallback, ResumedCallback
 from arthas.utils.twitch_stream_monitor import LastPostState
-from arthas.utils.youtube_api import YoutubeAPI, VideoStatus
+from arthas.utils.youtube_api import YoutubeAPI, VideoInfo, VideoStatus
 
 logger = logging.getLogger("Stream monitor")
 
@@ -33,25 +35,40 @@ class StreamerState:
 
 
 class YoutubeStreamerMonitor:
-    def __init__(self, username: str, api: YoutubeAPI):
+    def __init__(
+        self,
+        username: str,
+        api: YoutubeAPI,
+        journal: Optional[StorageJournal] = None,
+        daily_quota_units: Optional[int] = 10000,
+        state_suffix: str = "",
+        scheduler: Optional[PollingScheduler] = None,
+    ):
         self.api = api
 
         self.username = username
         self.user_id: Optional[str] = None
 
         self.stopped = False
+        self.stop_event = threading.Event()
 
         self.start_callbacks: list[StartedCallback] = []
+        self.resume_callbacks: list[ResumedCallback] = []
         self.title_changed_callbacks: list[TitleChangedCallback] = []
         self.game_changed_callbacks: list[GameChangedCallback] = []
         self.stop_callbacks: list[StoppedCallback] = []
         self.new_post_callbacks: list[NewPostCallback] = []
         self.channel_status_callbacks: list[StatusChangedCallback] = []
 
-        self.streamer_state: FileStorage[StreamerState] = FileStorage("streamer_state.json", dirpath="state")
+        self.streamer_state: FileStorage[StreamerState] = FileStorage(f"streamer_state{state_suffix}.json",
+                                                                      dirpath="state", journal=journal)
         self.streamer_state.load(StreamerState)
+        # a stream running before the restart is resumed by the first successful check of its video
+        self.resume_pending = False
 
-        self.monitor_timeout = 60.0
+        # polls more often when a stream is likely to start and keeps within the daily API quota
+        # (several channels monitored together share one scheduler, see multi_channel_monitor)
+        self.scheduler = scheduler or PollingScheduler(journal=journal, daily_quota_units=daily_quota_units)
 
         ad_kw_prefixes = ["http://", "https://", "goo.gl"]
         self.ad_separators = [" " + kw for kw in ad_kw_prefixes] + [" [" + kw for kw in ad_kw_prefixes]
@@ -64,12 +81,57 @@ class YoutubeStreamerMonitor:
 
     def stop(self) -> None:
         self.stopped = True
+        self.stop_event.set()
 
     def check_if_stream_continues(self) -> None:
         assert self.streamer_state.value is not None
         assert self.streamer_state.value.video_id is not None
 
-        video_status = self.api.get_video_info(self.streamer_state.value.video_id)
+        self.update(self.api.get_video_infos([self.streamer_state.value.video_id]))
+
+    def check_if_stream_started(self) -> None:
+        self.update_waiting_stream(self.api.get_video_infos(self.candidate_video_ids()))
+
+    def candidate_video_ids(self, use_playlist: bool = True) -> list[str]:
+        # Videos whose status is checked on the next poll: the running stream or the latest videos of the channel.
+        # The feed is free in terms of the quota and lists upcoming streams too, the playlist costs a quota unit.
+        assert self.streamer_state.value is not None
+        if self.streamer_state.value.video_id is not None:
+            return [self.streamer_state.value.video_id]
+
+        if use_playlist:
+            return (
+                self.api.get_video_ids(self.streamer_state.value.playlist_id) +
+                [self.api.get_video_id_from_feed(self.streamer_state.value.user_id)]
+            )
+        return self.api.get_video_ids_from_feed(self.streamer_state.value.user_id)
+
+    def fetch_video_infos(self) -> list[VideoInfo]:
+        # the network part of a poll, its results are applied by update()
+        return self.api.get_video_infos(self.candidate_video_ids())
+
+    def update(self, video_statuses: list[VideoInfo]) -> None:
+        # video_statuses of candidate_video_ids()
+        assert self.streamer_state.value is not None
+        video_id = self.streamer_state.value.video_id
+        if video_id is not None:
+            running_statuses = [video_status for video_status in video_statuses if video_status.id == video_id]
+            if running_statuses:
+                self.update_running_stream(running_statuses[0])
+            else:
+                # a deleted (or made private) video isn't returned anymore, so its stream is over
+                logger.warning("Running video {} is not found, the stream is considered ended".format(video_id))
+                self.update_running_stream(VideoInfo(video_id, self.streamer_state.value.title, VideoStatus.Ended))
+        else:
+            self.update_waiting_stream(video_statuses)
+
+    def update_running_stream(self, video_status: VideoInfo) -> None:
+        assert self.streamer_state.value is not None
+
+        if self.resume_pending:
+            # the check at the restart failed
+            self.resume(video_status)
+            return
 
         assert \
             video_status.status not in [VideoStatus.NotStream, VideoStatus.Scheduled], \
@@ -84,33 +146,83 @@ class YoutubeStreamerMonitor:
             self.streamer_state.save()
             self.notify_title_changed(video_status.title)
 
-    def check_if_stream_started(self) -> None:
+    def update_waiting_stream(self, video_statuses: list[VideoInfo]) -> None:
         assert self.streamer_state.value is not None
         assert self.streamer_state.value.video_id is None
 
-        video_ids = (
-            self.api.get_video_ids(self.streamer_state.value.playlist_id) +
-            [self.api.get_video_id_from_feed(self.streamer_state.value.user_id)]
-        )
-        video_statuses = self.api.get_video_infos(video_ids)
-
         for video_status in video_statuses:
             if video_status.status == VideoStatus.Started:
                 self.streamer_state.value.video_id = video_status.id
                 self.streamer_state.value.title = video_status.title
+                # saved, so the stream is resumed if the bot is restarted
+                self.streamer_state.save()
+                self.scheduler.record_stream_start()
                 self.notify_stream_started(video_status.title, '', video_status.id)
                 return
 
-    def run_loop(self) -> None:
+        self.scheduler.set_scheduled_video_known(
+            any(video_status.status == VideoStatus.Scheduled for video_status in video_statuses))
+
+    def init_state(self) -> None:
+        # The saved state of the channel is reused (a running video_id is resumed), the user is queried only
+        # if there is no state for this channel yet
+        saved_state = self.streamer_state.value
+        if saved_state is not None and saved_state.user_id == self.username:
+            logger.info("Streamer state restored: {}".format(saved_state))
+            self.resume_pending = saved_state.video_id is not None
+            return
+
         user = self.api.get_user(self.username)
+        if saved_state is not None and saved_state.user_id == user.id:
+            # the channel has a username different from its id
+            logger.info("Streamer state restored: {}".format(saved_state))
+            self.resume_pending = saved_state.video_id is not None
+            return
 
         self.streamer_state.value = StreamerState(
             user.id, user.video_playlist_id, '', None
         )
 
+    def resume_stream(self) -> None:
+        assert self.streamer_state.value is not None
+        if self.streamer_state.value.video_id is not None:
+            self.resume(self.api.get_video_info(self.streamer_state.value.video_id))
+
+    def resume(self, video_status: VideoInfo) -> None:
+        # video_status of the video_id saved in the state
+        assert self.streamer_state.value is not None
+        assert self.streamer_state.value.video_id == video_status.id
+        self.resume_pending = False
+
+        if video_status.status == VideoStatus.Started:
+            logger.info("Stream is still running! video_id={}".format(video_status.id))
+            for callback in self.resume_callbacks:
+                callback(video_status.id, video_status.title)
+            if video_status.title != self.streamer_state.value.title:
+                self.streamer_state.value.title = video_status.title
+                self.streamer_state.save()
+                self.notify_title_changed(video_status.title)
+        else:
+            logger.info("Stream has been stopped while the bot wasn't running")
+            self.streamer_state.value.video_id = None
+            self.streamer_state.save()
+            self.notify_stream_stopped()
+
+    def is_stream_running(self) -> bool:
+        return self.streamer_state.value is not None and self.streamer_state.value.is_stream_running()
+
+    def run_loop(self) -> None:
+        self.init_state()
+
         assert self.streamer_state.value is not None
 
+        try:
+            self.resume_stream()
+        except Exception as e:
+            logger.error(e)
+
         while not self.stopped:
+            quota_units_used = self.api.quota_units_used
             try:
                 if self.streamer_state.value.video_id is not None:
                     self.check_if_stream_continues()
@@ -120,7 +232,43 @@ class YoutubeStreamerMonitor:
                 logger.error(e)
                 # raise e
             finally:
-                time.sleep(self.monitor_timeout)
+                units_per_poll = self.api.quota_units_used - quota_units_used
+                self.scheduler.spend_quota(units_per_poll)
+                self.stop_event.wait(self.scheduler.next_interval(self.is_stream_running(), max(1, units_per_poll)))
+
+        self.scheduler.save()
+
+    async def run_async(self) -> None:
+        # The same loop as a coroutine: requests are made in the default executor, while the state is updated and
+        # callbacks are called on the event loop. Stopped by stop() or by cancelling the task.
+        # The state is saved by the background saver thread, so the loop doesn't wait for fsync or journal commits.
+        self.streamer_state.background_saves = True
+        self.scheduler.state.background_saves = True
+        await asyncio.to_thread(self.init_state)
+
+        assert self.streamer_state.value is not None
+
+        try:
+            video_id = self.streamer_state.value.video_id
+            if video_id is not None:
+                self.resume(await asyncio.to_thread(self.api.get_video_info, video_id))
+        except Exception as e:
+            logger.error(e)
+
+        try:
+            while not self.stopped:
+                quota_units_used = self.api.quota_units_used
+                try:
+                    self.update(await asyncio.to_thread(self.fetch_video_infos))
+                except Exception as e:
+                    logger.error(e)
+                finally:
+                    units_per_poll = self.api.quota_units_used - quota_units_used
+                    self.scheduler.spend_quota(units_per_poll)
+                interval = self.scheduler.next_interval(self.is_stream_running(), max(1, units_per_poll))
+                await asyncio.sleep(interval)
+        finally:
+            self.scheduler.save()
 
     def remove_ad(self, status: str) -> str:
         for ad_separator in self.ad_separators:
@@ -167,6 +315,9 @@ class YoutubeStreamerMonitor:
     def add_start_callback(self, callback: StartedCallback) -> None:
         self.start_callbacks.append(callback)
 
+    def add_resume_callback(self, callback: ResumedCallback) -> None:
+        self.resume_callbacks.append(callback)
+
     def add_title_changed_callback(self, callback: TitleChangedCallback) -> None:
         self.title_changed_callbacks.append(callback)
 
@@ -1,4 +1,29 @@
+from typing import Sequence
+
 import numpy as np
 
+__version__: str
+
+COLOR_BGR2HSV: int
+INTER_AREA: int
+LINE_AA: int
+FONT_HERSHEY_DUPLEX: int
+IMWRITE_JPEG_QUALITY: int
+IMWRITE_PNG_COMPRESSION: int
+IMWRITE_WEBP_QUALITY: int
+
 
-def imwrite(filename: str, img: np.ndarray) -> None: ...
\ No newline at end of file
+def imwrite(filename: str, img: np.ndarray) -> None: ...
+def imread(filename: str) -> np.ndarray: ...
+def imencode(ext: str, img: np.ndarray, params: Sequence[int] = ...) -> tuple[bool, np.ndarray]: ...
+def cvtColor(src: np.ndarray, code: int) -> np.ndarray: ...
+def resize(src: np.ndarray, dsize: tuple[int, int], interpolation: int = ...) -> np.ndarray: ...
+def addWeighted(src1: np.ndarray, alpha: float, src2: np.ndarray, beta: float, gamma: float) -> np.ndarray: ...
+def getTextSize(text: str, fontFace: int, fontScale: float, thickness: int) -> tuple[tuple[int, int], int]: ...
+def putText(
+    img: np.ndarray, text: str, org: tuple[int, int], fontFace: int, fontScale: float,
+    color: tuple[int, ...], thickness: int = ..., lineType: int = ...
+) -> np.ndarray: ...
+def rectangle(
+    img: np.ndarray, pt1: tuple[int, int], pt2: tuple[int, int], color: tuple[int, ...], thickness: int = ...
+) -> np.ndarray: ...
@@ -0,0 +1,24 @@
+from pathlib import Path
+
+import numpy as np
+
+from arthas.utils.artefacts_writer import ArtefactsWriter
+
+
+def test_full_queue_never_blocks(tmp_path: Path) -> None:
+    writer = ArtefactsWriter(max_queue_size=2)
+    img = np.zeros((2, 4, 3), dtype=np.uint8)
+
+    # the writer thread isn't started yet, so the queue fills up
+    assert writer.write(str(tmp_path / "a"), img)
+    assert writer.write(str(tmp_path / "b"), img)
+    assert not writer.write(str(tmp_path / "dropped"), img)
+    # e.g. a photo posted from a detection thread is queued over the limit instead of blocking it
+    assert writer.write(str(tmp_path / "photo"), img, drop_if_full=False)
+
+    writer.start()
+    writer.stop()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["a.png", "b.png", "photo.png"]
+    assert (writer.stats.queued, writer.stats.written, writer.stats.dropped, writer.stats.overflowed) == (3, 3, 1, 1)
+    assert writer.stats.max_queue_size == 3
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+pytest.importorskip("requests")
+
+from arthas.utils.arthas_bot import StreamPipeline  # noqa: E402
+from arthas.utils.detection_pool import DetectionPool  # noqa: E402
+
+
+def make_pipeline() -> StreamPipeline:
+    bot = SimpleNamespace(detection_pool=DetectionPool(), telegram_bot=MagicMock())
+    pipeline = StreamPipeline(bot, "arthas", MagicMock())  # type: ignore[arg-type]
+    pipeline.video_tracker = MagicMock(stopped=True)
+    return pipeline
+
+
+def test_tracker_is_reset_by_the_detection_thread() -> None:
+    pipeline = make_pipeline()
+    img = np.zeros((2, 4, 3), dtype=np.uint8)
+
+    pipeline.start_donates_detection("first")
+    pipeline.on_video_screen(img)
+    pipeline.on_video_screen(img)
+    assert pipeline.donates_tracker.frame_index_cur == 2
+
+    pipeline.start_donates_detection("second")
+    # the restart doesn't touch the tracker a worker may be using
+    assert pipeline.donates_tracker.frame_index_cur == 2
+    pipeline.on_video_screen(img)
+    assert pipeline.donates_tracker.frame_index_cur == 1
+
+
+def test_pending_frames_are_dropped_on_restart() -> None:
+    pipeline = make_pipeline()
+    img = np.zeros((2, 4, 3), dtype=np.uint8)
+
+    pipeline.start_donates_detection("first")
+    pipeline.on_video_frame(img)
+    pipeline.start_donates_detection("second")
+
+    assert len(pipeline.detection_stream.frames) == 0
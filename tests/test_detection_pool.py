@@ -0,0 +1,74 @@
+import threading
+
+import numpy as np
+
+from arthas.utils.detection_pool import DetectionPool
+
+
+def frame(index: int) -> np.ndarray:
+    return np.full((1,), index, dtype=np.int32)
+
+
+def test_streams_are_served_round_robin() -> None:
+    pool = DetectionPool(workers_number=1, max_pending_frames=3)
+    processed: list[tuple[str, int]] = []
+    done = threading.Event()
+
+    def handler(name: str, img: np.ndarray) -> None:
+        processed.append((name, int(img[0])))
+        if len(processed) == 5:
+            done.set()
+
+    first = pool.register("first", lambda img: handler("first", img))
+    second = pool.register("second", lambda img: handler("second", img))
+    # frames are queued before the worker starts: the oldest frames of the busy stream are dropped
+    for i in range(5):
+        pool.submit(first, frame(i))
+    for i in range(2):
+        pool.submit(second, frame(i))
+
+    pool.start()
+    assert done.wait(5)
+    pool.stop()
+
+    assert processed == [("first", 2), ("second", 0), ("first", 3), ("second", 1), ("first", 4)]
+    assert (first.stats.submitted, first.stats.processed, first.stats.dropped) == (5, 3, 2)
+    assert (second.stats.submitted, second.stats.processed, second.stats.dropped) == (2, 2, 0)
+
+
+def test_stream_is_processed_by_one_worker_at_a_time() -> None:
+    pool = DetectionPool(workers_number=2, max_pending_frames=8)
+    # the first frames of both streams are processed together, so each stream has its own worker
+    both_running = threading.Barrier(2, timeout=5)
+    lock = threading.Lock()
+    running = {"first": 0, "second": 0}
+    max_running = {"first": 0, "second": 0}
+    processed: dict[str, list[int]] = {"first": [], "second": []}
+    done = threading.Event()
+
+    def handler(name: str, img: np.ndarray) -> None:
+        with lock:
+            running[name] += 1
+            max_running[name] = max(max_running[name], running[name])
+        if int(img[0]) == 0:
+            both_running.wait()
+        with lock:
+            processed[name].append(int(img[0]))
+            running[name] -= 1
+            if len(processed["first"]) + len(processed["second"]) == 12:
+                done.set()
+
+    first = pool.register("first", lambda img: handler("first", img))
+    second = pool.register("second", lambda img: handler("second", img))
+    pool.start()
+    for i in range(6):
+        pool.submit(first, frame(i))
+        pool.submit(second, frame(i))
+    assert done.wait(5)
+    pool.stop()
+
+    assert not both_running.broken
+    assert max_running == {"first": 1, "second": 1}
+    # the tracker of a stream gets its frames in order
+    assert processed == {"first": list(range(6)), "second": list(range(6))}
+    assert first.stats.dropped == second.stats.dropped == 0
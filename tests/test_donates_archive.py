@@ -0,0 +1,30 @@
+from pathlib import Path
+
+import numpy as np
+
+from arthas.utils.donates_archive import DonatesArchive
+from arthas.utils.sqlite_storage import SqliteStore
+
+
+def test_donates_are_indexed_by_content(tmp_path: Path) -> None:
+    store = SqliteStore(str(tmp_path / "state.sqlite3"))
+    archive = DonatesArchive(store, str(tmp_path / "donates"))
+    img = np.full((4, 8, 3), 7, dtype=np.uint8)
+
+    first = archive.create("1", img, "video", 1500, 45, (1.0, 5.0, 0.0, 3.0))
+    second = archive.create("2", img.copy(), "video", 3000, 90, (1.0, 5.0, 0.0, 3.0))
+    other = archive.create("3", img + 1, None, 2000, 60, (0.0, 8.0, 0.0, 4.0))
+    # nothing is committed until the donates are added
+    assert archive.find() == []
+
+    assert archive.add(first)
+    assert not archive.add(second)
+    assert archive.add(other)
+
+    assert first.path == second.path != other.path
+    assert archive.get("2") == second
+    assert archive.get("4") is None
+    assert [donate.donate_id for donate in archive.find()] == ["1", "3", "2"]
+    assert [donate.donate_id for donate in archive.find("video", from_timestamp_ms=2000)] == ["2"]
+    assert archive.videos_ids() == ["video"]
+    assert store.execute("DELETE FROM donates WHERE video_id IS NULL") == 1
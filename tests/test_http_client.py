@@ -0,0 +1,119 @@
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Optional
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from arthas.utils.http_client import HttpClient  # noqa: E402
+
+
+class Handler(BaseHTTPRequestHandler):
+    # keep-alive needs HTTP/1.1 and a Content-Length in every response
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        server: StubServer = self.server  # type: ignore[assignment]
+        with server.lock:
+            server.client_ports.append(self.client_address[1])
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+
+        if self.path == "/feed":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.reply(304, b"")
+            else:
+                self.reply(200, b"feed", {"ETag": '"v1"'})
+        elif self.path == "/flaky":
+            # fails once, the retry gets the data
+            self.reply(503 if hits == 1 else 200, b"flaky")
+        elif self.path == "/slow":
+            time.sleep(0.5)
+            self.reply(200, b"slow")
+        else:
+            self.reply(404, b"")
+
+    def reply(self, status: int, body: bytes, headers: Optional[dict[str, str]] = None) -> None:
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.lock = threading.Lock()
+        self.client_ports: list[int] = []
+        self.hits: dict[str, int] = {}
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+
+@pytest.fixture
+def server() -> Iterator[StubServer]:
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_connection_is_reused_and_not_modified_is_revalidated(server: StubServer) -> None:
+    client = HttpClient()
+
+    first = client.get(server.url + "/feed", endpoint="feed", conditional=True)
+    second = client.get(server.url + "/feed", endpoint="feed", conditional=True)
+
+    assert first.text == "feed"
+    # 304 returns the cached response
+    assert second is first
+    assert server.hits["/feed"] == 2
+    # both requests were made on one keep-alive connection
+    assert len(set(server.client_ports)) == 1
+
+    summary = client.stats_summary()["feed"]
+    assert summary["requests"] == 2
+    assert summary["not_modified"] == 1
+    assert summary["errors"] == 0
+    client.close()
+
+
+def test_error_status_is_retried(server: StubServer) -> None:
+    client = HttpClient(backoff_factor=0.0)
+
+    response = client.get(server.url + "/flaky")
+
+    assert response.status_code == 200
+    assert server.hits["/flaky"] == 2
+    # the retries are made inside one get and counted as one request
+    summary = client.stats_summary()[server.url + "/flaky"]
+    assert summary["requests"] == 1
+    assert summary["errors"] == 0
+    client.close()
+
+
+def test_read_timeout_is_counted_as_error(server: StubServer) -> None:
+    client = HttpClient(timeout=(1.0, 0.1), max_retries=0)
+
+    with pytest.raises(requests.RequestException):
+        client.get(server.url + "/slow", endpoint="slow")
+
+    summary = client.stats_summary()["slow"]
+    assert summary["requests"] == 1
+    assert summary["errors"] == 1
+    assert summary["max"] < 0.5
+    client.close()
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import pytest
+
+from arthas.utils.persistent_cache import PersistentCache
+
+
+@pytest.fixture
+def now(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    monkeypatch.chdir(tmp_path)
+    current_time = [1000.0]
+    monkeypatch.setattr("arthas.utils.persistent_cache.time.time", lambda: current_time[0])
+    return current_time
+
+
+def test_entries_expire_after_ttl(now: list[float]) -> None:
+    cache = PersistentCache("cache.json", ttl=60)
+    cache.put("user", {"id": "1"})
+
+    now[0] += 59
+    assert cache.get("user") == {"id": "1"}
+    now[0] += 2
+    assert cache.get("user") is None
+
+    # the expired entry is deleted from the file too
+    assert PersistentCache("cache.json", ttl=60).storage.value == {}
+
+
+def test_least_recently_used_entries_are_evicted(now: list[float]) -> None:
+    cache = PersistentCache("cache.json", max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+    # the order of use is kept between restarts
+    assert cache.get("a") == 1
+    restarted = PersistentCache("cache.json", max_size=2)
+    restarted.put("d", 4)
+    assert (restarted.get("a"), restarted.get("c"), restarted.get("d")) == (1, None, 4)
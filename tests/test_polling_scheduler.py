@@ -0,0 +1,80 @@
+import datetime
+from pathlib import Path
+
+import pytest
+
+from arthas.utils.polling_scheduler import PollingScheduler, QUOTA_TIMEZONE
+
+
+def pacific_time(day: int, hour: int, minute: int = 0) -> float:
+    return datetime.datetime(2024, 6, day, hour, minute, tzinfo=QUOTA_TIMEZONE).timestamp()
+
+
+@pytest.fixture
+def scheduler(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> PollingScheduler:
+    monkeypatch.chdir(tmp_path)
+    return PollingScheduler(daily_quota_units=10000)
+
+
+def test_next_interval(scheduler: PollingScheduler) -> None:
+    current_time = pacific_time(1, 12)
+    # an idle poll backs off up to max_interval
+    intervals = [scheduler.next_interval(False, 0, current_time) for _ in range(12)]
+    assert intervals[:3] == [15.0, 22.5, 33.75]
+    assert intervals[-1] == 600.0
+
+    assert scheduler.next_interval(True, 0, current_time) == 60.0
+
+    # a known scheduled video resets the backoff
+    scheduler.set_scheduled_video_known(True)
+    assert scheduler.next_interval(False, 0, current_time) == 15.0
+    scheduler.set_scheduled_video_known(False)
+    assert scheduler.next_interval(False, 0, current_time) == 15.0
+    assert scheduler.next_interval(False, 0, current_time) == 22.5
+
+    # the rest of the quota is spent evenly until the reset: 100 units per poll, 12 hours left
+    assert scheduler.next_interval(True, 100, current_time) == pytest.approx(12 * 3600 * 100 / 10000)
+
+
+def test_quota_interval(scheduler: PollingScheduler) -> None:
+    current_time = pacific_time(1, 23)
+    assert scheduler.quota_interval(current_time, 0) == 0.0
+    assert scheduler.quota_interval(current_time, 1) == pytest.approx(3600 / 10000)
+
+    scheduler.spend_quota(9000, current_time)
+    assert scheduler.quota_interval(current_time, 1) == pytest.approx(3600 / 1000)
+    # exhausted: the next poll is after the reset
+    scheduler.spend_quota(999, current_time)
+    assert scheduler.quota_interval(current_time, 2) == pytest.approx(3600)
+
+
+def test_quota_is_reset_at_pacific_midnight(scheduler: PollingScheduler) -> None:
+    assert scheduler.state.value is not None
+    before_midnight = pacific_time(1, 23, 59)
+    after_midnight = pacific_time(2, 0, 1)
+
+    scheduler.spend_quota(9990, before_midnight)
+    assert scheduler.state.value.quota_day == "2024-06-01"
+    # the units of the previous day don't count anymore
+    assert scheduler.quota_interval(after_midnight, 1) == pytest.approx((24 * 60 - 1) * 60 / 10000)
+
+    scheduler.spend_quota(5, after_midnight)
+    assert (scheduler.state.value.quota_day, scheduler.state.value.quota_used) == ("2024-06-02", 5)
+    assert scheduler.quota_day(after_midnight) != scheduler.quota_day(before_midnight)
+
+
+def test_is_likely_start_time(scheduler: PollingScheduler) -> None:
+    assert not scheduler.is_likely_start_time(pacific_time(1, 20))
+
+    scheduler.record_stream_start(pacific_time(1, 20))
+    scheduler.record_stream_start(pacific_time(2, 23, 50))
+    # only the time of day is compared
+    assert scheduler.is_likely_start_time(pacific_time(5, 20, 30))
+    assert scheduler.is_likely_start_time(pacific_time(5, 19, 15))
+    assert not scheduler.is_likely_start_time(pacific_time(5, 21))
+    # the window wraps around midnight
+    assert scheduler.is_likely_start_time(pacific_time(6, 0, 20))
+    assert not scheduler.is_likely_start_time(pacific_time(6, 1))
+
+    # polls often near a usual start time
+    assert scheduler.next_interval(False, 0, pacific_time(5, 20, 10)) == 15.0
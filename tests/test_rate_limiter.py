@@ -0,0 +1,34 @@
+import asyncio
+
+from arthas.utils.rate_limiter import RateLimiter, Priority, get_rate_limiter, key_alias
+
+
+def test_only_sleeping_acquires_are_counted_as_waited() -> None:
+    limiter = RateLimiter("test", rate=20.0, capacity=2.0)
+
+    waits = [limiter.acquire() for _ in range(3)]
+
+    # the burst is taken without sleeping, the third token is refilled in about 50 ms
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] > 0.0
+    assert limiter.stats_summary()[Priority.Normal.name]["acquired"] == 3
+    assert limiter.stats_summary()[Priority.Normal.name]["waited"] == 1
+
+
+def test_async_acquire_stats() -> None:
+    limiter = RateLimiter("test", rate=20.0, capacity=1.0)
+
+    async def acquire_twice() -> list[float]:
+        return [await limiter.acquire_async(priority=Priority.StreamState) for _ in range(2)]
+
+    waits = asyncio.run(acquire_twice())
+
+    assert waits[0] == 0.0 and waits[1] > 0.0
+    assert limiter.stats_summary()[Priority.StreamState.name]["waited"] == 1
+
+
+def test_limiter_name_hides_the_key() -> None:
+    limiter = get_rate_limiter("youtube/{}".format(key_alias("AIzaSecretKey")), 1.0)
+
+    assert "AIzaSecretKey" not in limiter.name
+    assert limiter is get_rate_limiter("youtube/{}".format(key_alias("AIzaSecretKey")), 1.0)
@@ -0,0 +1,34 @@
+from pathlib import Path
+
+import pytest
+
+from arthas.utils.sqlite_storage import SqliteStore, SqliteStorage, SqliteStorageView
+
+
+def test_view_keeps_evicted_entries(tmp_path: Path) -> None:
+    store = SqliteStore(str(tmp_path / "state.sqlite3"))
+    view: SqliteStorageView[dict] = SqliteStorageView(store, "clips", max_cached=2)
+
+    for key in ["a", "b", "c"]:
+        storage: SqliteStorage[dict] = SqliteStorage(store, "clips", key, video_id="video")
+        storage.value = {"key": key}
+        view[key] = storage
+
+    # "a" was evicted from the cache, but it was saved on assignment
+    assert list(view.cached) == ["b", "c"]
+    assert "a" in view
+    assert view["a"].value == {"key": "a"}
+    assert sorted(view) == ["a", "b", "c"]
+    assert len(view) == 3
+
+    del view["b"]
+    assert "b" not in view
+    assert len(view) == 2
+    with pytest.raises(KeyError):
+        del view["b"]
+
+    # assigning None deletes the entry
+    view["c"] = SqliteStorage(store, "clips", "c")
+    assert "c" not in view
+    assert list(view) == ["a"]
+    store.close()
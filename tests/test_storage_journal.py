@@ -0,0 +1,67 @@
+import json
+import time
+import threading
+from pathlib import Path
+
+from arthas.utils.storage_journal import StorageJournal
+
+
+def test_sequential_writes_share_commits(tmp_path: Path) -> None:
+    journal = StorageJournal(str(tmp_path), commit_delay=0.1)
+    for i in range(100):
+        journal.write(str(tmp_path / "state{}.json".format(i % 3)), {"i": i})
+        time.sleep(0.002)
+    # committed within commit_delay without stop()
+    time.sleep(0.3)
+    log_records = (tmp_path / "journal.log").read_text().splitlines()
+    journal.stop()
+
+    assert len(log_records) == 100
+    # the burst of about 0.3 s is committed with a few fsyncs instead of 100,
+    # stop() adds the compaction: 3 files, their directory, the new log and its directory
+    assert journal.stats.commits <= 10
+    assert journal.stats.fsyncs == journal.stats.commits + 6
+    assert [json.loads((tmp_path / "state{}.json".format(k)).read_text()) for k in range(3)] == \
+        [{"i": 99}, {"i": 97}, {"i": 98}]
+
+
+def test_concurrent_writes_share_commits(tmp_path: Path) -> None:
+    journal = StorageJournal(str(tmp_path), commit_delay=0.1)
+
+    def write(k: int) -> None:
+        for i in range(25):
+            journal.write(str(tmp_path / "state{}.json".format(k)), {"i": i})
+
+    threads = [threading.Thread(target=write, args=(k,)) for k in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(journal.read(str(tmp_path / "state{}.json".format(k))) == {"i": 24} for k in range(8))
+    journal.stop()
+    assert journal.stats.writes == 200
+    assert journal.stats.commits <= 5
+
+
+def test_values_survive_compaction_and_restart(tmp_path: Path) -> None:
+    journal = StorageJournal(str(tmp_path), commit_delay=0.01, compaction_size=256)
+    for i in range(50):
+        journal.write(str(tmp_path / "state{}.json".format(i % 5)), {"i": i})
+        # readable while being compacted to the files
+        assert journal.read(str(tmp_path / "state{}.json".format(i % 5))) == {"i": i}
+        time.sleep(0.005)
+    journal.write(str(tmp_path / "state0.json"), None)
+    assert journal.stats.compactions > 0
+
+    # the thread is stopped without the final compaction, as after a crash, and the log is replayed
+    with journal.condition:
+        journal.stopped = True
+        journal.condition.notify_all()
+    journal.thread.join()
+    journal.file.close()
+    StorageJournal(str(tmp_path)).stop()
+
+    assert not (tmp_path / "state0.json").exists()
+    assert [json.loads((tmp_path / "state{}.json".format(k)).read_text()) for k in range(1, 5)] == \
+        [{"i": 46}, {"i": 47}, {"i": 48}, {"i": 49}]
@@ -0,0 +1,70 @@
+import sys
+import time
+import threading
+import subprocess
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+
+from arthas.utils import stream_video
+from arthas.utils.stream_video import StreamVideoSnapshots
+
+# writes two small frames and then stays silent like a stalled stream
+FAKE_FFMPEG = "import sys, time\nfor i in range(2):\n    sys.stdout.buffer.write(bytes([i]) * {})\n    sys.stdout.flush()\n" \
+              "time.sleep(30)"
+
+
+@pytest.fixture
+def fake_processes(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(stream_video, "FRAME_WIDTH", 4)
+    monkeypatch.setattr(stream_video, "FRAME_HEIGHT", 2)
+    monkeypatch.setattr(stream_video, "FRAME_SIZE", 4 * 2 * 3)
+    popen = subprocess.Popen
+
+    def fake_popen(command: list[str], **kwargs: Any) -> "subprocess.Popen[bytes]":
+        if command[0] == "streamlink":
+            return popen([sys.executable, "-c", "import time; time.sleep(30)"], **kwargs)
+        return popen([sys.executable, "-c", FAKE_FFMPEG.format(4 * 2 * 3)], **kwargs)
+
+    monkeypatch.setattr(subprocess, "Popen", fake_popen)
+
+
+def test_restarted_reader_thread_exits(fake_processes: None) -> None:
+    video = StreamVideoSnapshots()
+    frames: list[int] = []
+    first_frame_taken = threading.Event()
+    restarted = threading.Event()
+
+    def on_image(img: np.ndarray) -> None:
+        frames.append(int(img[0, 0, 0]))
+        if len(frames) == 1:
+            # the old thread is busy while the video is restarted, so it sees the stop flag already reset
+            first_frame_taken.set()
+            restarted.wait()
+
+    video.add_image_callback(on_image)
+
+    video.start("first")
+    first_thread = video.thread
+    assert first_thread is not None
+    assert first_frame_taken.wait(timeout=5.0)
+
+    video.start("second")
+    second_thread = video.thread
+    restarted.set()
+    first_thread.join(timeout=1.0)
+
+    assert not first_thread.is_alive()
+    assert second_thread is not None and second_thread.is_alive()
+    # the idle new thread sleeps in select() instead of spinning
+    cpu_time = time.process_time()
+    time.sleep(0.5)
+    assert time.process_time() - cpu_time < 0.1
+
+    video.stop()
+    second_thread.join(timeout=1.0)
+    assert not second_thread.is_alive()
+    assert frames[0] == 0 and frames[-2:] == [0, 1]
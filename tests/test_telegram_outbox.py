@@ -0,0 +1,34 @@
+import asyncio
+
+from telegram.error import RetryAfter, TimedOut, BadRequest
+
+from arthas.utils.fake_telegram_bot import FakeBot
+from arthas.utils.rate_limiter import RateLimiter
+from arthas.utils.telegram_outbox import TelegramOutbox
+
+
+async def send_all(bot: FakeBot, texts: list[str]) -> TelegramOutbox:
+    outbox = TelegramOutbox(bot, "chat", max_backoff=0.01)  # type: ignore[arg-type]
+    # the chat rate limit would make the test wait for seconds
+    outbox.rate_limiter = RateLimiter("test", 1000.0, 100.0)
+    outbox.open()
+    for text in texts:
+        outbox.post_message(text)
+    outbox.close()
+    await outbox.run_async()
+    return outbox
+
+
+def test_errors_are_retried_or_dropped() -> None:
+    bot = FakeBot()
+    bot.fail_next(BadRequest("Message text is empty"))
+    bot.fail_next(RetryAfter(0))
+    bot.fail_next(TimedOut())
+
+    outbox = asyncio.run(send_all(bot, ["bad", "retried", "sent"]))
+
+    # RetryAfter and TimedOut are retried, BadRequest drops the item at once
+    assert [request.kwargs["text"] for request in bot.requests] == ["retried", "sent"]
+    assert outbox.stats.retries == 2
+    assert outbox.stats.failed == 1
+    assert outbox.stats.sent == 2
@@ -0,0 +1,64 @@
+import asyncio
+
+from arthas.utils.twitch_irc_monitor import IRCTwitchMonitor, ChatMessage
+
+WELCOME = b":bot.tmi.twitch.tv 366 bot #arthas :End of /NAMES list\r\n"
+
+
+async def serve(lines: list[bytes], run_time: float = 0.3) -> tuple[IRCTwitchMonitor, list[ChatMessage], int]:
+    # every connection gets the same lines after the login, returns the number of connections
+    connections = 0
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        nonlocal connections
+        connections += 1
+        while not (await reader.readline()).startswith(b"JOIN"):
+            pass
+        writer.write(WELCOME + b"".join(line + b"\r\n" for line in lines))
+        await writer.drain()
+        await reader.read()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    monitor = IRCTwitchMonitor("bot", "oauth:test", "arthas", "127.0.0.1", port, use_event_loop=True)
+    messages: list[ChatMessage] = []
+    monitor.add_chat_message_callback(messages.append)
+
+    task = asyncio.create_task(monitor.run_async())
+    await asyncio.sleep(run_time)
+    monitor.stop()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    server.close()
+    return monitor, messages, connections
+
+
+def test_chat_message_ending_with_reconnect_is_delivered() -> None:
+    lines = [b":viewer!viewer@viewer.tmi.twitch.tv PRIVMSG #arthas :please RECONNECT"]
+    monitor, messages, connections = asyncio.run(serve(lines))
+
+    assert [(m.username, m.message) for m in messages] == [("viewer", "please RECONNECT")]
+    assert connections == 1
+    assert monitor.stats.reconnects == 0
+
+
+def test_server_reconnect_is_backed_off() -> None:
+    monitor, messages, connections = asyncio.run(serve([b":tmi.twitch.tv RECONNECT"], run_time=0.5))
+
+    # the first reconnect waits 1 s, so the server can't make the client spin
+    assert connections == 1
+    assert messages == []
+
+
+def test_tags_and_ping() -> None:
+    lines = [
+        "@display-name=Viewer;msg=a\\sb :viewer!viewer@viewer.tmi.twitch.tv PRIVMSG #arthas :привет".encode("utf-8"),
+        b"PING :tmi.twitch.tv",
+    ]
+    monitor, messages, _ = asyncio.run(serve(lines))
+
+    assert len(messages) == 1
+    assert messages[0].message == "привет"
+    assert messages[0].tags == {"display-name": "Viewer", "msg": "a b"}
+    assert monitor.stats.pings == 1
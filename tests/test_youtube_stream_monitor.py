@@ -0,0 +1,106 @@
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("xmltodict")
+
+from arthas.utils.file_storage import FileStorage  # noqa: E402
+from arthas.utils.multi_channel_monitor import MultiChannelYoutubeMonitor  # noqa: E402
+from arthas.utils.youtube_api import VideoInfo, VideoStatus  # noqa: E402
+from arthas.utils.youtube_stream_monitor import StreamerState, YoutubeStreamerMonitor  # noqa: E402
+
+
+class FakeUser:
+    def __init__(self, user_id: str, video_playlist_id: str):
+        self.id = user_id
+        self.video_playlist_id = video_playlist_id
+
+
+class FakeAPI:
+    def __init__(self, infos: list[VideoInfo]):
+        self.infos = {info.id: info for info in infos}
+        self.failing = False
+        self.feeds: dict[str, list[str]] = {}
+        self.quota_units_used = 0
+
+    def get_user(self, username: str) -> "FakeUser":
+        return FakeUser(username, "playlist_" + username)
+
+    def get_video_ids_from_feed(self, channel_id: str) -> list[str]:
+        if channel_id not in self.feeds:
+            raise ConnectionError("Feed of {} is unavailable".format(channel_id))
+        return self.feeds[channel_id]
+
+    def get_video_info(self, video_id: str) -> VideoInfo:
+        return self.get_video_infos([video_id])[0]
+
+    def get_video_infos(self, video_ids: list[str]) -> list[VideoInfo]:
+        if self.failing:
+            raise ConnectionError("Network is unreachable")
+        return [self.infos[video_id] for video_id in video_ids if video_id in self.infos]
+
+
+@pytest.fixture
+def running_state(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # the stream was running when the bot was stopped
+    monkeypatch.chdir(tmp_path)
+    state: FileStorage[StreamerState] = FileStorage("streamer_state.json", dirpath="state")
+    state.value = StreamerState("arthas", "playlist", "old title", "live")
+    state.save()
+
+
+def make_monitor(api: FakeAPI) -> tuple[YoutubeStreamerMonitor, list[str]]:
+    monitor = YoutubeStreamerMonitor("arthas", api)  # type: ignore[arg-type]
+    events: list[str] = []
+    monitor.add_resume_callback(lambda video_id, title: events.append("resumed " + video_id))
+    monitor.add_stop_callback(lambda: events.append("stopped"))
+    monitor.init_state()
+    return monitor, events
+
+
+def test_failed_resume_is_made_by_the_next_poll(running_state: None) -> None:
+    api = FakeAPI([VideoInfo("live", "old title", VideoStatus.Started)])
+    monitor, events = make_monitor(api)
+
+    api.failing = True
+    with pytest.raises(ConnectionError):
+        monitor.resume_stream()
+    assert events == []
+
+    api.failing = False
+    monitor.update(monitor.fetch_video_infos())
+    monitor.update(monitor.fetch_video_infos())
+    assert events == ["resumed live"]
+
+
+def test_missing_running_video_is_ended(running_state: None) -> None:
+    api = FakeAPI([VideoInfo("live", "old title", VideoStatus.Started)])
+    monitor, events = make_monitor(api)
+    monitor.resume_stream()
+
+    # e.g. the video was deleted after the stream
+    del api.infos["live"]
+    monitor.update(monitor.fetch_video_infos())
+    assert events == ["resumed live", "stopped"]
+    assert not monitor.is_stream_running()
+
+
+def test_multi_channel_poll_skips_failing_feeds(running_state: None) -> None:
+    api = FakeAPI([VideoInfo("live", "old title", VideoStatus.Started), VideoInfo("new", "title", VideoStatus.Started)])
+    api.feeds = {"second": ["new"]}
+    multi_monitor = MultiChannelYoutubeMonitor(["arthas", "second", "third"], api)  # type: ignore[arg-type]
+    events: list[str] = []
+    for username, monitor in multi_monitor.monitors.items():
+        monitor.add_start_callback(lambda video_id, title, game, username=username: events.append(username))
+
+    # the state saved by the single channel bot is moved to its channel
+    multi_monitor.init_states()
+    assert multi_monitor.channel("arthas").is_stream_running()
+    assert not Path("state/streamer_state.json").exists()
+    assert Path("state/streamer_state_arthas.json").exists()
+
+    # the feed of "third" fails, "second" is still polled
+    multi_monitor.poll()
+    assert events == ["second"]
+    assert multi_monitor.channel("second").is_stream_running()